@@ -0,0 +1,217 @@
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from models import AnswerSheet, QuestionPart
+
+# 评分说明中的引号短语，兼容中英文引号
+_QUOTED_PHRASE = re.compile(r"['\"‘’“”「」『』]([^'\"‘’“”「」『』]+)['\"‘’“”「」『』]")
+# 评分说明按子句切分
+_CLAUSE_SEPARATOR = re.compile(r"[，,；;。\n]")
+# 无引号时去掉的动词前缀
+_VERB_PREFIX = re.compile(r"^(填写|填|写出|写成|写|答出|答成|答)")
+
+BlankKey = Tuple[int, int, int]  # (题号, 小题号, 空号)
+
+
+def normalize_text(text: str) -> str:
+    """统一全角半角与大小写，用于关键词匹配"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def parse_note(note: Optional[str]) -> Tuple[List[str], List[str]]:
+    """
+    解析评分说明
+
+    例如"填写'双子叶植物'也可得分，填写'种子植物'不得分"
+    解析为 (["双子叶植物"], ["种子植物"])。
+
+    Returns:
+        Tuple[List[str], List[str]]: (也可得分的答案, 不得分的答案)
+    """
+    alternatives: List[str] = []
+    rejected: List[str] = []
+    if not note:
+        return alternatives, rejected
+
+    for clause in _CLAUSE_SEPARATOR.split(note):
+        clause = clause.strip()
+        if "不得分" in clause:
+            target = rejected
+            marker = "不得分"
+        elif "也可得分" in clause:
+            target = alternatives
+            marker = "也可得分"
+        else:
+            continue
+
+        phrases = [phrase.strip() for phrase in _QUOTED_PHRASE.findall(clause)]
+        if not phrases:
+            # 没有引号时取标记前的文字
+            phrase = _VERB_PREFIX.sub("", clause.split(marker)[0].strip()).strip()
+            phrases = [phrase] if phrase else []
+        for phrase in phrases:
+            if phrase and phrase not in target:
+                target.append(phrase)
+    return alternatives, rejected
+
+
+class AhoCorasick:
+    """多模式串匹配自动机，一次扫描找出文本中出现的所有模式串"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[int]] = [set()]
+
+        for pattern in patterns:
+            if pattern and pattern not in self.patterns:
+                self._add(pattern, len(self.patterns))
+                self.patterns.append(pattern)
+        self._build()
+
+    def _add(self, pattern: str, pattern_id: int):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(pattern_id)
+
+    def _build(self):
+        """广度优先计算失配指针"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def find_ids(self, text: str) -> Set[int]:
+        """返回文本中出现的模式串编号"""
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
+
+
+class BlankRule:
+    """单个空的评分规则"""
+
+    def __init__(
+        self,
+        key: BlankKey,
+        accepted: List[str],
+        alternatives: List[str],
+        rejected: List[str],
+        standard_text: str
+    ):
+        self.key = key
+        self.accepted = [normalize_text(keyword) for keyword in accepted]
+        self.alternatives = [normalize_text(keyword) for keyword in alternatives]
+        self.rejected = [normalize_text(keyword) for keyword in rejected]
+        self.standard_text = standard_text
+
+        # 不得分的短语排在前面，便于按编号区分
+        self._matcher = AhoCorasick(self.rejected + self.accepted + self.alternatives)
+        self._rejected_ids = {
+            index for index, pattern in enumerate(self._matcher.patterns)
+            if pattern in self.rejected
+        }
+        self._has_patterns = bool(self._matcher.patterns)
+
+    def matches(self, answer: str) -> bool:
+        """判断答案是否得分：出现不得分的短语即判错，否则出现任一可得分关键词即判对"""
+        if not self._has_patterns:
+            return False
+        found = self._matcher.find_ids(normalize_text(answer))
+        if not found:
+            return False
+        if found & self._rejected_ids:
+            return False
+        return True
+
+    def describe(self) -> Dict:
+        """规则内容，便于加载时检查解析结果"""
+        return {
+            "key": ".".join(str(number) for number in self.key),
+            "accepted": self.accepted,
+            "alternatives": self.alternatives,
+            "rejected": self.rejected,
+            "standard": self.standard_text,
+        }
+
+    def __repr__(self) -> str:
+        return f"BlankRule({self.describe()})"
+
+
+def compile_blank_rule(question_number: int, part: QuestionPart, blank_number: int) -> BlankRule:
+    """编译单个空的评分规则"""
+    key = (question_number, part.number, blank_number)
+    if part.keywords and blank_number <= len(part.keywords):
+        keyword = part.keywords[blank_number - 1]
+        return BlankRule(key, [keyword], [], [], keyword)
+    if part.keyword:
+        alternatives, rejected = parse_note(part.note)
+        standard_text = part.keyword
+        if alternatives:
+            standard_text += f"（或 {alternatives[0]}）"
+        return BlankRule(key, [part.keyword], alternatives, rejected, standard_text)
+    return BlankRule(key, [], [], [], "未知")
+
+
+class CompiledAnswerKey:
+    """把标准答案编译成按(题号, 小题号, 空号)索引的规则表"""
+
+    def __init__(self, answer_sheet: AnswerSheet):
+        self.rules: Dict[BlankKey, BlankRule] = {}
+        self._part_questions: Dict[int, int] = {}
+        for question in answer_sheet.questions:
+            for part in question.parts:
+                self._part_questions[id(part)] = question.number
+                for blank_number in range(1, self.blanks_count(part) + 1):
+                    rule = compile_blank_rule(question.number, part, blank_number)
+                    self.rules[rule.key] = rule
+
+    @staticmethod
+    def blanks_count(part: QuestionPart) -> int:
+        """小题计分的空数"""
+        return len(part.keywords or [1])
+
+    def rule(self, question_number: int, part_number: int, blank_number: int) -> Optional[BlankRule]:
+        return self.rules.get((question_number, part_number, blank_number))
+
+    def rule_for_part(self, part: QuestionPart, blank_number: int) -> BlankRule:
+        """根据小题对象查找规则，不属于本标准答案的小题临时编译"""
+        question_number = self._part_questions.get(id(part))
+        if question_number is not None:
+            rule = self.rules.get((question_number, part.number, blank_number))
+            if rule is not None:
+                return rule
+        return compile_blank_rule(question_number or 0, part, blank_number)
+
+    def expected_blanks(self, question_numbers: Iterable[int]) -> Set[BlankKey]:
+        """指定题目在标准答案中的所有空"""
+        numbers = set(question_numbers)
+        return {key for key in self.rules if key[0] in numbers}
+
+    def describe(self) -> List[Dict]:
+        """所有规则的内容"""
+        return [rule.describe() for rule in self.rules.values()]
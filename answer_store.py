@@ -0,0 +1,372 @@
+"""
+识别结果的列式存储
+
+每个答案一条16字节的定长记录，追加写入answers.bin，可直接用numpy内存映射读取；
+答案内容去重后存在strings.jsonl中，记录里只保存编号；试卷信息与提交的各小题得分在papers.jsonl中。
+自动提交的试卷在提交成功后存储；送复核的试卷先存储为待复核，复核提交后记录复核人员给出的得分。
+标准答案修改后用regrade.py对全部记录重新评分（待复核的试卷除外），只输出得分有变化的试卷。
+"""
+import json
+import os
+import struct
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from config import ANSWER_STORE_DIR, ANSWER_STORE_ENABLED
+from models import AnswerSheet, StudentAnswer
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 答案记录：试卷编号（见papers.jsonl）、题号、小题号、空号、标志位、置信度×255、答案内容编号（见strings.jsonl）
+# 写入只用struct，numpy在读取与重新评分时才导入，阅卷进程不必加载
+RECORD_STRUCT = struct.Struct("<IhhhBBI")
+RECORD_FIELDS = [
+    ("paper", "<u4"),
+    ("question", "<i2"),
+    ("part", "<i2"),
+    ("blank", "<i2"),
+    ("flags", "u1"),
+    ("confidence", "u1"),
+    ("content", "<u4"),
+]
+
+FLAG_CROSSED_OUT = 1
+FLAG_BLURRY = 2
+
+
+class StoredPaper(BaseModel):
+    """已存储的一份试卷"""
+    paper_id: int
+    task_key: str
+    subject_id: Optional[str] = None
+    block_id: Optional[str] = None
+    kaohao: Optional[str] = None
+    scores: Dict[str, int] = {}  # 小题key到得分，即最近一次提交的分数
+    pending_review: bool = False  # 已送人工复核、尚未提交，scores为空
+
+
+class RegradeChange(BaseModel):
+    """重新评分后得分有变化的试卷"""
+    task_key: str
+    kaohao: Optional[str] = None
+    subject_id: Optional[str] = None
+    block_id: Optional[str] = None
+    old_scores: Dict[str, int]
+    new_scores: Dict[str, int]
+
+    @property
+    def api_scores(self) -> List[Dict[str, str]]:
+        return [{"key": key, "score": str(score)} for key, score in self.new_scores.items()]
+
+
+def _int16(value: int) -> int:
+    """超出记录范围的编号（模型返回的异常值）截断到int16"""
+    return min(max(int(value), -0x8000), 0x7FFF)
+
+
+def _open_append(path: str):
+    """以追加方式打开文本文件，上次崩溃留下的残缺行单独成行"""
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    file = open(path, "a", encoding="utf-8")
+    if needs_newline:
+        file.write("\n")
+        file.flush()
+    return file
+
+
+def _read_lines(path: str) -> List[Dict]:
+    """读取JSONL，忽略残缺的行"""
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+class AnswerStore:
+    """
+    识别结果的列式存储，线程安全
+
+    写入顺序为答案内容、答案记录、试卷信息，试卷信息写入后该试卷才算存储完成；
+    中途崩溃留下的答案记录不属于任何已存储的试卷，读取时忽略。
+    同一task_key再次存储时以最后一次为准。
+    """
+
+    def __init__(self, directory: str = ANSWER_STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.answers_path = os.path.join(directory, "answers.bin")
+        self.strings_path = os.path.join(directory, "strings.jsonl")
+        self.papers_path = os.path.join(directory, "papers.jsonl")
+        self._lock = threading.Lock()
+
+        # 答案内容：每行为[编号, 内容]
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        for string_id, content in _read_lines(self.strings_path):
+            if string_id >= len(self._strings):
+                self._strings.extend([""] * (string_id + 1 - len(self._strings)))
+            self._strings[string_id] = content
+            self._string_ids[content] = string_id
+
+        # 答案记录：去掉崩溃时写了一半的记录
+        size = os.path.getsize(self.answers_path) if os.path.exists(self.answers_path) else 0
+        if size % RECORD_STRUCT.size:
+            with open(self.answers_path, "r+b") as f:
+                f.truncate(size - size % RECORD_STRUCT.size)
+        self._rows = size // RECORD_STRUCT.size
+
+        self._papers: Dict[str, StoredPaper] = {}
+        next_id = self._load_papers()
+        if self._rows:
+            # 未登记的试卷也占用编号，避免残留的答案记录被算到新试卷上
+            with open(self.answers_path, "rb") as f:
+                f.seek((self._rows - 1) * RECORD_STRUCT.size)
+                next_id = max(next_id, RECORD_STRUCT.unpack(f.read(RECORD_STRUCT.size))[0] + 1)
+        self._next_id = next_id
+
+        self._answers_file = open(self.answers_path, "ab")
+        self._strings_file = _open_append(self.strings_path)
+        self._papers_file = _open_append(self.papers_path)
+
+    def _load_papers(self) -> int:
+        """读取试卷信息：首行登记试卷，之后的行只更新得分；返回下一个可用的试卷编号"""
+        papers: Dict[str, StoredPaper] = {}
+        papers_by_id: Dict[int, StoredPaper] = {}
+        next_id = 0
+        for record in _read_lines(self.papers_path):
+            paper_id = record["id"]
+            if "task_key" in record:
+                paper = StoredPaper(
+                    paper_id=paper_id,
+                    task_key=record["task_key"],
+                    subject_id=record.get("subject_id"),
+                    block_id=record.get("block_id"),
+                    kaohao=record.get("kaohao"),
+                    scores=record.get("scores", {}),
+                    pending_review=record.get("pending_review", False),
+                )
+                papers_by_id[paper_id] = paper
+                papers[paper.task_key] = paper
+                next_id = max(next_id, paper_id + 1)
+            elif paper_id in papers_by_id:
+                papers_by_id[paper_id].scores = record.get("scores", {})
+                papers_by_id[paper_id].pending_review = False
+        self._papers = papers
+        return next_id
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._papers)
+
+    def record(
+        self,
+        task_key: str,
+        answers: List[StudentAnswer],
+        scores: Dict[str, int],
+        subject_id: Optional[str] = None,
+        block_id: Optional[str] = None,
+        kaohao: Optional[str] = None,
+        pending_review: bool = False
+    ) -> int:
+        """存储一份试卷的识别结果与提交的得分，返回试卷编号；送复核的试卷不记录得分"""
+        with self._lock:
+            paper_id = self._next_id
+            self._next_id += 1
+
+            rows = bytearray()
+            new_strings = []
+            for answer in answers:
+                string_id = self._string_ids.get(answer.content)
+                if string_id is None:
+                    string_id = self._string_ids[answer.content] = len(self._strings)
+                    self._strings.append(answer.content)
+                    new_strings.append(json.dumps([string_id, answer.content], ensure_ascii=False) + "\n")
+                flags = (FLAG_CROSSED_OUT if answer.is_crossed_out else 0) | (FLAG_BLURRY if answer.is_blurry else 0)
+                rows += RECORD_STRUCT.pack(
+                    paper_id,
+                    _int16(answer.question_number),
+                    _int16(answer.part_number),
+                    _int16(answer.blank_number),
+                    flags,
+                    round(min(max(answer.confidence, 0.0), 1.0) * 255),
+                    string_id
+                )
+
+            if new_strings:
+                self._strings_file.write("".join(new_strings))
+                self._strings_file.flush()
+            self._answers_file.write(rows)
+            self._answers_file.flush()
+            self._rows += len(answers)
+
+            paper = StoredPaper(
+                paper_id=paper_id,
+                task_key=task_key,
+                subject_id=subject_id,
+                block_id=block_id,
+                kaohao=kaohao,
+                scores={} if pending_review else scores,
+                pending_review=pending_review,
+            )
+            line = {"id": paper_id, **paper.model_dump(exclude={"paper_id"}, exclude_defaults=True)}
+            self._papers_file.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self._papers_file.flush()
+            self._papers[task_key] = paper
+            return paper_id
+
+    def update_scores(self, task_key: str, scores: Dict[str, int]):
+        """记录复核或重新提交后的得分"""
+        with self._lock:
+            paper = self._papers.get(task_key)
+            if paper is None:
+                # 复核程序与阅卷程序同时运行时，试卷可能是打开存储之后由阅卷程序写入的
+                self._papers_file.flush()
+                self._next_id = max(self._next_id, self._load_papers())
+                paper = self._papers.get(task_key)
+            if paper is None:
+                return
+            paper.scores = dict(scores)
+            paper.pending_review = False
+            self._papers_file.write(
+                json.dumps({"id": paper.paper_id, "scores": paper.scores}, ensure_ascii=False) + "\n"
+            )
+            self._papers_file.flush()
+
+    def columns(self) -> "np.ndarray":
+        """全部答案记录的只读内存映射（含已被覆盖的旧记录），字段见RECORD_FIELDS"""
+        import numpy as np
+
+        dtype = np.dtype(RECORD_FIELDS)
+        with self._lock:
+            rows = self._rows
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.answers_path, dtype=dtype, mode="r", shape=(rows,))
+
+    def papers(self, subject_id: Optional[str] = None, block_id: Optional[str] = None) -> List[StoredPaper]:
+        with self._lock:
+            return [
+                paper for paper in self._papers.values()
+                if (subject_id is None or paper.subject_id == subject_id)
+                and (block_id is None or paper.block_id == block_id)
+            ]
+
+    def answers(self, task_key: str) -> List[StudentAnswer]:
+        """还原一份试卷的识别结果"""
+        with self._lock:
+            paper = self._papers.get(task_key)
+            strings = self._strings
+        if paper is None:
+            return []
+        columns = self.columns()
+        return [
+            StudentAnswer(
+                question_number=int(row["question"]),
+                part_number=int(row["part"]),
+                blank_number=int(row["blank"]),
+                content=strings[int(row["content"])],
+                confidence=int(row["confidence"]) / 255,
+                is_crossed_out=bool(row["flags"] & FLAG_CROSSED_OUT),
+                is_blurry=bool(row["flags"] & FLAG_BLURRY),
+            )
+            for row in columns[columns["paper"] == paper.paper_id]
+        ]
+
+    def regrade(
+        self,
+        standard_answer: AnswerSheet,
+        subject_id: Optional[str] = None,
+        block_id: Optional[str] = None
+    ) -> Tuple[List[RegradeChange], int]:
+        """
+        按新的标准答案重新评分
+
+        只比较存储时提交过的小题，跳过尚未复核的试卷；返回(得分有变化的试卷, 参与评分的试卷数)。
+        """
+        import numpy as np
+
+        from batch_scorer import BatchScorer
+
+        papers = [paper for paper in self.papers(subject_id, block_id) if not paper.pending_review]
+        if not papers:
+            return [], 0
+        with self._lock:
+            strings = list(self._strings)
+            next_id = self._next_id
+        columns = self.columns()
+
+        # 试卷编号到评分矩阵行号，旧记录与其他阅卷块的试卷为-1
+        paper_rows = np.full(next_id, -1, dtype=np.int64)
+        paper_rows[[paper.paper_id for paper in papers]] = np.arange(len(papers))
+        rows = paper_rows[columns["paper"]]
+        live = rows >= 0
+
+        result = BatchScorer(standard_answer).score_columns(
+            [paper.task_key for paper in papers],
+            rows[live],
+            columns["question"][live],
+            columns["part"][live],
+            columns["blank"][live],
+            columns["content"][live],
+            (columns["flags"][live] & FLAG_CROSSED_OUT).astype(bool),
+            strings,
+        )
+
+        part_columns = {
+            f"{question_number}.{part_number}": column
+            for column, (question_number, part_number) in enumerate(result.part_keys)
+        }
+        changes = []
+        for row, paper in enumerate(papers):
+            new_scores = {
+                key: int(result.scores[row, part_columns[key]]) if key in part_columns else 0
+                for key in paper.scores
+            }
+            if new_scores != paper.scores:
+                changes.append(RegradeChange(
+                    task_key=paper.task_key,
+                    kaohao=paper.kaohao,
+                    subject_id=paper.subject_id,
+                    block_id=paper.block_id,
+                    old_scores=paper.scores,
+                    new_scores=new_scores,
+                ))
+        return changes, len(papers)
+
+    def close(self):
+        with self._lock:
+            for file in (self._answers_file, self._strings_file, self._papers_file):
+                file.close()
+
+
+_answer_store: Optional[AnswerStore] = None
+_answer_store_lock = threading.Lock()
+
+
+def get_answer_store() -> Optional[AnswerStore]:
+    """获取进程内共享的识别结果存储，未开启时返回None"""
+    global _answer_store
+    if not ANSWER_STORE_ENABLED:
+        return None
+    with _answer_store_lock:
+        if _answer_store is None:
+            _answer_store = AnswerStore()
+    return _answer_store
+
+
+def api_scores_to_dict(api_scores: List[Dict[str, str]]) -> Dict[str, int]:
+    """提交格式的分数转换为小题key到得分"""
+    return {item["key"]: int(float(item["score"])) for item in api_scores}
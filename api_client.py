@@ -1,7 +1,22 @@
+import random
+import time
 import requests
-from typing import List, Dict, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from typing import List, Dict, Optional, Tuple
 from pydantic import BaseModel, Field
 
+from config import (
+    HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+)
+from dashboard import detail
+from metrics import get_metrics
+
 class ScoringTask(BaseModel):
     task_key: str = Field(..., alias='taskKey')
     kaohao: str
@@ -16,16 +31,91 @@ class ScoringTask(BaseModel):
         populate_by_name = True
         from_attributes = True
 
+class RetryPolicy:
+    """
+    重试策略：5xx与连接错误时按带抖动的指数退避重试
+
+    非幂等的请求（提交分数）只在连接没有建立时重试：读超时或5xx时平台可能已经处理了请求，
+    重试会重复提交，这时直接抛出，由阅卷日志在下次运行时续提交。
+    """
+
+    def __init__(
+        self,
+        max_retries: int = HTTP_MAX_RETRIES,
+        backoff_base: float = HTTP_BACKOFF_BASE,
+        backoff_max: float = HTTP_BACKOFF_MAX
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_retry_status(self, status_code: int) -> bool:
+        return status_code >= 500
+
+    @staticmethod
+    def is_connect_error(exc: requests.RequestException) -> bool:
+        """请求是否在建立连接时失败（请求未发出）"""
+        if isinstance(exc, requests.ConnectTimeout):
+            return True
+        reason = exc.args[0] if exc.args else None
+        return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+    def delay(self, attempt: int) -> float:
+        """第attempt次重试前的等待时间（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
 class ScoringAPIClient:
-    def __init__(self, base_url: str, cookies: Dict[str, str]):
+    """
+    阅卷平台客户端
+
+    所有请求（包括图片下载）共用一个带连接池的会话，复用TCP/TLS连接。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        cookies: Dict[str, str],
+        pool_size: int = HTTP_POOL_SIZE,
+        timeout: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+        retry_policy: Optional[RetryPolicy] = None
+    ):
         self.base_url = base_url
         self.cookies = cookies
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
         self.headers = {
             "accept": "application/json, text/plain, */*",
             "content-type": "application/json;charset=UTF-8",
             "sec-ch-ua": "\"Microsoft Edge\";v=\"131\", \"Chromium\";v=\"131\", \"Not_A Brand\";v=\"24\"",
             "sec-ch-ua-platform": "\"macOS\""
         }
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method: str, url: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """发送请求，5xx与连接错误时重试；非幂等请求只在连接未建立时重试"""
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if (
+                    not idempotent
+                    or not self.retry_policy.should_retry_status(response.status_code)
+                    or attempt >= self.retry_policy.max_retries
+                ):
+                    response.raise_for_status()
+                    return response
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retry_policy.max_retries:
+                    raise
+                if not idempotent and not self.retry_policy.is_connect_error(e):
+                    raise
+            time.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
 
     def get_tasks(self, subject_id: str, block_id: str, count: int = 4) -> List[ScoringTask]:
         """获取待阅试卷列表"""
@@ -38,31 +128,31 @@ class ScoringAPIClient:
             "blockVersion": "0",
             "isQuiz": "false"
         }
-        
-        response = requests.get(
-            url,
-            params=params,
-            headers=self.headers,
-            cookies=self.cookies
-        )
-        response.raise_for_status()
-        
-        data = response.json()
-        if data["code"] != 0:
-            raise Exception(f"API错误: {data['message']}")
-        
-        # 调试输出
-        print("\nAPI返回数据:")
-        print(data)
-            
-        try:
-            return [ScoringTask.model_validate(task) for task in data["data"]]
-        except Exception as e:
-            print(f"\n数据验证错误: {str(e)}")
-            print("\n实际数据示例:")
-            if data["data"]:
-                print(data["data"][0])
-            raise
+
+        with get_metrics().stage("fetch") as record:
+            response = self._request(
+                "GET",
+                url,
+                params=params,
+                headers=self.headers,
+                cookies=self.cookies
+            )
+            record.bytes = len(response.content)
+
+            data = response.json()
+            if data["code"] != 0:
+                raise Exception(f"API错误: {data['message']}")
+
+            # 调试输出
+            detail("\nAPI返回数据:", data)
+
+            try:
+                return [ScoringTask.model_validate(task) for task in data["data"]]
+            except Exception as e:
+                detail(f"\n数据验证错误: {str(e)}")
+                if data["data"]:
+                    detail("\n实际数据示例:", data["data"][0])
+                raise
 
     def submit_score(
         self,
@@ -80,7 +170,7 @@ class ScoringAPIClient:
             "type": "normal",
             "taskKey": task_key
         }
-        
+
         data = {
             "delay": delay,
             "scores": scores,
@@ -94,18 +184,37 @@ class ScoringAPIClient:
             "isSpecialWrong": False,
             "blockVersion": "0"
         }
-        
-        response = requests.post(
-            url,
-            params=params,
-            json=data,
-            headers=self.headers,
-            cookies=self.cookies
-        )
-        response.raise_for_status()
-        
-        result = response.json()
-        if result["code"] != 0:
-            raise Exception(f"提交分数失败: {result['message']}")
-            
-        return result["data"] 
+
+        with get_metrics().stage("submit") as record:
+            response = self._request(
+                "POST",
+                url,
+                idempotent=False,
+                params=params,
+                json=data,
+                headers=self.headers,
+                cookies=self.cookies
+            )
+            record.bytes = len(response.content)
+
+            result = response.json()
+            if result["code"] != 0:
+                raise Exception(f"提交分数失败: {result['message']}")
+
+            return result["data"]
+
+    def download_image(self, url: str) -> bytes:
+        """下载试卷图片，与平台请求共用连接池"""
+        with get_metrics().stage("download") as record:
+            content = self._request("GET", url).content
+            record.bytes = len(content)
+            return content
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,236 @@
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from answer_rules import BlankKey, CompiledAnswerKey
+from models import AnswerSheet, StudentAnswer
+
+PartKey = Tuple[int, int]  # (题号, 小题号)
+
+
+def pack_key(question_number: int, part_number: int, blank_number: int = 0) -> int:
+    """把(题号, 小题号, 空号)编码为一个整数，小题号与空号各占16位"""
+    return (question_number << 32) | ((part_number & 0xFFFF) << 16) | (blank_number & 0xFFFF)
+
+
+def pack_keys(questions: np.ndarray, parts: np.ndarray, blanks: Optional[np.ndarray] = None) -> np.ndarray:
+    """pack_key的数组版本"""
+    codes = (np.asarray(questions, dtype=np.int64) << 32) | ((np.asarray(parts, dtype=np.int64) & 0xFFFF) << 16)
+    if blanks is not None:
+        codes |= np.asarray(blanks, dtype=np.int64) & 0xFFFF
+    return codes
+
+
+class BatchScoreResult:
+    """
+    批量评分结果
+
+    scores / possible 为 学生 × 小题 矩阵，
+    answered / crossed_out / correct 为 学生 × 空 矩阵。
+    """
+
+    def __init__(
+        self,
+        student_ids: List[str],
+        part_keys: List[PartKey],
+        blank_keys: List[BlankKey],
+        scores: np.ndarray,
+        possible: np.ndarray,
+        answered: np.ndarray,
+        crossed_out: np.ndarray,
+        correct: np.ndarray
+    ):
+        self.student_ids = student_ids
+        self.part_keys = part_keys
+        self.blank_keys = blank_keys
+        self.scores = scores
+        self.possible = possible
+        self.answered = answered
+        self.crossed_out = crossed_out
+        self.correct = correct
+
+    @property
+    def totals(self) -> np.ndarray:
+        """每个学生的总分"""
+        return self.scores.sum(axis=1)
+
+    @property
+    def total_possible(self) -> np.ndarray:
+        """每个学生作答小题的满分之和"""
+        return self.possible.sum(axis=1)
+
+    def student_scores(self, student_id: str) -> Dict[str, int]:
+        """单个学生各小题得分，键为"题号.小题号" """
+        row = self.student_ids.index(student_id)
+        return {
+            f"{question_number}.{part_number}": int(self.scores[row, column])
+            for column, (question_number, part_number) in enumerate(self.part_keys)
+        }
+
+
+class BatchScorer:
+    """一份标准答案对大量学生的批量评分"""
+
+    def __init__(self, standard_answer: AnswerSheet, rules: Optional[CompiledAnswerKey] = None):
+        self.standard_answer = standard_answer
+        self.rules = rules or CompiledAnswerKey(standard_answer)
+
+        # 小题与空的列索引
+        self.part_keys: List[PartKey] = []
+        self.blank_keys: List[BlankKey] = []
+        blanks_per_part: List[int] = []
+        for question in standard_answer.questions:
+            for part in question.parts:
+                self.part_keys.append((question.number, part.number))
+                blanks_count = CompiledAnswerKey.blanks_count(part)
+                blanks_per_part.append(blanks_count)
+                for blank_number in range(1, blanks_count + 1):
+                    self.blank_keys.append((question.number, part.number, blank_number))
+
+        self._part_index = {key: index for index, key in enumerate(self.part_keys)}
+        self._blank_index = {key: index for index, key in enumerate(self.blank_keys)}
+        self._blanks_per_part = np.array(blanks_per_part, dtype=np.int32)
+        # 空到小题的指示矩阵，用于把空的得分汇总到小题
+        self._blank_part = np.zeros((len(self.blank_keys), len(self.part_keys)), dtype=np.int32)
+        for blank_column, key in enumerate(self.blank_keys):
+            self._blank_part[blank_column, self._part_index[key[:2]]] = 1
+        # 按编码排序的小题/空，用于把列式数据中的题号批量映射为列索引
+        self._part_codes, self._part_columns = self._sorted_codes(
+            [pack_key(question, part) for question, part in self.part_keys]
+        )
+        self._blank_codes, self._blank_columns = self._sorted_codes(
+            [pack_key(*key) for key in self.blank_keys]
+        )
+
+    @staticmethod
+    def _sorted_codes(codes: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        codes = np.array(codes, dtype=np.int64)
+        order = np.argsort(codes)
+        return codes[order], order.astype(np.int64)
+
+    @staticmethod
+    def _lookup(sorted_codes: np.ndarray, columns: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """编码到列索引，不在标准答案中的为-1"""
+        if len(sorted_codes) == 0:
+            return np.full(len(codes), -1, dtype=np.int64)
+        index = np.minimum(np.searchsorted(sorted_codes, codes), len(sorted_codes) - 1)
+        return np.where(sorted_codes[index] == codes, columns[index], -1)
+
+    def score(self, answers_by_student: Mapping[str, Iterable[StudentAnswer]]) -> BatchScoreResult:
+        """
+        批量评分，规则与AnswerChecker.check_answer一致：
+        未作答的小题不计满分，答案数少于空数的小题记0分，被划掉的答案记0分。
+        """
+        student_ids = list(answers_by_student.keys())
+        rows: List[int] = []
+        questions: List[int] = []
+        parts: List[int] = []
+        blanks: List[int] = []
+        content_ids: List[int] = []
+        crossed_out: List[bool] = []
+        # 答案内容去重，相同答案只判一次
+        interned: Dict[str, int] = {}
+        contents: List[str] = []
+        for row, student_id in enumerate(student_ids):
+            for answer in answers_by_student[student_id]:
+                content_id = interned.get(answer.content)
+                if content_id is None:
+                    content_id = interned[answer.content] = len(contents)
+                    contents.append(answer.content)
+                rows.append(row)
+                questions.append(answer.question_number)
+                parts.append(answer.part_number)
+                blanks.append(answer.blank_number)
+                content_ids.append(content_id)
+                crossed_out.append(answer.is_crossed_out)
+
+        return self.score_columns(
+            student_ids,
+            np.array(rows, dtype=np.int64),
+            np.array(questions, dtype=np.int64),
+            np.array(parts, dtype=np.int64),
+            np.array(blanks, dtype=np.int64),
+            np.array(content_ids, dtype=np.int64),
+            np.array(crossed_out, dtype=bool),
+            contents,
+        )
+
+    def score_columns(
+        self,
+        student_ids: List[str],
+        rows: np.ndarray,
+        questions: np.ndarray,
+        parts: np.ndarray,
+        blanks: np.ndarray,
+        content_ids: np.ndarray,
+        crossed_out: np.ndarray,
+        contents: Sequence[str]
+    ) -> BatchScoreResult:
+        """
+        对列式存储的答案批量评分，每个下标为一个答案
+
+        rows为答案所属学生在student_ids中的下标，content_ids为答案内容在contents中的下标。
+        评分规则与score相同：同一空只取第一个答案，每个空的不同答案内容只判一次。
+        """
+        n_students = len(student_ids)
+        n_parts = len(self.part_keys)
+        n_blanks = len(self.blank_keys)
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # 每个小题的答案数（含标准答案中没有的空）
+        part_column = self._lookup(self._part_codes, self._part_columns, pack_keys(questions, parts))
+        in_part = part_column >= 0
+        part_answer_counts = np.bincount(
+            rows[in_part] * n_parts + part_column[in_part], minlength=n_students * n_parts
+        ).reshape(n_students, n_parts)
+
+        # 每个(学生, 空)只取第一个答案
+        blank_column = self._lookup(self._blank_codes, self._blank_columns, pack_keys(questions, parts, blanks))
+        in_blank = np.flatnonzero(blank_column >= 0)
+        cells, first = np.unique(rows[in_blank] * n_blanks + blank_column[in_blank], return_index=True)
+        source = in_blank[first]
+
+        answered = np.zeros(n_students * n_blanks, dtype=bool)
+        crossed = np.zeros(n_students * n_blanks, dtype=bool)
+        correct = np.zeros(n_students * n_blanks, dtype=bool)
+        answered[cells] = True
+        crossed[cells] = np.asarray(crossed_out, dtype=bool)[source]
+
+        # 每个空的不同答案各判一次
+        if len(source):
+            n_contents = max(len(contents), 1)
+            pairs = blank_column[source] * n_contents + np.asarray(content_ids, dtype=np.int64)[source]
+            unique_pairs, inverse = np.unique(pairs, return_inverse=True)
+            lookup = np.fromiter(
+                (
+                    self.rules.rules[self.blank_keys[pair // n_contents]].matches(contents[pair % n_contents])
+                    for pair in unique_pairs.tolist()
+                ),
+                dtype=bool,
+                count=len(unique_pairs),
+            )
+            correct[cells] = lookup[inverse.reshape(-1)]
+
+        answered = answered.reshape(n_students, n_blanks)
+        crossed_out = crossed.reshape(n_students, n_blanks)
+        correct = correct.reshape(n_students, n_blanks)
+        correct &= answered & ~crossed_out
+
+        # 空得分汇总到小题
+        scores = correct.astype(np.int32) @ self._blank_part
+
+        part_answered = part_answer_counts > 0
+        complete = part_answer_counts >= self._blanks_per_part
+        scores[~complete] = 0
+        possible = np.where(part_answered, self._blanks_per_part, 0).astype(np.int32)
+
+        return BatchScoreResult(
+            student_ids=student_ids,
+            part_keys=self.part_keys,
+            blank_keys=self.blank_keys,
+            scores=scores,
+            possible=possible,
+            answered=answered,
+            crossed_out=crossed_out,
+            correct=correct,
+        )
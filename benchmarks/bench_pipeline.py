@@ -0,0 +1,339 @@
+"""
+端到端阅卷基准测试
+
+启动本地模拟的阅卷平台与模型服务，驱动main.main（逐份）或流水线模式，
+统计每分钟阅卷数以及各阶段的p50/p95/p99延迟。
+
+用法：
+    python -m benchmarks.bench_pipeline --papers 40 --mode both --vlm-latency 0.5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from benchmarks.fake_platform import FakePlatform
+from benchmarks.fake_vlm import FakeVLM
+from models import AnswerSheet
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class StageTimer:
+    """记录各阶段每次调用的耗时"""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.errors[stage] += 1
+                raise
+            finally:
+                with self._lock:
+                    self.durations[stage].append(time.perf_counter() - started)
+        return timed
+
+    def report(self) -> List[Dict]:
+        rows = []
+        for stage, values in self.durations.items():
+            rows.append({
+                "stage": stage,
+                "count": len(values),
+                "errors": self.errors.get(stage, 0),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            })
+        return rows
+
+
+def instrument(timer: StageTimer):
+    """给各阶段函数套上计时，返回恢复原函数的回调"""
+    import main
+    import pipeline
+    from answer_checker import AnswerChecker
+    from api_client import ScoringAPIClient
+    from image_processor import ImageProcessor
+
+    # (所属对象, 属性名, 阶段名)；pipeline从main导入了函数，两处都要替换
+    targets = [
+        (ScoringAPIClient, "get_tasks", "fetch"),
+        (main, "fetch_image", "download"),
+        (pipeline, "fetch_image", "download"),
+        (main, "process_answer_sheet", "recognize"),
+        (pipeline, "process_answer_sheet", "recognize"),
+        (ImageProcessor, "request_model", "model"),
+        (AnswerChecker, "check_answer", "score"),
+        (ScoringAPIClient, "submit_score", "submit"),
+    ]
+    originals = []
+    for owner, name, stage in targets:
+        raw = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+        originals.append((owner, name, raw))
+        if isinstance(raw, staticmethod):
+            setattr(owner, name, staticmethod(timer.wrap(stage, raw.__func__)))
+        else:
+            setattr(owner, name, timer.wrap(stage, raw))
+
+    def restore():
+        for owner, name, value in originals:
+            setattr(owner, name, value)
+    return restore
+
+
+def run_once(mode: str, args, standard_answer_path: str, standard_answer: AnswerSheet) -> Dict:
+    """启动模拟服务并运行一次阅卷"""
+    import answer_store
+    import cascade
+    import composite
+    import dashboard
+    import image_processor
+    import item_analysis
+    import journal
+    import main
+    import metrics
+    import rate_limiter
+    import recognition_cache
+    import routing
+    import sheet_classifier
+    from api_client import RetryPolicy, ScoringAPIClient
+
+    # 每次运行使用全新的缓存与限速器，避免互相影响
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    recognition_cache._default_cache = recognition_cache.RecognitionCache(
+        os.path.join(cache_dir, "cache.sqlite3")
+    )
+    metrics._metrics = metrics.MetricsRecorder()
+    routing._review_queue = routing.ReviewQueue(os.path.join(cache_dir, "review_queue.jsonl"))
+    routing.routing_stats.reset()
+    journal._journal = journal.GradingJournal(os.path.join(cache_dir, "journal.jsonl"))
+    answer_store._answer_store = answer_store.AnswerStore(os.path.join(cache_dir, "answer_store"))
+    sheet_classifier._sheet_classifier = sheet_classifier.SheetClassifier(reuse_duplicates=args.duplicate_rate > 0)
+    sheet_classifier.sheet_stats.reset()
+    routing_policy = routing.RoutingPolicy(confidence_threshold=args.confidence_threshold)
+    image_processor.MODEL_STREAMING = not args.no_stream
+    cascade.MODEL_CASCADE_ENABLED = args.cascade
+    cascade._cascade_policy = cascade.CascadePolicy(fast_model=args.fast_model)
+    cascade.cascade_stats.reset()
+    composite.composite_stats.reset()
+    dashboard.set_headless(args.headless)
+    dashboard._paper_log = dashboard.PaperLog(os.path.join(cache_dir, "paper_log.jsonl"))
+    dashboard.dashboard_stats.reset()
+    item_analysis._item_analyzer = item_analysis.ItemAnalyzer(
+        snapshot_path=os.path.join(cache_dir, "item_analysis.json")
+    )
+    rate_limiter._model_limiter = rate_limiter.AdaptiveRateLimiter(
+        requests_per_minute=None,
+        initial_concurrency=args.model_concurrency,
+        max_concurrency=max(args.model_concurrency, args.recognition_concurrency * 2),
+        cooldown=0.2,
+    )
+
+    platform = FakePlatform(
+        papers=args.papers,
+        latency=args.platform_latency,
+        image_latency=args.platform_latency,
+        error_rate=args.platform_error_rate,
+        blank_rate=args.blank_rate,
+        duplicate_rate=args.duplicate_rate,
+    ).start()
+    timer = StageTimer()
+    restore = instrument(timer)
+    api_client = ScoringAPIClient(platform.base_url, {"yx_sid": "bench"}, retry_policy=RetryPolicy(backoff_base=0.05))
+
+    output = io.StringIO() if args.quiet else None
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output) if output is not None else contextlib.nullcontext():
+            if mode == "serial":
+                main.main(
+                    api_client, "bench", "bench", standard_answer_path, args.questions, routing_policy
+                )
+            else:
+                from pipeline import GradingPipeline
+                import asyncio
+                asyncio.run(GradingPipeline(
+                    api_client,
+                    "bench",
+                    "bench",
+                    standard_answer,
+                    args.questions,
+                    download_concurrency=args.download_concurrency,
+                    recognition_concurrency=args.recognition_concurrency,
+                    submit_concurrency=args.submit_concurrency,
+                    routing_policy=routing_policy,
+                    batch_size=args.composite_tiles if args.composite else 1,
+                ).run())
+    finally:
+        elapsed = time.perf_counter() - started
+        restore()
+        api_client.close()
+        platform.stop()
+
+    submitted = len(platform.submissions)
+    reviewed = routing.routing_stats.summary()["review"]
+    stage_summary = metrics.get_metrics().summary()
+    first_answer = stage_summary.get("first_answer")
+    repair = stage_summary.get("repair")
+    fast = stage_summary.get("cascade_fast")
+    escalate = stage_summary.get("escalate")
+    return {
+        "mode": mode,
+        "papers": args.papers,
+        "submitted": submitted,
+        "reviewed": reviewed,
+        "duplicate_submissions": platform.duplicate_submissions,
+        "elapsed_s": elapsed,
+        "papers_per_minute": (submitted + reviewed) * 60 / elapsed if elapsed > 0 else 0.0,
+        "stages": timer.report(),
+        "first_answer_p50_ms": first_answer["p50_ms"] if first_answer else None,
+        "sheets": sheet_classifier.sheet_stats.summary(),
+        "repairs": repair["count"] if repair else 0,
+        "repairs_incomplete": repair["errors"] if repair else 0,
+        "cascade": cascade.cascade_stats.summary() if args.cascade else None,
+        "cascade_fast_p50_ms": fast["p50_ms"] if fast else None,
+        "escalate_p50_ms": escalate["p50_ms"] if escalate else None,
+        "composite": composite.composite_stats.summary() if args.composite else None,
+        "model": rate_limiter.get_model_limiter().stats(),
+    }
+
+
+def print_result(result: Dict):
+    print(
+        f"\n== {result['mode']} == 提交 {result['submitted']}/{result['papers']} 份，"
+        f"送复核 {result['reviewed']} 份，"
+        f"重复提交 {result['duplicate_submissions']}，用时 {result['elapsed_s']:.2f} 秒，"
+        f"{result['papers_per_minute']:.1f} 份/分钟"
+    )
+    print(f"{'阶段':<12}{'次数':>8}{'错误':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}")
+    for row in result["stages"]:
+        print(
+            f"{row['stage']:<12}{row['count']:>8}{row['errors']:>8}"
+            f"{row['p50_ms']:>12.1f}{row['p95_ms']:>12.1f}{row['p99_ms']:>12.1f}"
+        )
+    if result["first_answer_p50_ms"] is not None:
+        print(f"流式识别首个答案 p50 {result['first_answer_p50_ms']:.1f} ms")
+    sheets = result["sheets"]
+    if sheets["blank"] or sheets["duplicate"]:
+        print(
+            f"快速分类：空白 {sheets['blank']} 份，近似复用 {sheets['duplicate']} 份，"
+            f"命中率 {sheets['hit_rate']:.1%}"
+        )
+    if result["repairs"]:
+        print(f"补识别 {result['repairs']} 次，其中未补全 {result['repairs_incomplete']} 次")
+    batches = result["composite"]
+    if batches:
+        print(
+            f"合并识别：请求 {batches['requests']} 次，平均每次 {batches['tiles_per_request']:.1f} 份，"
+            f"拆回 {batches['mapped']} 份，单独识别 {batches['fallback']} 份"
+        )
+    cascade = result["cascade"]
+    if cascade:
+        latency = f"快速模型 p50 {result['cascade_fast_p50_ms'] or 0:.1f} ms"
+        if result["escalate_p50_ms"] is not None:
+            latency += f"，主模型重新识别 p50 {result['escalate_p50_ms']:.1f} ms"
+        print(
+            f"分级识别：快速模型独立完成 {cascade['fast_only']}/{cascade['papers']} 份"
+            f"（{cascade['paper_hit_rate']:.1%}），空命中率 {cascade['blank_hit_rate']:.1%}，"
+            f"交给主模型 {cascade['escalated']} 个空，{latency}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端阅卷基准测试")
+    parser.add_argument("--mode", choices=["serial", "pipeline", "both"], default="both")
+    parser.add_argument("--papers", type=int, default=40)
+    parser.add_argument("--standard-answer", default="./data/standard_answer.json")
+    parser.add_argument("--questions", type=int, nargs="+", default=[28])
+    parser.add_argument("--vlm-latency", type=float, default=0.5, help="模型平均延迟（秒）")
+    parser.add_argument("--vlm-jitter", type=float, default=0.2)
+    parser.add_argument("--vlm-throttle-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--vlm-error-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument("--vlm-low-confidence-rate", type=float, default=0.05, help="低置信度答案的比例")
+    parser.add_argument("--vlm-missing-rate", type=float, default=0.0, help="漏识别的空的比例")
+    parser.add_argument("--confidence-threshold", type=float, default=0.8, help="低于该置信度的试卷送复核")
+    parser.add_argument("--platform-latency", type=float, default=0.02, help="平台接口延迟（秒）")
+    parser.add_argument("--platform-error-rate", type=float, default=0.0, help="平台返回503的比例")
+    parser.add_argument("--blank-rate", type=float, default=0.0, help="空白答题卡的比例")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="近似答题卡的比例")
+    parser.add_argument("--download-concurrency", type=int, default=4)
+    parser.add_argument("--recognition-concurrency", type=int, default=8)
+    parser.add_argument("--submit-concurrency", type=int, default=2)
+    parser.add_argument("--no-stream", action="store_true", help="不使用流式识别，等待完整结果")
+    parser.add_argument("--cascade", action="store_true", help="开启分级识别，先用快速模型识别")
+    parser.add_argument("--fast-model", default="glm-4v-flash", help="分级识别的快速模型")
+    parser.add_argument("--fast-latency", type=float, default=0.15, help="快速模型平均延迟（秒）")
+    parser.add_argument("--fast-low-confidence-rate", type=float, default=0.2, help="快速模型低置信度答案的比例")
+    parser.add_argument("--composite", action="store_true", help="流水线模式下多份试卷拼图合并识别")
+    parser.add_argument("--composite-tiles", type=int, default=6, help="每张拼图最多的试卷数")
+    parser.add_argument("--model-concurrency", type=int, default=8, help="限速器的初始并发上限")
+    parser.add_argument("--json", help="把结果另存为JSON")
+    parser.add_argument("--quiet", action="store_true", help="不输出阅卷过程中的日志")
+    parser.add_argument("--headless", action="store_true", help="无界面模式：只显示汇总面板，逐份明细写入日志")
+    args = parser.parse_args()
+
+    with open(args.standard_answer, "r", encoding="utf-8") as f:
+        standard_answer = AnswerSheet(**json.load(f))
+
+    vlm = FakeVLM(
+        standard_answer,
+        latency=args.vlm_latency,
+        jitter=args.vlm_jitter,
+        throttle_rate=args.vlm_throttle_rate,
+        error_rate=args.vlm_error_rate,
+        low_confidence_rate=args.vlm_low_confidence_rate,
+        missing_rate=args.vlm_missing_rate,
+        fast_model=args.fast_model if args.cascade else None,
+        fast_latency=args.fast_latency,
+        fast_low_confidence_rate=args.fast_low_confidence_rate,
+    ).start()
+    # 必须在导入config之前设置，让模型客户端指向模拟服务
+    os.environ["ZHIPUAI_BASE_URL"] = vlm.base_url
+    os.environ.setdefault("ZHIPUAI_API_KEY", "bench.bench")
+
+    modes = ["serial", "pipeline"] if args.mode == "both" else [args.mode]
+    results = []
+    try:
+        for mode in modes:
+            result = run_once(mode, args, args.standard_answer, standard_answer)
+            results.append(result)
+            print_result(result)
+    finally:
+        vlm.stop()
+
+    print(
+        f"\n模型服务：请求 {vlm.requests} 次，限流 {vlm.throttled} 次，错误 {vlm.errors} 次，"
+        f"流式提前断开 {vlm.aborted} 次"
+    )
+    if args.cascade:
+        print("按模型：" + "，".join(f"{model} {count} 次" for model, count in sorted(vlm.requests_by_model.items())))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
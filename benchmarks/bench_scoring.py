@@ -0,0 +1,90 @@
+"""
+评分阶段的微基准测试
+
+随机生成学生答案，对比逐份评分（AnswerChecker.check_answer）与批量评分（check_batch）的吞吐。
+不需要模型服务和阅卷平台。
+
+用法：
+    python -m benchmarks.bench_scoring --students 5000
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+
+from answer_checker import AnswerChecker
+from benchmarks.bench_pipeline import percentile
+from models import AnswerSheet, StudentAnswer
+
+
+def generate_students(standard_answer: AnswerSheet, count: int, accuracy: float, seed: int) -> Dict[str, List[StudentAnswer]]:
+    """按标准答案的结构生成学生答案，包含答错、漏答与划掉的情况"""
+    rng = random.Random(seed)
+    students = {}
+    for index in range(count):
+        answers = []
+        for question in standard_answer.questions:
+            for part in question.parts:
+                keywords = part.keywords or [part.keyword or ""]
+                for blank_number, keyword in enumerate(keywords, 1):
+                    if rng.random() < 0.05:
+                        continue
+                    answers.append(StudentAnswer(
+                        question_number=question.number,
+                        part_number=part.number,
+                        blank_number=blank_number,
+                        content=keyword if rng.random() < accuracy else f"错误答案{rng.randint(0, 20)}",
+                        confidence=round(rng.uniform(0.5, 1.0), 2),
+                        is_crossed_out=rng.random() < 0.02,
+                        is_blurry=False,
+                    ))
+        students[f"{index:06d}"] = answers
+    return students
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评分阶段的微基准测试")
+    parser.add_argument("--standard-answer", default="./data/standard_answer.json")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--accuracy", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.standard_answer, "r", encoding="utf-8") as f:
+        standard_answer = AnswerSheet(**json.load(f))
+
+    started = time.perf_counter()
+    checker = AnswerChecker(standard_answer)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    students = generate_students(standard_answer, args.students, args.accuracy, args.seed)
+
+    durations = []
+    started = time.perf_counter()
+    for answers in students.values():
+        call_started = time.perf_counter()
+        checker.check_answer(answers)
+        durations.append(time.perf_counter() - call_started)
+    serial_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    checker.check_batch(students)
+    batch_elapsed = time.perf_counter() - started
+
+    print(f"编译标准答案: {compile_ms:.2f} ms")
+    print(
+        f"逐份评分: {args.students} 份用时 {serial_elapsed:.3f} 秒，"
+        f"{args.students / serial_elapsed:.0f} 份/秒，"
+        f"p50 {percentile(durations, 0.50) * 1e6:.0f} µs，"
+        f"p95 {percentile(durations, 0.95) * 1e6:.0f} µs，"
+        f"p99 {percentile(durations, 0.99) * 1e6:.0f} µs"
+    )
+    print(
+        f"批量评分: {args.students} 份用时 {batch_elapsed:.3f} 秒，"
+        f"{args.students / batch_elapsed:.0f} 份/秒"
+    )
+
+
+if __name__ == "__main__":
+    main()
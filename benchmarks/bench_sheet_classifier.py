@@ -0,0 +1,79 @@
+"""
+答题卡快速分类的准确性检查
+
+用模拟平台的答题卡生成器画出同一印刷模板上的几类答题卡，检查快速分类是否：
+    - 把只有印刷内容的答题卡判为空白
+    - 复用笔迹完全相同的答题卡的识别结果
+    - 不把只有一个答案不同的答题卡当作近似（否则会把别人的识别结果提交给这名学生）
+    - 不把有笔迹的答题卡判为空白
+任何一项出错时以非0状态退出。不需要模型服务和阅卷平台。
+
+用法：
+    python -m benchmarks.bench_sheet_classifier --sheets 50
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+
+from benchmarks.fake_platform import render_sheet
+from models import StudentAnswer
+from sheet_classifier import BLANK, DUPLICATE, SheetClassifier
+
+CONTEXT = "28"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="答题卡快速分类的准确性检查")
+    parser.add_argument("--sheets", type=int, default=50, help="每类答题卡的数量")
+    parser.add_argument("--templates", type=int, default=5, help="被复用或改动的原始答题卡数量")
+    parser.add_argument("--template-samples", type=int, default=20, help="学习印刷内容用的答题卡数量")
+    args = parser.parse_args()
+
+    classifier = SheetClassifier(reuse_duplicates=True, template_samples=args.template_samples)
+    answers = [StudentAnswer(
+        question_number=28, part_number=1, blank_number=1, content="x",
+        confidence=1.0, is_crossed_out=False, is_blurry=False
+    )]
+
+    # 学习印刷内容（混入少量空白卡，与真实情况一致）
+    for index in range(args.template_samples):
+        sheet = render_sheet(f"learn-{index}", blank=index % 5 == 0)
+        classifier.classify(sheet, CONTEXT)
+
+    # 原始答题卡：识别后记住，供之后复用
+    for index in range(args.templates):
+        match = classifier.classify(render_sheet(f"origin-{index}", seed=f"template-{index}"), CONTEXT)
+        if match.features is not None:
+            classifier.remember(match.features, CONTEXT, answers)
+
+    cases = {
+        "blank": lambda index: render_sheet(f"blank-{index}", blank=True),
+        "duplicate": lambda index: render_sheet(f"dup-{index}", seed=f"template-{index % args.templates}"),
+        "one_answer_changed": lambda index: render_sheet(
+            f"changed-{index}", seed=f"template-{index % args.templates}", changed_row=index % 3
+        ),
+        "distinct": lambda index: render_sheet(f"distinct-{index}"),
+    }
+    expected = {"blank": BLANK, "duplicate": DUPLICATE, "one_answer_changed": None, "distinct": None}
+
+    failures = 0
+    started = time.perf_counter()
+    print(f"{'类别':<20}{'空白':>8}{'近似':>8}{'调用模型':>10}{'出错':>8}")
+    for name, render in cases.items():
+        kinds = Counter()
+        for index in range(args.sheets):
+            kinds[classifier.classify(render(index), CONTEXT).kind] += 1
+        wrong = args.sheets - kinds[expected[name]]
+        failures += wrong
+        print(f"{name:<20}{kinds[BLANK]:>8}{kinds[DUPLICATE]:>8}{kinds[None]:>10}{wrong:>8}")
+    elapsed = time.perf_counter() - started
+    print(f"平均每张 {elapsed * 1000 / (args.sheets * len(cases)):.1f} ms")
+
+    if failures:
+        print(f"分类出错 {failures} 张")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+阅卷平台的本地模拟服务
+
+实现ScoringAPIClient用到的两个接口和试卷图片下载：
+    GET  /filter/yue/v400/subject/block/review/task  获取待阅试卷
+    POST /filter/yue/v353/subject/block/review/task  提交评分
+    GET  /images/{kaohao}.png                         试卷图片
+"""
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+TASKS_PATH = "/filter/yue/v400/subject/block/review/task"
+SUBMIT_PATH = "/filter/yue/v353/subject/block/review/task"
+
+
+def render_sheet(
+    kaohao: str,
+    size=(1200, 400),
+    seed: Optional[str] = None,
+    blank: bool = False,
+    changed_row: Optional[int] = None
+) -> bytes:
+    """
+    生成答题卡图片
+
+    每张都有相同的印刷内容（边框、题号与答题横线）；默认带考号与若干笔画，保证每份图片内容不同；
+    blank时只有印刷内容；指定seed时不画考号，相同seed的图片笔迹相同（模拟近似的答题卡），
+    再指定changed_row时该行的笔画按考号生成（模拟只有一个答案不同的答题卡）。
+    """
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((10, 10, size[0] - 10, size[1] - 10), outline="black", width=2)
+    for row in range(3):
+        y = 120 + row * 90
+        draw.text((30, y + 20), f"28({row + 1})", fill="black")
+        draw.line((100, y + 40, size[0] - 100, y + 40), fill="gray", width=2)
+    if not blank:
+        if seed is None:
+            draw.text((40, 30), f"kaohao {kaohao}", fill="black")
+        for row in range(3):
+            y = 120 + row * 90
+            rng = random.Random(f"{kaohao if seed is None or row == changed_row else seed}-{row}")
+            for _ in range(6):
+                x = rng.randint(120, size[0] - 160)
+                draw.line((x, y, x + rng.randint(10, 40), y + rng.randint(5, 30)), fill="black", width=3)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakePlatform:
+    """
+    模拟阅卷平台
+
+    已下发但未提交的试卷在lease_seconds后重新下发，与真实平台行为一致。
+    按blank_rate生成空白答题卡，按duplicate_rate生成与duplicate_templates份模板之一相同的答题卡。
+    """
+
+    def __init__(
+        self,
+        papers: int = 100,
+        latency: float = 0.02,
+        image_latency: float = 0.02,
+        error_rate: float = 0.0,
+        lease_seconds: float = 60,
+        blank_rate: float = 0.0,
+        duplicate_rate: float = 0.0,
+        duplicate_templates: int = 3,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.latency = latency
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.lease_seconds = lease_seconds
+        self.blank_rate = blank_rate
+        self.duplicate_rate = duplicate_rate
+        self.duplicate_templates = duplicate_templates
+        self.kaohaos = [f"{index:06d}" for index in range(papers)]
+        self.submissions: Dict[str, List[Dict]] = {}
+        self.duplicate_submissions = 0
+        self._issued: Dict[str, float] = {}
+        self._images: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakePlatform":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def image(self, kaohao: str) -> bytes:
+        with self._lock:
+            if kaohao not in self._images:
+                rng = random.Random(f"kind-{kaohao}")
+                value = rng.random()
+                if value < self.blank_rate:
+                    self._images[kaohao] = render_sheet(kaohao, blank=True)
+                elif value < self.blank_rate + self.duplicate_rate:
+                    seed = f"template-{rng.randrange(self.duplicate_templates)}"
+                    self._images[kaohao] = render_sheet(kaohao, seed=seed)
+                else:
+                    self._images[kaohao] = render_sheet(kaohao)
+            return self._images[kaohao]
+
+    def next_tasks(self, count: int) -> List[Dict]:
+        """下发尚未提交、且未在租约期内的试卷"""
+        now = time.time()
+        tasks = []
+        with self._lock:
+            for kaohao in self.kaohaos:
+                if len(tasks) >= count:
+                    break
+                if kaohao in self.submissions:
+                    continue
+                issued_at = self._issued.get(kaohao)
+                if issued_at is not None and now - issued_at < self.lease_seconds:
+                    continue
+                self._issued[kaohao] = now
+                tasks.append({
+                    "taskKey": f"task-{kaohao}",
+                    "kaohao": kaohao,
+                    "blockImg": f"{self.base_url}/images/{kaohao}.png",
+                    "pos": [],
+                })
+        return tasks
+
+    def submit(self, task_key: str, scores: List[Dict]):
+        kaohao = task_key.replace("task-", "", 1)
+        with self._lock:
+            if kaohao in self.submissions:
+                self.duplicate_submissions += 1
+            self.submissions[kaohao] = scores
+
+    def _handler_class(self):
+        platform = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json;charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _maybe_fail(self) -> bool:
+                if platform.error_rate and random.random() < platform.error_rate:
+                    self._send_json(503, {"code": -1, "message": "模拟服务错误"})
+                    return True
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.startswith("/images/"):
+                    time.sleep(platform.image_latency)
+                    if self._maybe_fail():
+                        return
+                    kaohao = url.path[len("/images/"):].rsplit(".", 1)[0]
+                    body = platform.image(kaohao)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if url.path == TASKS_PATH:
+                    time.sleep(platform.latency)
+                    if self._maybe_fail():
+                        return
+                    count = int(parse_qs(url.query).get("count", ["4"])[0])
+                    self._send_json(200, {"code": 0, "data": platform.next_tasks(count)})
+                    return
+                self._send_json(404, {"code": 404, "message": "not found"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if url.path != SUBMIT_PATH:
+                    self._send_json(404, {"code": 404, "message": "not found"})
+                    return
+                time.sleep(platform.latency)
+                if self._maybe_fail():
+                    return
+                task_key = parse_qs(url.query).get("taskKey", [""])[0]
+                platform.submit(task_key, payload.get("scores", []))
+                self._send_json(200, {"code": 0, "data": {"available": len(platform.submissions)}})
+
+        return Handler
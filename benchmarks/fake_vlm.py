@@ -0,0 +1,289 @@
+"""
+多模态模型的本地模拟服务
+
+兼容ZhipuAI SDK的 POST {base_url}/chat/completions 接口，按标准答案的结构返回识别结果，
+请求中stream为true时以SSE分段返回。
+把环境变量ZHIPUAI_BASE_URL指向base_url即可让ImageProcessor使用该服务。
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import AnswerSheet
+
+_QUESTION_PATTERN = re.compile(r"第(\d+)题")
+# 补识别提示词中列出的空
+_BLANK_PATTERN = re.compile(r"第(\d+)题第(\d+)小题第(\d+)空")
+# 合并识别提示词中的块数
+_TILE_COUNT_PATTERN = re.compile(r"共(\d+)块")
+
+
+class FakeVLM:
+    """
+    模拟模型服务，可配置延迟、限流率、错误率、答对率、低置信度答案与漏识别的空的比例
+
+    流式返回时总延迟不变：先等待三成延迟再输出第一段，其余延迟均摊到各段之间，
+    客户端提前断开时停止输出并计入aborted。
+    请求的model为fast_model时按快速模型的延迟与低置信度比例返回，用于分级识别。
+    合并识别的请求按块数返回每块的结果，每多一块延迟增加tile_latency_factor倍。
+    """
+
+    def __init__(
+        self,
+        standard_answer: AnswerSheet,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        throttle_rate: float = 0.0,
+        error_rate: float = 0.0,
+        accuracy: float = 0.8,
+        low_confidence_rate: float = 0.05,
+        missing_rate: float = 0.0,
+        stream_chunk_size: int = 16,
+        fast_model: Optional[str] = None,
+        fast_latency: float = 0.15,
+        fast_low_confidence_rate: float = 0.2,
+        tile_latency_factor: float = 0.2,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.standard_answer = standard_answer
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.accuracy = accuracy
+        self.low_confidence_rate = low_confidence_rate
+        self.missing_rate = missing_rate
+        self.stream_chunk_size = stream_chunk_size
+        self.fast_model = fast_model
+        self.fast_latency = fast_latency
+        self.fast_low_confidence_rate = fast_low_confidence_rate
+        self.tile_latency_factor = tile_latency_factor
+        self.requests = 0
+        self.requests_by_model: Dict[str, int] = {}
+        self.throttled = 0
+        self.errors = 0
+        self.aborted = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4"
+
+    def start(self) -> "FakeVLM":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _question_result(
+        self,
+        question_number: int,
+        blanks: Optional[Set[Tuple[int, int, int]]] = None,
+        low_confidence_rate: Optional[float] = None
+    ) -> Optional[Dict]:
+        """生成一道题的识别结果，指定blanks时只返回这些空"""
+        question = next(
+            (q for q in self.standard_answer.questions if q.number == question_number),
+            None
+        )
+        if question is None:
+            return None
+        if low_confidence_rate is None:
+            low_confidence_rate = self.low_confidence_rate
+        parts = []
+        for part in question.parts:
+            keywords = part.keywords or [part.keyword or ""]
+            answers = []
+            for blank_number, keyword in enumerate(keywords, 1):
+                if blanks and (question_number, part.number, blank_number) not in blanks:
+                    continue
+                if self.missing_rate and random.random() < self.missing_rate:
+                    continue
+                correct = random.random() < self.accuracy
+                if random.random() < low_confidence_rate:
+                    confidence = random.uniform(0.4, 0.8)
+                else:
+                    confidence = random.uniform(0.85, 1.0)
+                answers.append({
+                    "blank_number": blank_number,
+                    "content": keyword if correct else "错误答案",
+                    "is_crossed_out": False,
+                    "is_blurry": False,
+                    "confidence": round(confidence, 2),
+                })
+            if answers:
+                parts.append({"part_number": part.number, "answers": answers})
+        return {"question_number": question_number, "parts": parts}
+
+    @staticmethod
+    def tile_count(prompt: str) -> int:
+        """合并识别请求中的块数，普通请求为0"""
+        match = _TILE_COUNT_PATTERN.search(prompt) if '"tiles"' in prompt else None
+        return int(match.group(1)) if match else 0
+
+    def is_fast(self, model: str) -> bool:
+        return self.fast_model is not None and model == self.fast_model
+
+    def build_content(self, prompt: str, model: str = "") -> str:
+        """根据提示词中的题号生成识别结果"""
+        numbers = []
+        for match in _QUESTION_PATTERN.findall(prompt):
+            if int(match) not in numbers:
+                numbers.append(int(match))
+        blanks = {tuple(map(int, match)) for match in _BLANK_PATTERN.findall(prompt)}
+        low_confidence_rate = self.fast_low_confidence_rate if self.is_fast(model) else None
+
+        def question_results() -> List[Dict]:
+            return [
+                result
+                for result in (self._question_result(number, blanks, low_confidence_rate) for number in numbers)
+                if result
+            ]
+
+        tile_count = self.tile_count(prompt)
+        if tile_count:
+            payload = {
+                "tiles": [{"tile": tile, "questions": question_results()} for tile in range(1, tile_count + 1)]
+            }
+            return "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```"
+        results = question_results()
+        if '"questions"' in prompt:
+            payload = {"questions": results}
+        else:
+            payload = results[0] if results else {"parts": []}
+        return "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```"
+
+    def _handler_class(self):
+        vlm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"code": "404", "message": "not found"}})
+                    return
+
+                model = request.get("model", "")
+                with vlm._lock:
+                    vlm.requests += 1
+                    vlm.requests_by_model[model] = vlm.requests_by_model.get(model, 0) + 1
+                if vlm.throttle_rate and random.random() < vlm.throttle_rate:
+                    with vlm._lock:
+                        vlm.throttled += 1
+                    self._send_json(429, {"error": {"code": "1302", "message": "模拟限流"}})
+                    return
+                base_latency = vlm.fast_latency if vlm.is_fast(model) else vlm.latency
+                latency = max(0.0, base_latency + random.uniform(-vlm.jitter, vlm.jitter))
+                stream = bool(request.get("stream"))
+                prompt = _extract_prompt(request.get("messages", []))
+                latency *= 1 + vlm.tile_latency_factor * max(vlm.tile_count(prompt) - 1, 0)
+                time.sleep(latency * 0.3 if stream else latency)
+                if vlm.error_rate and random.random() < vlm.error_rate:
+                    with vlm._lock:
+                        vlm.errors += 1
+                    self._send_json(500, {"error": {"code": "500", "message": "模拟服务错误"}})
+                    return
+
+                content = vlm.build_content(prompt, model)
+                prompt_tokens = 1000 + len(prompt)
+                completion_tokens = len(content)
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+                if stream:
+                    self._send_stream(request, content, usage, latency * 0.7)
+                    return
+                self._send_json(200, {
+                    "id": uuid.uuid4().hex,
+                    "created": int(time.time()),
+                    "model": request.get("model", ""),
+                    "choices": [{
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }],
+                    "usage": usage,
+                })
+
+            def _send_stream(self, request: Dict, content: str, usage: Dict, duration: float):
+                """以SSE分段输出，最后一段携带用量"""
+                size = vlm.stream_chunk_size
+                pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+                delay = duration / len(pieces)
+                response_id = uuid.uuid4().hex
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for index, piece in enumerate(pieces):
+                        chunk = {
+                            "id": response_id,
+                            "created": int(time.time()),
+                            "model": request.get("model", ""),
+                            "choices": [{
+                                "index": 0,
+                                "delta": {"role": "assistant", "content": piece},
+                            }],
+                        }
+                        if index == len(pieces) - 1:
+                            chunk["choices"][0]["finish_reason"] = "stop"
+                            chunk["usage"] = usage
+                        self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                        time.sleep(delay)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    with vlm._lock:
+                        vlm.aborted += 1
+
+        return Handler
+
+
+def _extract_prompt(messages: List[Dict]) -> str:
+    """取出消息中的文本部分"""
+    texts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for item in content or []:
+            if item.get("type") == "text":
+                texts.append(item.get("text", ""))
+    return "\n".join(texts)
@@ -0,0 +1,109 @@
+import threading
+from typing import Dict, List, Optional
+
+from answer_rules import BlankKey
+from config import (
+    MODEL_CASCADE_ENABLED,
+    MODEL_CASCADE_CONFIDENCE,
+    MODEL_CASCADE_ESCALATE_BLURRY,
+    MODEL_FAST_NAME,
+)
+from models import StudentAnswer
+
+
+class CascadePolicy:
+    """
+    分级识别策略
+
+    先用fast_model识别整张答题卡，置信度低于confidence_threshold或字迹模糊的空
+    再交给主模型（MODEL_NAME）只针对这些空识别一次。
+    """
+
+    def __init__(
+        self,
+        fast_model: str = MODEL_FAST_NAME,
+        confidence_threshold: float = MODEL_CASCADE_CONFIDENCE,
+        escalate_blurry: bool = MODEL_CASCADE_ESCALATE_BLURRY
+    ):
+        self.fast_model = fast_model
+        self.confidence_threshold = confidence_threshold
+        self.escalate_blurry = escalate_blurry
+
+    def needs_escalation(self, answer: StudentAnswer) -> bool:
+        if answer.confidence < self.confidence_threshold:
+            return True
+        return self.escalate_blurry and answer.is_blurry
+
+    def blanks_to_escalate(self, answers: List[StudentAnswer]) -> List[BlankKey]:
+        """需要交给主模型的空，按题号、小题号、空号排序"""
+        return sorted({
+            (answer.question_number, answer.part_number, answer.blank_number)
+            for answer in answers
+            if self.needs_escalation(answer)
+        })
+
+
+class CascadeStats:
+    """累计的分级识别统计，线程安全；各级耗时见耗时统计中的cascade_fast与escalate阶段"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.papers = 0
+            self.fast_only = 0  # 快速模型即可确定的试卷
+            self.fallback = 0  # 快速模型没有识别出答案，整卷交给主模型的试卷
+            self.blanks = 0
+            self.escalated = 0  # 交给主模型的空
+            self.resolved = 0  # 主模型返回了结果的空
+
+    def record(self, blanks: int, escalated: int = 0, resolved: int = 0, fallback: bool = False):
+        with self._lock:
+            self.papers += 1
+            self.blanks += blanks
+            self.escalated += escalated
+            self.resolved += resolved
+            if fallback:
+                self.fallback += 1
+            elif not escalated:
+                self.fast_only += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "papers": self.papers,
+                "fast_only": self.fast_only,
+                "fallback": self.fallback,
+                "blanks": self.blanks,
+                "escalated": self.escalated,
+                "resolved": self.resolved,
+                "paper_hit_rate": self.fast_only / self.papers if self.papers else 0.0,
+                "blank_hit_rate": 1 - self.escalated / self.blanks if self.blanks else 0.0,
+            }
+
+    def describe(self) -> str:
+        summary = self.summary()
+        return (
+            f"快速模型独立完成 {summary['fast_only']}/{summary['papers']} 份（{summary['paper_hit_rate']:.1%}），"
+            f"{summary['blanks']} 个空中 {summary['escalated']} 个交给主模型"
+            f"（快速模型命中率 {summary['blank_hit_rate']:.1%}），整卷回退 {summary['fallback']} 份"
+        )
+
+
+cascade_stats = CascadeStats()
+
+_cascade_policy: Optional[CascadePolicy] = None
+_cascade_policy_lock = threading.Lock()
+
+
+def get_cascade_policy() -> Optional[CascadePolicy]:
+    """获取进程内共享的分级识别策略，未开启时返回None"""
+    global _cascade_policy
+    if not MODEL_CASCADE_ENABLED:
+        return None
+    with _cascade_policy_lock:
+        if _cascade_policy is None:
+            _cascade_policy = CascadePolicy()
+    return _cascade_policy
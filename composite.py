@@ -0,0 +1,132 @@
+import io
+import threading
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from config import (
+    COMPOSITE_MAX_TILES,
+    COMPOSITE_MAX_SIDE,
+    COMPOSITE_MAX_BYTES,
+)
+
+# 每块上方编号栏的高度与块之间的分隔线宽度（像素）
+_LABEL_HEIGHT = 48
+_SEPARATOR = 6
+
+
+def _label_font() -> ImageFont.ImageFont:
+    try:
+        return ImageFont.load_default(size=36)
+    except TypeError:
+        # Pillow 10.1之前的默认字体不支持指定字号
+        return ImageFont.load_default()
+
+
+def plan_batches(
+    sizes: List[Tuple[int, int]],
+    nbytes: List[int],
+    max_tiles: int = COMPOSITE_MAX_TILES,
+    max_side: int = COMPOSITE_MAX_SIDE,
+    max_bytes: int = COMPOSITE_MAX_BYTES
+) -> List[List[int]]:
+    """
+    按图片尺寸把多张答题区域分批
+
+    各块纵向拼接，拼图的高、宽不超过max_side，各块字节数之和不超过max_bytes，
+    块数不超过max_tiles；图片较大时每批的块数自然减少。返回每批图片的下标。
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    width = height = total_bytes = 0
+    for index, ((tile_width, tile_height), size) in enumerate(zip(sizes, nbytes)):
+        tile_height += _LABEL_HEIGHT + _SEPARATOR
+        fits = (
+            len(current) < max_tiles
+            and max(width, tile_width) <= max_side
+            and height + tile_height <= max_side
+            and total_bytes + size <= max_bytes
+        )
+        if current and not fits:
+            batches.append(current)
+            current, width, height, total_bytes = [], 0, 0, 0
+        current.append(index)
+        width = max(width, tile_width)
+        height += tile_height
+        total_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_composite(images: List[Image.Image]) -> Image.Image:
+    """把多张答题区域纵向拼成一张图，每块上方标注从1开始的编号"""
+    width = max(image.width for image in images)
+    height = sum(image.height + _LABEL_HEIGHT + _SEPARATOR for image in images) - _SEPARATOR
+    composite = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(composite)
+    font = _label_font()
+    top = 0
+    for number, image in enumerate(images, 1):
+        draw.rectangle((0, top, width, top + _LABEL_HEIGHT - 1), fill=(230, 230, 230))
+        draw.text((12, top + 4), f"#{number}", fill="black", font=font)
+        composite.paste(image.convert("RGB"), (0, top + _LABEL_HEIGHT))
+        top += _LABEL_HEIGHT + image.height
+        if number < len(images):
+            draw.rectangle((0, top, width, top + _SEPARATOR - 1), fill="black")
+            top += _SEPARATOR
+    return composite
+
+
+def encode_composite(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class CompositeStats:
+    """累计的合并识别统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.tiles = 0
+            self.mapped = 0  # 按编号拆回且结果完整的试卷
+            self.fallback = 0  # 拆回失败、改为单独识别的试卷
+
+    def record_request(self, tiles: int):
+        with self._lock:
+            self.requests += 1
+            self.tiles += tiles
+
+    def record_result(self, mapped: bool):
+        with self._lock:
+            if mapped:
+                self.mapped += 1
+            else:
+                self.fallback += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tiles": self.tiles,
+                "mapped": self.mapped,
+                "fallback": self.fallback,
+                "tiles_per_request": self.tiles / self.requests if self.requests else 0.0,
+            }
+
+    def describe(self) -> str:
+        summary = self.summary()
+        return (
+            f"合并请求 {summary['requests']} 次，共 {summary['tiles']} 份"
+            f"（平均每次 {summary['tiles_per_request']:.1f} 份），"
+            f"拆回 {summary['mapped']} 份，改为单独识别 {summary['fallback']} 份"
+        )
+
+
+composite_stats = CompositeStats()
@@ -1,15 +1,163 @@
 from dotenv import load_dotenv
 import os
-from zhipuai import ZhipuAI
 
 # 加载环境变量
 load_dotenv()
 
 # 获取API密钥
 ZHIPUAI_API_KEY = os.getenv("ZHIPUAI_API_KEY")
+# 模型服务地址，未设置时使用智谱AI官方地址（基准测试时指向本地模拟服务）
+ZHIPUAI_BASE_URL = os.getenv("ZHIPUAI_BASE_URL")
 
-# 初始化智谱AI客户端
-client = ZhipuAI(api_key=ZHIPUAI_API_KEY)
+# 模型调用的重试由rate_limiter统一控制，SDK内部不再重试
+MODEL_SDK_MAX_RETRIES = 0
+
+# 识别后端：glm-4v（智谱AI）或stub（本地桩，不访问网络），客户端在第一次调用模型时才创建
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "glm-4v")
 
 # 模型配置
 MODEL_NAME = "glm-4v-plus-0111"
+
+# 流水线配置：各阶段之间的队列长度与并发数
+PIPELINE_FETCH_COUNT = 4  # 每次获取的试卷数量
+# 送复核或处理失败的试卷未提交，平台会继续把它们排在新试卷前面下发
+FETCH_COUNT = 4  # 逐份模式每次获取的试卷数量
+FETCH_MAX_COUNT = 64  # 返回的都是处理过的试卷时加大每次获取的数量，至多该值
+FETCH_IDLE_POLLS = 5  # 已取到平台上全部待阅试卷仍没有新试卷时按退避轮询，连续这么多次后停止
+FETCH_IDLE_BACKOFF = 2  # 轮询间隔（秒），每次翻倍
+FETCH_IDLE_BACKOFF_MAX = 30
+PIPELINE_QUEUE_SIZE = 8  # 阶段间队列长度，决定预取深度
+PIPELINE_DOWNLOAD_CONCURRENCY = 4  # 同时下载的图片数
+PIPELINE_RECOGNITION_CONCURRENCY = 4  # 同时识别的试卷数
+PIPELINE_SUBMIT_CONCURRENCY = 2  # 同时提交的试卷数
+
+# 多题识别：一张答题卡上的所有题目在一次模型调用中识别，失败的题目再逐题识别
+MULTI_QUESTION_RECOGNITION = True
+
+# 识别结果缓存
+RECOGNITION_CACHE_ENABLED = True
+RECOGNITION_CACHE_PATH = os.path.join("data", "recognition_cache.sqlite3")
+RECOGNITION_CACHE_MAX_ENTRIES = 100000
+RECOGNITION_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# 图片预处理：上传前裁剪、缩放并重新编码，减少上传字节数与视觉token
+IMAGE_PREPROCESS_ENABLED = True
+IMAGE_CROP_TO_REGION = True  # 按ScoringTask.pos裁剪到答题区域
+IMAGE_TRIM_MARGINS = True  # 去除四周空白
+IMAGE_GRAYSCALE = False
+IMAGE_MAX_SIDE = 1600  # 最长边像素上限
+IMAGE_OUTPUT_FORMAT = "JPEG"  # JPEG / WEBP / PNG
+IMAGE_QUALITY = 85
+
+# 图片内存模式：下载的图片不落盘，直接进入预处理与编码
+IMAGE_IN_MEMORY = True
+# 审计留存：内存模式下可选地把图片写入有容量上限的目录
+# 与落盘模式的data/images分开，超出上限时的删除不会波及阅卷日志续跑所需的图片
+IMAGE_SPOOL_ENABLED = False
+IMAGE_SPOOL_DIR = os.path.join("data", "spool")
+IMAGE_SPOOL_MAX_BYTES = 500 * 1024 * 1024
+
+# HTTP连接池与重试
+HTTP_POOL_SIZE = 16
+HTTP_CONNECT_TIMEOUT = 5  # 秒
+HTTP_READ_TIMEOUT = 30  # 秒
+HTTP_MAX_RETRIES = 3  # 5xx与连接错误的重试次数
+HTTP_BACKOFF_BASE = 0.5  # 退避基数（秒），实际等待时间带随机抖动
+HTTP_BACKOFF_MAX = 8
+
+# 模型调用限速：令牌桶 + AIMD并发控制
+MODEL_RATE_LIMIT_RPM = None  # 每分钟请求数上限，None表示不限，由AIMD并发控制根据限流自行找到速率；服务商有明确配额时再设置
+MODEL_INITIAL_CONCURRENCY = 2
+MODEL_MIN_CONCURRENCY = 1
+MODEL_MAX_CONCURRENCY = 16
+MODEL_THROTTLE_COOLDOWN = 2  # 被限流后的初始冷却时间（秒），连续限流时翻倍
+MODEL_THROTTLE_COOLDOWN_MAX = 60
+MODEL_MAX_RETRIES = 5  # 限流或临时错误时的重试次数
+MODEL_BACKOFF_BASE = 1  # 临时错误后的退避基数（秒），实际等待时间带随机抖动；限流由限速器冷却
+MODEL_BACKOFF_MAX = 30
+MODEL_COST_PER_1K_TOKENS = 0.01  # 每千token费用（元），用于估算成本
+
+# 流式识别：边接收边解析答案，标准答案中的空全部识别出后提前断开，不再等待剩余输出
+MODEL_STREAMING = True
+MODEL_STREAM_EARLY_ABORT = True
+
+# 分级识别：先用快速模型识别整张答题卡，只把置信度低或字迹模糊的空交给MODEL_NAME再识别
+MODEL_CASCADE_ENABLED = False
+MODEL_FAST_NAME = "glm-4v-flash"
+MODEL_CASCADE_CONFIDENCE = 0.8  # 快速模型给出的置信度低于该值的空交给主模型
+MODEL_CASCADE_ESCALATE_BLURRY = True  # 快速模型认为字迹模糊的空交给主模型
+
+# 合并识别（流水线模式）：把多名学生的答题区域拼成一张带编号的图片，一次模型调用识别，按编号拆回各自的结果
+COMPOSITE_BATCH_ENABLED = False
+COMPOSITE_MAX_TILES = 6  # 每张拼图最多的试卷数
+COMPOSITE_MAX_SIDE = 3200  # 拼图的最长边像素上限，图片较大时每批的试卷数相应减少
+COMPOSITE_MAX_BYTES = 4 * 1024 * 1024  # 拼入的图片字节数之和上限
+COMPOSITE_BATCH_WAIT = 0.2  # 凑批时最多等待的秒数
+
+# 补识别：识别结果缺少标准答案中的某些空时，只针对这些空再问一次模型，结果合并到已有答案中
+ANSWER_REPAIR_ENABLED = True
+ANSWER_REPAIR_MAX_BLANKS = 6  # 缺失的空超过该数量时不补识别（整体识别已基本失败）
+
+# 阅卷日志：逐份记录获取→下载→识别→评分→提交的状态变化，重启后从日志续跑，已提交的试卷不重复提交
+JOURNAL_ENABLED = True
+JOURNAL_PATH = os.path.join("data", "journal.jsonl")
+JOURNAL_FSYNC = True  # 每条记录写入后fsync，断电也不丢
+
+# 识别结果列式存储：每个答案一条定长记录，修改标准答案后用regrade.py重新评分，只重新提交得分有变化的试卷
+ANSWER_STORE_ENABLED = True
+ANSWER_STORE_DIR = os.path.join("data", "answer_store")
+
+# 答题卡快速分类：先学习答题卡的印刷内容，调用模型前按去除印刷内容后的笔迹识别空白卡，按感知哈希与逐像素核对复用近似答题卡的识别结果
+SHEET_CLASSIFIER_ENABLED = True
+SHEET_TEMPLATE_SAMPLES = 20  # 每组题目先用这么多张答题卡学习印刷内容，期间不分类（最多255）
+SHEET_TEMPLATE_INK_SHARE = 0.9  # 在不低于该比例的答题卡上都有墨迹的像素视为印刷内容
+SHEET_BLANK_INK_RATIO = 0.002  # 笔迹像素占比低于该值判为未作答，可参考运行结束时显示的笔迹比例分布调整
+# 近似答题卡复用识别结果（默认关闭）：复用的试卷一律送人工复核
+SHEET_DUPLICATE_ENABLED = False
+SHEET_DUPLICATE_SIMILARITY = 0.97  # 笔迹哈希相似度不低于该值的答题卡作为候选
+SHEET_DUPLICATE_MAX_DIFF = 0.02  # 候选的笔迹位图不同的像素不超过笔迹像素的该比例时才复用
+SHEET_HASH_SIZE = 16  # 差值哈希边长，共SHEET_HASH_SIZE²位
+SHEET_INDEX_MAX_ENTRIES = 10000  # 保留的已识别答题卡数量
+
+# 各阶段耗时统计：获取、下载、预处理、编码、模型调用、JSON解析、评分、提交
+METRICS_ENABLED = True
+METRICS_JSONL_PATH = None  # 如os.path.join("data", "metrics.jsonl")，逐条写入每份试卷各阶段的耗时
+METRICS_JSONL_MAX_BYTES = 50 * 1024 * 1024  # 超过后轮转为.1文件
+METRICS_PROMETHEUS_PORT = None  # 如9108，在该端口提供Prometheus格式的/metrics
+METRICS_PROFILE_PATH = None  # 如os.path.join("data", "hot_path.prof")，对CPU密集阶段做cProfile采样
+METRICS_PROFILE_STAGES = ("preprocess", "encode", "parse", "score")
+
+# 逐空试题分析：汇总各空的正确率、最常见的错误答案与置信度分布，内存与试卷数无关，用于及早发现标准答案的错误
+ITEM_ANALYSIS_ENABLED = True
+ITEM_ANALYSIS_TOP_K = 10  # 每个空保留的错误答案计数器个数（Space-Saving）
+ITEM_ANALYSIS_CONFIDENCE_BINS = 10  # 置信度分布的分箱数
+ITEM_ANALYSIS_MIN_ANSWERED = 30  # 作答数不少于该值时才判断是否可疑
+ITEM_ANALYSIS_SUSPECT_CORRECT_RATE = 0.3  # 正确率低于该值
+ITEM_ANALYSIS_SUSPECT_SHARE = 0.5  # 且最常见的错误答案至少占错误答案的该比例时，提示检查标准答案
+ITEM_ANALYSIS_SNAPSHOT_PATH = os.path.join("data", "item_analysis.json")
+ITEM_ANALYSIS_SNAPSHOT_EVERY = 50  # 每评分这么多份试卷写一次快照，可用python item_analysis.py查看
+
+# 无界面模式（高吞吐）：不逐份打印评分表格与模型原始输出，终端只显示定时刷新的汇总面板，逐份明细写入PAPER_LOG_PATH
+CONSOLE_HEADLESS = os.getenv("CONSOLE_HEADLESS", "").lower() in ("1", "true", "yes")
+CONSOLE_REFRESH_PER_SECOND = 2  # 面板每秒重绘次数
+PAPER_LOG_PATH = os.path.join("data", "paper_log.jsonl")
+PAPER_LOG_MAX_BYTES = 100 * 1024 * 1024  # 超过后轮转为.1文件
+
+# 分布式阅卷：协调进程从平台获取任务放入本地工作队列，多个阅卷进程/主机通过HTTP领取
+COORDINATOR_QUEUE_PATH = os.path.join("data", "work_queue.sqlite3")
+COORDINATOR_HOST = "0.0.0.0"
+COORDINATOR_PORT = 8765
+COORDINATOR_FETCH_COUNT = 4  # 每次向平台获取的试卷数量
+COORDINATOR_PREFETCH = 16  # 每个阅卷块在队列中保持的待领取任务数
+COORDINATOR_LEASE_SECONDS = 120  # 领取后未完成的任务在租约到期后重新分配
+COORDINATOR_MAX_ATTEMPTS = 3  # 单份试卷的最大识别次数；提交只在连接未建立时重试，其他提交错误转人工复核
+COORDINATOR_SUBMIT_CONCURRENCY = 2
+WORKER_THREADS = 4  # 每个阅卷进程同时处理的试卷数
+
+# 按置信度分流：可信的试卷立即自动提交，存疑的试卷进入人工复核队列，不阻塞阅卷
+ROUTING_CONFIDENCE_THRESHOLD = 0.8  # 任一答案的置信度低于该值时送复核
+ROUTING_REVIEW_BLURRY = True  # 有字迹模糊的答案时送复核
+ROUTING_REVIEW_CROSSED_OUT = True  # 有被划掉的答案时送复核
+ROUTING_REVIEW_INCOMPLETE = True  # 有只识别出部分空的小题时送复核
+ROUTING_REVIEW_BLANK_SHEET = True  # 快速分类判为空白（未调用模型）的答题卡送复核；设为False时直接提交0分
+REVIEW_QUEUE_PATH = os.path.join("data", "review_queue.jsonl")
@@ -0,0 +1,368 @@
+"""
+分布式阅卷的协调进程
+
+从阅卷平台获取多个阅卷块的任务放入本地工作队列（按task_key去重），
+通过HTTP把任务分配给阅卷进程（worker.py），收回评分结果后统一提交到平台。
+
+用法：
+    python coordinator.py --blocks data/blocks.json --cookie yx_sid=xxx --port 8765
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+
+from rich.console import Console
+
+from api_client import RetryPolicy, ScoringAPIClient
+from config import (
+    COORDINATOR_HOST,
+    COORDINATOR_PORT,
+    COORDINATOR_FETCH_COUNT,
+    COORDINATOR_PREFETCH,
+    COORDINATOR_SUBMIT_CONCURRENCY,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+)
+from main import store_answers
+from models import ScoringResult, StudentAnswer
+from routing import SUBMIT_UNCERTAIN, RoutingDecision, get_review_queue, routing_stats
+from work_queue import (
+    BlockConfig,
+    QueuedTask,
+    WorkQueue,
+    load_blocks,
+    PENDING,
+    LEASED,
+    SCORED,
+    SUBMITTED,
+    REVIEW,
+    FAILED,
+)
+
+console = Console()
+
+
+class Coordinator:
+    """
+    协调进程
+
+    每个阅卷块的待领取任务少于prefetch时才向平台获取，避免占用平台上过多试卷；
+    平台返回空列表，或只返回已入队的试卷且该块没有在途任务时，认为该块已阅完。
+    """
+
+    def __init__(
+        self,
+        api_client: ScoringAPIClient,
+        blocks: List[BlockConfig],
+        queue: Optional[WorkQueue] = None,
+        fetch_count: int = COORDINATOR_FETCH_COUNT,
+        prefetch: int = COORDINATOR_PREFETCH,
+        submit_concurrency: int = COORDINATOR_SUBMIT_CONCURRENCY,
+        host: str = COORDINATOR_HOST,
+        port: int = COORDINATOR_PORT
+    ):
+        self.api_client = api_client
+        self.blocks = blocks
+        self.queue = queue or WorkQueue()
+        self.fetch_count = fetch_count
+        self.prefetch = prefetch
+        self.submit_concurrency = submit_concurrency
+        self.host = host
+        self.port = port
+        self.workers: Set[str] = set()
+        self.duplicate_results = 0
+        self._exhausted: Set[Tuple[str, str]] = set()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # ---------- 从平台获取 ----------
+
+    def _fetch_block(self, block: BlockConfig) -> bool:
+        """为一个阅卷块补充任务，返回是否获取到了新任务"""
+        counts = self.queue.counts(block.subject_id, block.block_id)
+        if counts[PENDING] >= self.prefetch:
+            return False
+        tasks = self.api_client.get_tasks(block.subject_id, block.block_id, self.fetch_count)
+        if not tasks:
+            console.print(f"[yellow]阅卷块 {block.subject_id}/{block.block_id} 没有更多待阅试卷[/yellow]")
+            self._exhausted.add(block.key)
+            return False
+        added = self.queue.enqueue(block.subject_id, block.block_id, tasks)
+        if added == 0 and counts[PENDING] + counts[LEASED] + counts[SCORED] == 0:
+            # 平台只下发已处理过的试卷且没有在途任务，剩下的都是失败的试卷
+            console.print(f"[yellow]阅卷块 {block.subject_id}/{block.block_id} 剩余试卷均已处理过[/yellow]")
+            self._exhausted.add(block.key)
+        return added > 0
+
+    def _fetch_loop(self):
+        while not self._stop.is_set():
+            fetched = False
+            for block in self.blocks:
+                if block.key in self._exhausted:
+                    continue
+                try:
+                    fetched = self._fetch_block(block) or fetched
+                except Exception as e:
+                    console.print(f"[red]获取试卷时发生错误 {block.subject_id}/{block.block_id}: {str(e)}[/red]")
+            if len(self._exhausted) == len(self.blocks):
+                break
+            if not fetched:
+                self._stop.wait(0.5)
+
+    # ---------- 提交到平台 ----------
+
+    def _submit_loop(self):
+        owner = f"submitter-{uuid.uuid4().hex[:8]}"
+        failures: Dict[str, int] = {}
+        while not self._stop.is_set():
+            items = self.queue.take_scored(owner, 1)
+            if not items:
+                if self.finished():
+                    break
+                self._stop.wait(0.2)
+                continue
+            queued, result = items[0]
+            try:
+                self.api_client.submit_score(
+                    subject_id=queued.subject_id,
+                    block_id=queued.block_id,
+                    task_key=queued.task_key,
+                    scores=result["api_scores"]
+                )
+                self.queue.mark_submitted(queued.task_key)
+                failures.pop(queued.task_key, None)
+                self._store_answers(queued, result)
+                console.print(
+                    f"[green]试卷 {queued.task.kaohao} 已提交，得分: {result.get('score')}，"
+                    f"阅卷进程: {result.get('worker_id')}[/green]"
+                )
+            except Exception as e:
+                if not RetryPolicy.is_connect_error(e):
+                    # 请求已发出，平台可能已记录该分数，重新提交会重复提交
+                    failures.pop(queued.task_key, None)
+                    self._submit_uncertain(queued, result, e)
+                    continue
+                failures[queued.task_key] = failures.get(queued.task_key, 0) + 1
+                delay = min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** failures[queued.task_key]))
+                self.queue.retry_submit(queued.task_key, str(e), delay)
+                console.print(f"[red]提交试卷 {queued.task.kaohao} 失败，{delay:.1f}秒后重试: {str(e)}[/red]")
+
+    def _submit_uncertain(self, queued: QueuedTask, result: Dict, error: Exception):
+        """提交结果未知的试卷转人工复核，由复核人员在平台上核对后决定是否再次提交"""
+        decision = RoutingDecision(
+            route=REVIEW,
+            reasons=[SUBMIT_UNCERTAIN],
+            details=[f"提交时出错，平台可能已记录该分数，请先在平台上核对: {str(error)}"],
+        )
+        get_review_queue().put(
+            queued.task_key,
+            queued.task.kaohao,
+            queued.subject_id,
+            queued.block_id,
+            ScoringResult(**result["result"]),
+            result["api_scores"],
+            decision
+        )
+        self.queue.mark_review(queued.task_key, str(error))
+        self._store_answers(queued, result, pending_review=True)
+        console.print(f"[red]提交试卷 {queued.task.kaohao} 失败，已转人工复核: {str(error)}[/red]")
+
+    @staticmethod
+    def _store_answers(queued: QueuedTask, result: Dict, pending_review: bool = False):
+        """把阅卷进程交回的识别结果写入识别结果存储"""
+        if "answers" not in result:
+            return
+        store_answers(
+            queued.task_key,
+            [StudentAnswer(**answer) for answer in result["answers"]],
+            result["api_scores"],
+            queued.subject_id,
+            queued.block_id,
+            queued.task.kaohao,
+            pending_review,
+        )
+
+    def finished(self) -> bool:
+        """所有阅卷块都已阅完，且没有待处理、在途或待提交的任务"""
+        if len(self._exhausted) < len(self.blocks):
+            return False
+        counts = self.queue.counts()
+        return counts[PENDING] + counts[LEASED] + counts[SCORED] == 0
+
+    # ---------- 对阅卷进程的接口 ----------
+
+    def handle_lease(self, payload: Dict) -> Dict:
+        worker_id = payload["worker_id"]
+        with self._stats_lock:
+            self.workers.add(worker_id)
+        tasks = self.queue.lease(worker_id, int(payload.get("count", 1)))
+        return {
+            "tasks": [task.model_dump(mode="json", by_alias=True) for task in tasks],
+            "finished": not tasks and self.finished(),
+        }
+
+    def handle_complete(self, payload: Dict) -> Dict:
+        result = dict(payload["result"])
+        result["worker_id"] = payload["worker_id"]
+        needs_review = result.get("route") == REVIEW
+        accepted = self.queue.complete(payload["task_key"], result, REVIEW if needs_review else SCORED)
+        if not accepted:
+            with self._stats_lock:
+                self.duplicate_results += 1
+            return {"accepted": False}
+
+        if "decision" in result:
+            decision = RoutingDecision(**result["decision"])
+            routing_stats.record(decision)
+            if needs_review:
+                queued = self.queue.get(payload["task_key"])
+                get_review_queue().put(
+                    queued.task_key,
+                    queued.task.kaohao,
+                    queued.subject_id,
+                    queued.block_id,
+                    ScoringResult(**result["result"]),
+                    result["api_scores"],
+                    decision
+                )
+                self._store_answers(queued, result, pending_review=True)
+        return {"accepted": True}
+
+    def handle_fail(self, payload: Dict) -> Dict:
+        requeued = self.queue.fail(payload["task_key"], payload["worker_id"], payload.get("error", ""))
+        return {"ok": requeued}
+
+    def handle_stats(self) -> Dict:
+        return {
+            "counts": self.queue.counts(),
+            "workers": sorted(self.workers),
+            "duplicate_results": self.duplicate_results,
+            "exhausted_blocks": [f"{subject}/{block}" for subject, block in sorted(self._exhausted)],
+            "finished": self.finished(),
+        }
+
+    def _handler_class(self):
+        coordinator = self
+        routes = {
+            "/lease": coordinator.handle_lease,
+            "/complete": coordinator.handle_complete,
+            "/fail": coordinator.handle_fail,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send_json(200, coordinator.handle_stats())
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                handler = routes.get(self.path)
+                if handler is None:
+                    self._send_json(404, {"error": "not found"})
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    self._send_json(200, handler(payload))
+                except Exception as e:
+                    self._send_json(400, {"error": str(e)})
+
+        return Handler
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "Coordinator":
+        """启动HTTP接口、获取线程与提交线程"""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self._threads = [threading.Thread(target=self._server.serve_forever, daemon=True)]
+        self._threads.append(threading.Thread(target=self._fetch_loop, daemon=True))
+        self._threads.extend(
+            threading.Thread(target=self._submit_loop, daemon=True)
+            for _ in range(self.submit_concurrency)
+        )
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def wait(self, poll_interval: float = 1.0):
+        """等待全部试卷处理完"""
+        while not self.finished():
+            time.sleep(poll_interval)
+        # 给阅卷进程留出取到finished标记的时间
+        time.sleep(poll_interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def report(self):
+        counts = self.queue.counts()
+        console.print(
+            f"\n[bold cyan]协调进程结束：已提交 {counts[SUBMITTED]} 份，送复核 {counts[REVIEW]} 份，"
+            f"失败 {counts[FAILED]} 份，"
+            f"阅卷进程 {len(self.workers)} 个，重复结果 {self.duplicate_results} 份（已忽略）[/bold cyan]"
+        )
+        console.print(f"[cyan]分流结果：{routing_stats.describe()}[/cyan]")
+
+
+def parse_cookies(values: List[str]) -> Dict[str, str]:
+    cookies = {}
+    for value in values or []:
+        name, _, content = value.partition("=")
+        cookies[name.strip()] = content.strip()
+    return cookies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式阅卷协调进程")
+    parser.add_argument("--blocks", required=True, help="阅卷块配置文件（JSON数组）")
+    parser.add_argument("--base-url", default="https://yue.haofenshu.com")
+    parser.add_argument("--cookie", action="append", help="平台cookie，形如yx_sid=xxx，可重复")
+    parser.add_argument("--queue", help="工作队列文件，默认为COORDINATOR_QUEUE_PATH")
+    parser.add_argument("--host", default=COORDINATOR_HOST)
+    parser.add_argument("--port", type=int, default=COORDINATOR_PORT)
+    args = parser.parse_args()
+
+    blocks = load_blocks(args.blocks)
+    queue = WorkQueue(args.queue) if args.queue else WorkQueue()
+    with ScoringAPIClient(args.base_url, parse_cookies(args.cookie)) as api_client:
+        coordinator = Coordinator(api_client, blocks, queue, host=args.host, port=args.port).start()
+        console.print(f"[bold cyan]协调进程已启动: {coordinator.url}，阅卷块 {len(blocks)} 个[/bold cyan]")
+        try:
+            coordinator.wait()
+        except KeyboardInterrupt:
+            console.print("[yellow]已中断，未完成的任务保留在队列中，重启后继续[/yellow]")
+        finally:
+            coordinator.stop()
+            coordinator.report()
+            queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+无界面模式：汇总面板与逐份日志
+
+高吞吐阅卷时不再逐份打印评分表格、平台返回数据与模型原始输出，终端上只保留一个定时刷新的汇总面板
+（速度、队列深度、错误数、得分分布），逐份的明细写入结构化日志PAPER_LOG_PATH（JSONL）。
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.table import Table
+
+from config import (
+    CONSOLE_HEADLESS,
+    CONSOLE_REFRESH_PER_SECOND,
+    PAPER_LOG_PATH,
+    PAPER_LOG_MAX_BYTES,
+)
+from item_analysis import get_item_analyzer
+from metrics import current_paper
+from rate_limiter import get_model_limiter
+
+console = Console()
+
+# 面板上的速度按最近这段时间内完成的试卷计算（秒）
+_RECENT_WINDOW = 60
+# 得分分布最多显示的行数，不同分数更多时按区间合并
+_HISTOGRAM_ROWS = 12
+_HISTOGRAM_WIDTH = 30
+
+_headless = CONSOLE_HEADLESS
+
+
+def set_headless(enabled: bool):
+    """开启或关闭无界面模式，需在开始阅卷前设置"""
+    global _headless
+    _headless = enabled
+
+
+def is_headless() -> bool:
+    return _headless
+
+
+class PaperLog:
+    """逐份试卷的结构化日志，每行一个JSON事件，写入后立即flush，线程安全，超过max_bytes后轮转为.1文件"""
+
+    def __init__(self, path: str = PAPER_LOG_PATH, max_bytes: int = PAPER_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, event: str, **fields):
+        line = json.dumps(
+            {"time": round(time.time(), 3), "paper": current_paper.get(), "event": event, **fields},
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            # 逐行写出：无界面模式下这是每份试卷唯一的记录，进程崩溃或被终止时不能丢在缓冲区里
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._file.close()
+                os.replace(self.path, self.path + ".1")
+                self._file = None
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_paper_log: Optional[PaperLog] = None
+_paper_log_lock = threading.Lock()
+
+
+def get_paper_log() -> PaperLog:
+    """获取进程内共享的逐份日志"""
+    global _paper_log
+    with _paper_log_lock:
+        if _paper_log is None:
+            _paper_log = PaperLog()
+    return _paper_log
+
+
+def report(message: str, style: str = "", event: str = "message", **fields):
+    """
+    逐份试卷的过程信息
+
+    无界面模式下连同fields写入逐份日志，否则按style打印到终端。
+    """
+    if _headless:
+        get_paper_log().write(event, message=message.strip(), **fields)
+    elif style:
+        console.print(f"[{style}]{message}[/{style}]")
+    else:
+        console.print(message)
+
+
+def detail(message: str, payload=None):
+    """调试明细（平台返回数据、模型原始输出等）：无界面模式下只写入逐份日志"""
+    if _headless:
+        fields = {} if payload is None else {"payload": payload}
+        get_paper_log().write("detail", message=message.strip(), **fields)
+    elif payload is None:
+        print(message)
+    else:
+        print(message, payload)
+
+
+class DashboardStats:
+    """面板上的累计统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.submitted = 0
+            self.reviewed = 0
+            self.failed = 0
+            self.skipped = 0
+            self.errors: Counter = Counter()  # 出错的阶段到次数
+            self.scores: Counter = Counter()  # 总分到试卷数
+            self._finished = deque()  # 最近完成（提交或送复核）的时间
+
+    def _finish(self, score: float):
+        now = time.time()
+        self.scores[score] += 1
+        self._finished.append(now)
+        while self._finished and self._finished[0] < now - _RECENT_WINDOW:
+            self._finished.popleft()
+
+    def record_submitted(self, score: float):
+        with self._lock:
+            self.submitted += 1
+            self._finish(score)
+
+    def record_reviewed(self, score: float):
+        with self._lock:
+            self.reviewed += 1
+            self._finish(score)
+
+    def record_failed(self, stage: str):
+        with self._lock:
+            self.failed += 1
+            self.errors[stage] += 1
+
+    def record_error(self, stage: str):
+        """不针对单份试卷的错误，如获取试卷失败"""
+        with self._lock:
+            self.errors[stage] += 1
+
+    def record_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            now = time.time()
+            elapsed = now - self.started_at
+            finished = self.submitted + self.reviewed
+            recent = sum(1 for finished_at in self._finished if finished_at >= now - _RECENT_WINDOW)
+            return {
+                "elapsed": elapsed,
+                "submitted": self.submitted,
+                "reviewed": self.reviewed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "papers_per_minute": finished * 60 / elapsed if elapsed > 0 else 0.0,
+                "recent_per_minute": recent * 60 / min(elapsed, _RECENT_WINDOW) if elapsed > 0 else 0.0,
+                "errors": dict(self.errors),
+                "scores": dict(self.scores),
+            }
+
+
+dashboard_stats = DashboardStats()
+
+
+def score_histogram(scores: Dict[float, int], rows: int = _HISTOGRAM_ROWS) -> List[Tuple[str, int]]:
+    """得分分布：不同分数不超过rows个时逐个列出，否则合并为rows个等宽区间"""
+    if not scores:
+        return []
+    values = sorted(scores)
+    if len(values) <= rows:
+        return [(f"{value:g}", scores[value]) for value in values]
+    low, high = values[0], values[-1]
+    width = (high - low) / rows
+    counts = [0] * rows
+    for value, count in scores.items():
+        counts[min(int((value - low) / width), rows - 1)] += count
+    return [
+        (f"{low + index * width:g}~{low + (index + 1) * width:g}", count)
+        for index, count in enumerate(counts)
+    ]
+
+
+class Dashboard:
+    """
+    无界面模式的汇总面板
+
+    用rich.Live按refresh_per_second定时重绘，重绘时才读取统计，阅卷线程只更新计数。
+    queue_depths返回各阶段队列中等待的试卷数（流水线模式）。
+    """
+
+    def __init__(
+        self,
+        title: str = "阅卷进度",
+        queue_depths: Optional[Callable[[], Dict[str, int]]] = None,
+        refresh_per_second: float = CONSOLE_REFRESH_PER_SECOND,
+        stats: DashboardStats = dashboard_stats
+    ):
+        self.title = title
+        self.queue_depths = queue_depths
+        self.stats = stats
+        self._live = Live(
+            console=console,
+            refresh_per_second=refresh_per_second,
+            get_renderable=self.render,
+        )
+
+    def render(self) -> Group:
+        summary = self.stats.summary()
+        table = Table(title=self.title, show_header=False)
+        table.add_column("项目", style="cyan")
+        table.add_column("数值", justify="right")
+        minutes, seconds = divmod(int(summary["elapsed"]), 60)
+        table.add_row("运行时间", f"{minutes}:{seconds:02d}")
+        table.add_row(
+            "速度（份/分钟）",
+            f"{summary['papers_per_minute']:.1f}（最近1分钟 {summary['recent_per_minute']:.1f}）"
+        )
+        table.add_row("已提交", str(summary["submitted"]))
+        table.add_row("送复核", str(summary["reviewed"]))
+        table.add_row("失败", f"[red]{summary['failed']}[/red]" if summary["failed"] else "0")
+        if summary["skipped"]:
+            table.add_row("之前已完成", str(summary["skipped"]))
+        if self.queue_depths is not None:
+            table.add_row("队列", "  ".join(f"{name} {depth}" for name, depth in self.queue_depths().items()))
+        if summary["errors"]:
+            table.add_row(
+                "错误",
+                "[red]" + "  ".join(f"{stage} {count}" for stage, count in sorted(summary["errors"].items())) + "[/red]"
+            )
+        analyzer = get_item_analyzer()
+        suspects = analyzer.suspects() if analyzer is not None else []
+        if suspects:
+            table.add_row("疑似标准答案有误", "[bold red]" + "  ".join(item.key for item in suspects) + "[/bold red]")
+        model_stats = get_model_limiter().stats()
+        table.add_row(
+            "模型调用",
+            f"{model_stats['total_requests']} 次，限流 {model_stats['total_throttled']} 次，"
+            f"并发上限 {model_stats['concurrency_limit']}"
+        )
+
+        histogram = Table(title="得分分布", show_header=False)
+        histogram.add_column("得分", style="cyan", justify="right")
+        histogram.add_column("份数", justify="right")
+        histogram.add_column("")
+        rows = score_histogram(summary["scores"])
+        peak = max((count for _, count in rows), default=0)
+        for label, count in rows:
+            histogram.add_row(label, str(count), "█" * max(1, round(count * _HISTOGRAM_WIDTH / peak)) if count else "")
+        return Group(table, histogram)
+
+    def __enter__(self) -> "Dashboard":
+        self.stats.reset()
+        self._live.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._live.stop()
+        get_paper_log().flush()
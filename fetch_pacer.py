@@ -0,0 +1,58 @@
+"""
+获取待阅试卷的节奏控制
+
+送复核或处理失败的试卷在提交前会被平台重复下发，且排在新试卷前面。
+返回的都是处理过的试卷时不能据此认为已阅完：先加大获取数量越过这些试卷，
+已取到平台上的全部待阅试卷仍没有新试卷时再按退避轮询，连续多次后才停止。
+"""
+from typing import Optional
+
+from config import (
+    FETCH_MAX_COUNT,
+    FETCH_IDLE_POLLS,
+    FETCH_IDLE_BACKOFF,
+    FETCH_IDLE_BACKOFF_MAX,
+)
+
+
+class FetchPacer:
+    """根据每次获取的结果决定下次获取的数量与等待时间"""
+
+    def __init__(
+        self,
+        base_count: int,
+        max_count: int = FETCH_MAX_COUNT,
+        max_idle_polls: int = FETCH_IDLE_POLLS,
+        backoff: float = FETCH_IDLE_BACKOFF,
+        backoff_max: float = FETCH_IDLE_BACKOFF_MAX
+    ):
+        self.base_count = base_count
+        self.max_count = max(max_count, base_count)
+        self.max_idle_polls = max_idle_polls
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.count = base_count  # 下次获取的数量
+        self.idle_polls = 0
+
+    def update(self, returned: int, new: int, busy: bool = False, busy_interval: float = 0.5) -> Optional[float]:
+        """
+        记录一次获取的结果：返回了returned份，其中new份是新试卷
+
+        返回下次获取前的等待时间（秒），None表示应停止获取。
+        busy表示还有在途试卷，它们提交后平台才会不再下发，这时只等待不计入空轮询。
+        """
+        requested = self.count
+        # 处理过的试卷排在前面，多取这么多份才能取到同样数量的新试卷
+        self.count = min(self.max_count, self.base_count + returned - new)
+        if new:
+            self.idle_polls = 0
+            return 0.0
+        if returned >= requested and self.count > requested:
+            # 平台上可能还有更多试卷，加大数量立即再取
+            return 0.0
+        if busy:
+            return busy_interval
+        self.idle_polls += 1
+        if self.idle_polls >= self.max_idle_polls:
+            return None
+        return min(self.backoff_max, self.backoff * (2 ** (self.idle_polls - 1)))
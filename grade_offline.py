@@ -0,0 +1,274 @@
+"""
+离线批量阅卷
+
+不依赖阅卷平台，从图片目录或已识别答案的JSONL文件批量评分，结果边评边写入CSV/JSONL。
+
+用法示例：
+    python grade_offline.py --images data/sheets --questions 28 --output results.csv
+    python grade_offline.py --answers answers.jsonl --output results.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from rich.console import Console
+
+from answer_checker import AnswerChecker
+from models import AnswerSheet, StudentAnswer
+
+console = Console()
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+# 评分进程内的评分器，由进程池初始化函数创建
+_worker_checker: Optional[AnswerChecker] = None
+
+
+def _init_scoring_worker(standard_answer_data: Dict):
+    """评分进程初始化：每个进程只编译一次标准答案"""
+    global _worker_checker
+    _worker_checker = AnswerChecker(AnswerSheet(**standard_answer_data))
+
+
+def _score_chunk(chunk: List[Tuple[str, List[Dict]]]) -> List[Dict]:
+    """在评分进程中批量评分一组学生"""
+    answers_by_student = {
+        kaohao: [StudentAnswer(**answer) for answer in answers]
+        for kaohao, answers in chunk
+    }
+    result = _worker_checker.check_batch(answers_by_student)
+    part_keys = [f"{question}.{part}" for question, part in result.part_keys]
+    records = []
+    for row, kaohao in enumerate(result.student_ids):
+        record = {
+            "kaohao": kaohao,
+            "total_score": int(result.totals[row]),
+            "total_possible_score": int(result.total_possible[row]),
+        }
+        for column, key in enumerate(part_keys):
+            record[key] = int(result.scores[row, column])
+        records.append(record)
+    return records
+
+
+class ResultWriter:
+    """按输出文件扩展名写入CSV或JSONL，每条结果立即落盘"""
+
+    def __init__(self, path: str, part_keys: List[str]):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._csv_writer = None
+        if self.is_csv:
+            fieldnames = ["kaohao", "total_score", "total_possible_score"] + part_keys
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+            self._csv_writer.writeheader()
+
+    def write(self, records: List[Dict]):
+        for record in records:
+            if self._csv_writer is not None:
+                self._csv_writer.writerow(record)
+            else:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def iter_answer_file(path: str) -> Iterator[Tuple[str, List[Dict]]]:
+    """读取已识别答案的JSONL，每行形如{"kaohao": ..., "answers": [...]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            kaohao = str(record.get("kaohao") or record.get("task_key") or line_number)
+            yield kaohao, record.get("answers", [])
+
+
+def iter_recognized_images(
+    directory: str,
+    question_numbers: List[int],
+    workers: int,
+    failures: List[str]
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """在有界线程池中识别目录下的答题卡图片，按完成顺序产出结果"""
+    # 只有识别模式才需要模型客户端
+    from main import process_answer_sheet
+
+    paths = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+    def recognize(path: str) -> Optional[List[Dict]]:
+        answers = process_answer_sheet(path, question_numbers)
+        if answers is None:
+            return None
+        return [answer.model_dump() for answer in answers]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: Set[Future] = set()
+        # 每个任务对应的考号，识别出错时据此记录失败的图片
+        kaohaos: Dict[Future, str] = {}
+
+        def submit(path: str):
+            future = executor.submit(recognize, path)
+            kaohaos[future] = os.path.splitext(os.path.basename(path))[0]
+            pending.add(future)
+
+        path_iter = iter(paths)
+        # 在途任务数不超过线程数的两倍，避免一次性提交全部图片
+        for path in path_iter:
+            submit(path)
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            pending.difference_update(done)
+            for future in done:
+                kaohao = kaohaos.pop(future)
+                try:
+                    answers = future.result()
+                except Exception as e:
+                    failures.append(kaohao)
+                    console.print(f"[red]{kaohao}: 识别失败: {str(e)}[/red]")
+                    continue
+                if answers is None:
+                    failures.append(kaohao)
+                    console.print(f"[red]{kaohao}: 未能识别到任何答案[/red]")
+                    continue
+                yield kaohao, answers
+            for path in path_iter:
+                submit(path)
+                if len(pending) >= workers * 2:
+                    break
+
+
+def grade(
+    standard_answer: AnswerSheet,
+    source: Iterator[Tuple[str, List[Dict]]],
+    output_path: str,
+    scoring_processes: int,
+    chunk_size: int,
+    answers_output_path: Optional[str] = None
+) -> int:
+    """把答案分块交给评分进程池，结果完成即写出，返回评分的试卷数"""
+    part_keys = [
+        f"{question.number}.{part.number}"
+        for question in standard_answer.questions
+        for part in question.parts
+    ]
+    writer = ResultWriter(output_path, part_keys)
+    answers_file = open(answers_output_path, "w", encoding="utf-8") if answers_output_path else None
+    graded = 0
+
+    def collect(done: Set[Future]):
+        nonlocal graded
+        for future in done:
+            try:
+                records = future.result()
+            except Exception as e:
+                console.print(f"[red]评分失败: {str(e)}[/red]")
+                continue
+            writer.write(records)
+            graded += len(records)
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=scoring_processes,
+            initializer=_init_scoring_worker,
+            initargs=(standard_answer.model_dump(),)
+        ) as executor:
+            futures: Set[Future] = set()
+            chunk: List[Tuple[str, List[Dict]]] = []
+            for kaohao, answers in source:
+                if answers_file is not None:
+                    answers_file.write(
+                        json.dumps({"kaohao": kaohao, "answers": answers}, ensure_ascii=False) + "\n"
+                    )
+                chunk.append((kaohao, answers))
+                if len(chunk) < chunk_size:
+                    continue
+                futures.add(executor.submit(_score_chunk, chunk))
+                chunk = []
+
+                # 写出已完成的评分块；在途块过多时等待，避免读得比评得快时占满内存
+                done = {future for future in futures if future.done()}
+                if len(futures) - len(done) >= scoring_processes * 2:
+                    more_done, _ = wait(futures - done, return_when=FIRST_COMPLETED)
+                    done |= more_done
+                collect(done)
+                futures -= done
+
+            if chunk:
+                futures.add(executor.submit(_score_chunk, chunk))
+            done, _ = wait(futures)
+            collect(done)
+    finally:
+        writer.close()
+        if answers_file is not None:
+            answers_file.close()
+    return graded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线批量阅卷")
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument("--images", help="答题卡图片目录，文件名（不含扩展名）作为考号")
+    source_group.add_argument("--answers", help="已识别答案的JSONL文件")
+    parser.add_argument("--standard-answer", default="./data/standard_answer.json", help="标准答案文件")
+    parser.add_argument("--questions", type=int, nargs="+", help="识别的题号，默认为标准答案中的全部题目")
+    parser.add_argument("--output", required=True, help="评分结果文件，.csv或.jsonl")
+    parser.add_argument("--save-answers", help="识别模式下把识别结果另存为JSONL，便于之后重新评分")
+    parser.add_argument("--recognition-workers", type=int, help="识别线程数，默认为PIPELINE_RECOGNITION_CONCURRENCY")
+    parser.add_argument("--scoring-processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256, help="每个评分块的学生数")
+    args = parser.parse_args()
+
+    with open(args.standard_answer, "r", encoding="utf-8") as f:
+        standard_answer = AnswerSheet(**json.load(f))
+    question_numbers = args.questions or [question.number for question in standard_answer.questions]
+
+    failures: List[str] = []
+    if args.images:
+        from config import PIPELINE_RECOGNITION_CONCURRENCY
+        workers = args.recognition_workers or PIPELINE_RECOGNITION_CONCURRENCY
+        source = iter_recognized_images(args.images, question_numbers, workers, failures)
+    else:
+        source = iter_answer_file(args.answers)
+
+    started_at = time.time()
+    graded = grade(
+        standard_answer,
+        source,
+        args.output,
+        args.scoring_processes,
+        args.chunk_size,
+        args.save_answers if args.images else None
+    )
+    elapsed = time.time() - started_at
+
+    console.print(
+        f"[bold cyan]完成：评分 {graded} 份，识别失败 {len(failures)} 份，"
+        f"用时 {elapsed:.1f} 秒，"
+        f"速度 {graded / elapsed if elapsed > 0 else 0:.1f} 份/秒 "
+        f"({graded * 60 / elapsed if elapsed > 0 else 0:.0f} 份/分钟)[/bold cyan]"
+    )
+    console.print(f"[green]结果已写入: {args.output}[/green]")
+    if failures:
+        console.print(f"[red]识别失败的考号: {' '.join(sorted(failures))}[/red]")
+
+
+if __name__ == "__main__":
+    main()
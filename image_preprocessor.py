@@ -0,0 +1,221 @@
+import io
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+from pydantic import BaseModel
+
+from config import (
+    IMAGE_PREPROCESS_ENABLED,
+    IMAGE_CROP_TO_REGION,
+    IMAGE_TRIM_MARGINS,
+    IMAGE_GRAYSCALE,
+    IMAGE_MAX_SIDE,
+    IMAGE_OUTPUT_FORMAT,
+    IMAGE_QUALITY,
+)
+
+# 输出格式对应的MIME类型
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+}
+
+# 裁剪空白边距时的阈值与留白
+_INK_THRESHOLD = 200
+_TRIM_PADDING = 8
+
+
+class PreprocessOptions(BaseModel):
+    """图片预处理配置"""
+    enabled: bool = IMAGE_PREPROCESS_ENABLED
+    crop_to_region: bool = IMAGE_CROP_TO_REGION  # 按ScoringTask.pos裁剪到答题区域
+    trim_margins: bool = IMAGE_TRIM_MARGINS  # 去除四周空白
+    grayscale: bool = IMAGE_GRAYSCALE
+    max_side: Optional[int] = IMAGE_MAX_SIDE  # 最长边上限，None表示不缩放
+    output_format: str = IMAGE_OUTPUT_FORMAT  # JPEG / WEBP / PNG
+    quality: int = IMAGE_QUALITY
+
+
+class PreprocessResult(BaseModel):
+    """预处理结果"""
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    processed_bytes: int
+    original_size: Tuple[int, int]
+    processed_size: Tuple[int, int]
+
+
+class PreprocessStats:
+    """累计的预处理字节统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def record(self, result: PreprocessResult):
+        with self._lock:
+            self.images += 1
+            self.bytes_before += result.original_bytes
+            self.bytes_after += result.processed_bytes
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "images": self.images,
+                "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after,
+                "ratio": self.bytes_after / self.bytes_before if self.bytes_before else 1.0,
+            }
+
+
+preprocess_stats = PreprocessStats()
+
+
+def answer_region(pos: Optional[List[Dict]], image_size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    根据ScoringTask.pos计算答题区域
+
+    pos中的每一项形如{"x", "y", "w"/"width", "h"/"height"}，取所有矩形的并集。
+    坐标为0-1之间的小数时按图片尺寸换算。区域超出图片时说明坐标不是相对本图的，返回None。
+    """
+    if not pos:
+        return None
+
+    width, height = image_size
+    boxes = []
+    for item in pos:
+        try:
+            x = float(item["x"])
+            y = float(item["y"])
+            w = float(item.get("w", item.get("width")))
+            h = float(item.get("h", item.get("height")))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if w <= 0 or h <= 0:
+            continue
+        if max(x, y, w, h) <= 1:
+            x, w = x * width, w * width
+            y, h = y * height, h * height
+        boxes.append((x, y, x + w, y + h))
+
+    if not boxes:
+        return None
+
+    left = int(min(box[0] for box in boxes))
+    top = int(min(box[1] for box in boxes))
+    right = int(round(max(box[2] for box in boxes)))
+    bottom = int(round(max(box[3] for box in boxes)))
+    if left < 0 or top < 0 or right > width or bottom > height:
+        return None
+    if (right - left, bottom - top) == (width, height):
+        return None
+    return left, top, right, bottom
+
+
+def regions_for_parts(
+    pos: Optional[List[Dict]],
+    parts: List[Tuple[int, int]],
+    wanted: Iterable[Tuple[int, int]]
+) -> Optional[List[Dict]]:
+    """
+    选出指定小题的答题区域
+
+    pos的项数与小题数相同时，按小题顺序一一对应，只保留wanted中小题的矩形；
+    否则无法确定对应关系，返回整个pos。
+    """
+    if not pos or len(pos) != len(parts):
+        return pos
+    wanted = set(wanted)
+    return [item for item, part in zip(pos, parts) if part in wanted] or pos
+
+
+def _trim_box(image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """计算去除空白边距后的区域"""
+    gray = ImageOps.grayscale(image)
+    ink = gray.point(lambda value: 255 if value < _INK_THRESHOLD else 0)
+    box = ink.getbbox()
+    if box is None:
+        return None
+    left, top, right, bottom = box
+    return (
+        max(left - _TRIM_PADDING, 0),
+        max(top - _TRIM_PADDING, 0),
+        min(right + _TRIM_PADDING, image.width),
+        min(bottom + _TRIM_PADDING, image.height),
+    )
+
+
+def preprocess_image(
+    image_bytes: bytes,
+    options: Optional[PreprocessOptions] = None,
+    pos: Optional[List[Dict]] = None
+) -> PreprocessResult:
+    """裁剪、缩放并重新编码图片，返回上传用的字节与真实的MIME类型"""
+    options = options or PreprocessOptions()
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        original_format = (source.format or "PNG").upper()
+        original_size = source.size
+
+        if not options.enabled:
+            result = PreprocessResult(
+                data=image_bytes,
+                mime_type=MIME_TYPES.get(original_format, "image/png"),
+                original_bytes=len(image_bytes),
+                processed_bytes=len(image_bytes),
+                original_size=original_size,
+                processed_size=original_size,
+            )
+            preprocess_stats.record(result)
+            return result
+
+        image = source.convert("RGB") if source.mode not in ("RGB", "L") else source.copy()
+
+    # 裁剪到答题区域
+    if options.crop_to_region:
+        region = answer_region(pos, image.size)
+        if region is not None:
+            image = image.crop(region)
+    if options.trim_margins:
+        box = _trim_box(image)
+        if box is not None:
+            image = image.crop(box)
+
+    if options.grayscale:
+        image = ImageOps.grayscale(image)
+
+    # 限制分辨率
+    if options.max_side and max(image.size) > options.max_side:
+        image.thumbnail((options.max_side, options.max_side), Image.LANCZOS)
+
+    output_format = options.output_format.upper()
+    buffer = io.BytesIO()
+    if output_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=output_format, quality=options.quality)
+    data = buffer.getvalue()
+    mime_type = MIME_TYPES[output_format]
+
+    # 尺寸未变且重新编码后反而更大时，直接上传原图
+    if image.size == original_size and len(data) >= len(image_bytes):
+        data = image_bytes
+        mime_type = MIME_TYPES.get(original_format, "image/png")
+
+    result = PreprocessResult(
+        data=data,
+        mime_type=mime_type,
+        original_bytes=len(image_bytes),
+        processed_bytes=len(data),
+        original_size=original_size,
+        processed_size=image.size,
+    )
+    preprocess_stats.record(result)
+    return result
@@ -1,15 +1,106 @@
 import base64
+import io
 import json
-from typing import List
-from config import client, MODEL_NAME
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from PIL import Image
+
+from answer_rules import BlankKey
+from api_client import RetryPolicy
+from composite import build_composite, composite_stats, encode_composite, plan_batches
+from config import (
+    MODEL_MAX_RETRIES,
+    MODEL_BACKOFF_BASE,
+    MODEL_BACKOFF_MAX,
+    MODEL_STREAMING,
+    MODEL_STREAM_EARLY_ABORT,
+    RECOGNITION_CACHE_ENABLED,
+    ANSWER_REPAIR_MAX_BLANKS,
+)
+from dashboard import detail
+from image_preprocessor import PreprocessOptions, PreprocessResult, preprocess_image, regions_for_parts
+from metrics import get_metrics
+from model_backends import get_backend
 from models import StudentAnswer
+from rate_limiter import get_model_limiter
+from recognition_cache import RecognitionCache, get_default_cache
+from stream_parser import StreamingAnswerParser
+
+# 模型临时错误的重试退避
+_retry_policy = RetryPolicy(MODEL_MAX_RETRIES, MODEL_BACKOFF_BASE, MODEL_BACKOFF_MAX)
+
+# 返回格式说明中的单题结构
+_QUESTION_FORMAT = """{{
+            "question_number": {question_number},
+            "parts": [
+                {{
+                    "part_number": 1,
+                    "answers": [
+                        {{
+                            "blank_number": 1,
+                            "content": "答案内容",
+                            "is_crossed_out": <是否有删除线与涂抹>,
+                            "is_blurry": <是否模糊>,
+                            "confidence": <可信度评分>
+                        }},
+                        ...
+                    ]
+                }},
+                ...
+            ]
+        }}"""
 
 class ImageProcessor:
+    def __init__(
+        self,
+        cache: Optional[RecognitionCache] = None,
+        use_cache: bool = RECOGNITION_CACHE_ENABLED,
+        preprocess_options: Optional[PreprocessOptions] = None,
+        model_name: Optional[str] = None
+    ):
+        # 未显式传入缓存时使用进程内共享的默认缓存
+        self.cache = cache if cache is not None else (get_default_cache() if use_cache else None)
+        self.preprocess_options = preprocess_options or PreprocessOptions()
+        # 未指定模型时使用识别后端的主模型；分级识别由调用方显式传入快速模型
+        self._model_name = model_name
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name or get_backend().model_name
+
     @staticmethod
-    def encode_image(image_path: str) -> str:
+    def read_image(image: Union[str, bytes]) -> bytes:
+        """读取图片内容，传入的已是图片内容时直接返回"""
+        if isinstance(image, (bytes, bytearray)):
+            return bytes(image)
+        with open(image, 'rb') as img_file:
+            return img_file.read()
+
+    @staticmethod
+    def encode_image(image: Union[str, bytes]) -> str:
         """将图片转换为base64编码"""
-        with open(image_path, 'rb') as img_file:
-            return base64.b64encode(img_file.read()).decode('utf-8')
+        image_bytes = ImageProcessor.read_image(image)
+        with get_metrics().stage("encode", len(image_bytes)):
+            return base64.b64encode(image_bytes).decode('utf-8')
+
+    def prepare_image(self, image: Union[str, bytes], pos: Optional[List[Dict]] = None) -> PreprocessResult:
+        """读取并预处理图片，无法解码时原样上传"""
+        image_bytes = ImageProcessor.read_image(image)
+        try:
+            with get_metrics().stage("preprocess", len(image_bytes)):
+                result = preprocess_image(image_bytes, self.preprocess_options, pos)
+        except Exception as e:
+            detail(f"图片预处理失败，使用原图: {str(e)}")
+            return PreprocessResult(
+                data=image_bytes,
+                mime_type="image/png",
+                original_bytes=len(image_bytes),
+                processed_bytes=len(image_bytes),
+                original_size=(0, 0),
+                processed_size=(0, 0),
+            )
+        detail(f"图片预处理: {result.original_bytes} -> {result.processed_bytes} 字节")
+        return result
 
     @staticmethod
     def clean_json_string(json_str: str) -> str:
@@ -22,13 +113,9 @@ class ImageProcessor:
         return json_str.strip()
 
     @staticmethod
-    def process_image(image_path: str, question_number: int) -> List[StudentAnswer]:
-        """处理答题图片，返回识别结果"""
-        # 编码图片
-        img_base64 = ImageProcessor.encode_image(image_path)
-        
-        # 构建提示词
-        prompt = f"""
+    def build_prompt(question_number: int) -> str:
+        """构建单题识别提示词"""
+        return f"""
         你擅长精确分析答题卡,并能准确识别各种手写体答案及其状态。
         请你从左往右，从上往下阅读卷子
         请仔细分析这张答题卡图片中第{question_number}题的所有答案。
@@ -40,20 +127,59 @@ class ImageProcessor:
         4. 评估每个答案的字迹是否清晰
         5. 对每个答案给出置信度评分(0-1)
 
+        请以JSON格式返回结果，格式如下：
+        {_QUESTION_FORMAT.format(question_number=question_number)}
+        """
+
+    @staticmethod
+    def build_multi_prompt(question_numbers: List[int]) -> str:
+        """构建多题识别提示词，一次请求识别所有题目"""
+        numbers_text = "、".join(f"第{number}题" for number in question_numbers)
+        return f"""
+        你擅长精确分析答题卡,并能准确识别各种手写体答案及其状态。
+        请你从左往右，从上往下阅读卷子
+        请仔细分析这张答题卡图片中{numbers_text}的所有答案，每道题都必须返回。
+
+        要求：
+        1. 识别每个小题中所有空(下划线)的答案内容
+        2. 每个小题可能包含多个空（下划线）
+        3. 判断每个答案是否有删除线或涂改
+        4. 评估每个答案的字迹是否清晰
+        5. 对每个答案给出置信度评分(0-1)
+
         请以JSON格式返回结果，格式如下：
         {{
-            "question_number": 28,
-            "parts": [
+            "questions": [
+                {_QUESTION_FORMAT.format(question_number=question_numbers[0])},
+                ...
+            ]
+        }}
+        """
+
+    @staticmethod
+    def build_composite_prompt(tile_count: int, question_numbers: List[int]) -> str:
+        """构建合并识别提示词，按编号分别返回每名学生的答案"""
+        numbers_text = "、".join(f"第{number}题" for number in question_numbers)
+        return f"""
+        你擅长精确分析答题卡,并能准确识别各种手写体答案及其状态。
+        这张图片由{tile_count}名学生的答题区域纵向拼接而成，共{tile_count}块，
+        每块上方的灰色编号栏标注了编号#1到#{tile_count}，块之间用黑色粗线分隔。
+        请分别识别每一块中{numbers_text}的所有答案，不同编号的答案不要混在一起。
+
+        要求：
+        1. 每一块都必须返回，tile为该块的编号（数字）
+        2. 识别每个小题中所有空(下划线)的答案内容
+        3. 判断每个答案是否有删除线或涂改
+        4. 评估每个答案的字迹是否清晰
+        5. 对每个答案给出置信度评分(0-1)
+
+        请以JSON格式返回结果，格式如下：
+        {{
+            "tiles": [
                 {{
-                    "part_number": 1,
-                    "answers": [
-                        {{
-                            "blank_number": 1,
-                            "content": "答案内容",
-                            "is_crossed_out": <是否有删除线与涂抹>,
-                            "is_blurry": <是否模糊>,
-                            "confidence": <可信度评分>
-                        }},
+                    "tile": 1,
+                    "questions": [
+                        {_QUESTION_FORMAT.format(question_number=question_numbers[0])},
                         ...
                     ]
                 }},
@@ -61,60 +187,522 @@ class ImageProcessor:
             ]
         }}
         """
-        
-        # 调用模型
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{img_base64}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ]
-                }
+
+    @staticmethod
+    def build_repair_prompt(blanks: List[BlankKey]) -> str:
+        """构建补识别提示词，只询问指定的空"""
+        blanks_text = "、".join(
+            f"第{question}题第{part}小题第{blank}空" for question, part, blank in blanks
+        )
+        return f"""
+        你擅长精确分析答题卡,并能准确识别各种手写体答案及其状态。
+        这张图片是答题卡的局部，请只识别以下几个空（下划线）的答案：{blanks_text}
+
+        要求：
+        1. 只返回上面列出的空，不要返回其他空
+        2. 该空没有作答时content返回空字符串
+        3. 判断每个答案是否有删除线或涂改
+        4. 评估每个答案的字迹是否清晰
+        5. 对每个答案给出置信度评分(0-1)
+
+        请以JSON格式返回结果，格式如下：
+        {{
+            "questions": [
+                {_QUESTION_FORMAT.format(question_number=blanks[0][0])},
+                ...
             ]
+        }}
+        """
+
+    @staticmethod
+    def request_model(
+        img_base64: str,
+        prompt: str,
+        mime_type: str = "image/jpeg",
+        stream_parser: Optional[StreamingAnswerParser] = None,
+        model_name: Optional[str] = None
+    ) -> str:
+        """
+        调用模型，返回原始文本结果；经由共享限速器，限流时自动退避重试
+
+        传入stream_parser时以流式方式读取，边接收边解析答案，
+        期望的空全部识别出后提前断开，返回的是截至断开时的文本。
+        model_name未指定时使用识别后端的默认模型。
+        """
+        limiter = get_model_limiter()
+        metrics = get_metrics()
+        backend = get_backend()
+        model_name = model_name or backend.model_name
+        client = backend.client
+        throttle_errors = backend.throttle_errors
+        transient_errors = backend.transient_errors
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{img_base64}"
+                        }
+                    },
+                    {
+                        "type": "text",
+                        "text": prompt
+                    }
+                ]
+            }
+        ]
+
+        for attempt in range(MODEL_MAX_RETRIES + 1):
+            retry_delay: Optional[float] = None
+            # 计时不含在限速器中排队的时间，每次尝试单独记录
+            with limiter.slot() as saturated, metrics.stage("model") as record:
+                try:
+                    if stream_parser is None:
+                        response = client.chat.completions.create(
+                            model=model_name,
+                            messages=messages
+                        )
+                        content = response.choices[0].message.content
+                        usage = getattr(response, "usage", None)
+                        tokens = getattr(usage, "total_tokens", 0) or 0
+                    else:
+                        started = time.perf_counter()
+                        stream = client.chat.completions.create(
+                            model=model_name,
+                            messages=messages,
+                            stream=True
+                        )
+                        content, tokens = ImageProcessor._read_stream(stream, stream_parser, started)
+                except throttle_errors as e:
+                    record.outcome = "throttled"
+                    limiter.record_throttle(backend.retry_after(e))
+                    if attempt >= MODEL_MAX_RETRIES:
+                        raise
+                    detail(f"模型调用被限流，冷却后重试: {str(e)}")
+                    continue
+                except transient_errors as e:
+                    record.outcome = "error"
+                    limiter.record_error()
+                    if attempt >= MODEL_MAX_RETRIES:
+                        raise
+                    retry_delay = _retry_policy.delay(attempt)
+                    detail(f"模型调用失败，{retry_delay:.1f}秒后重试: {str(e)}")
+                else:
+                    record.bytes = len((content or "").encode("utf-8"))
+                    if stream_parser is not None and stream_parser.aborted:
+                        record.outcome = "aborted"
+
+            if retry_delay is not None:
+                # 在限速器名额之外等待，不占用并发
+                time.sleep(retry_delay)
+                continue
+            limiter.record_success(tokens, saturated)
+            return content
+
+    @staticmethod
+    def _read_stream(stream, parser: StreamingAnswerParser, started: float) -> Tuple[str, int]:
+        """读取流式响应并增量解析，返回文本与token数（提前断开时服务端不返回用量，记为0）"""
+        metrics = get_metrics()
+        parser.reset()
+        tokens = 0
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    tokens = usage.total_tokens or tokens
+                if not chunk.choices:
+                    continue
+                new_answers = parser.feed(chunk.choices[0].delta.content or "")
+                if new_answers and len(parser.answers) == len(new_answers):
+                    # 从发出请求到解析出第一个空的时间
+                    metrics.observe("first_answer", time.perf_counter() - started)
+                if MODEL_STREAM_EARLY_ABORT and parser.complete:
+                    parser.aborted = True
+                    break
+        finally:
+            # 提前结束时关闭连接，服务端不再继续生成
+            stream.response.close()
+        return parser.text, tokens
+
+    @staticmethod
+    def parse_parts(data: Dict, question_number: int) -> List[StudentAnswer]:
+        """将单题的parts结构转换为StudentAnswer对象列表"""
+        student_answers = []
+        for part in data.get("parts", []):
+            part_number = part.get("part_number")
+            for answer in part.get("answers", []):
+                student_answer = StudentAnswer(
+                    question_number=question_number,
+                    part_number=part_number,
+                    blank_number=answer.get("blank_number", 1),
+                    content=answer.get("content", ""),
+                    confidence=answer.get("confidence", 0.0),
+                    is_crossed_out=answer.get("is_crossed_out", False),
+                    is_blurry=answer.get("is_blurry", True)
+                )
+                student_answers.append(student_answer)
+        return student_answers
+
+    @staticmethod
+    def group_by_question(answers: List[StudentAnswer]) -> Dict[int, List[StudentAnswer]]:
+        """按题号分组识别结果"""
+        answers_by_question: Dict[int, List[StudentAnswer]] = {}
+        for answer in answers:
+            answers_by_question.setdefault(answer.question_number, []).append(answer)
+        return answers_by_question
+
+    @staticmethod
+    def parse_questions(data: Dict, question_numbers: List[int]) -> Dict[int, List[StudentAnswer]]:
+        """将完整的JSON结果按题号转换为StudentAnswer对象列表，只识别一道题时题号以传入的为准"""
+        # 兼容模型只返回单题结构的情况
+        questions = data.get("questions", [data] if "parts" in data else [])
+        answers_by_question: Dict[int, List[StudentAnswer]] = {}
+        for question in questions:
+            if len(question_numbers) == 1:
+                question_number = question_numbers[0]
+            else:
+                try:
+                    question_number = int(question.get("question_number"))
+                except (TypeError, ValueError):
+                    continue
+                if question_number not in question_numbers:
+                    continue
+            answers = ImageProcessor.parse_parts(question, question_number)
+            if answers:
+                answers_by_question[question_number] = answers
+            if len(question_numbers) == 1:
+                break
+        return answers_by_question
+
+    @staticmethod
+    def parse_response(
+        text: str,
+        question_numbers: List[int],
+        stream_parser: Optional[StreamingAnswerParser] = None
+    ) -> Tuple[Dict[int, List[StudentAnswer]], bool]:
+        """
+        解析模型返回的文本
+
+        优先按完整JSON解析；流式读取提前断开或JSON损坏时，改用增量解析出的答案，
+        不再整份丢弃。
+
+        Returns:
+            (题号到识别结果的映射, 结果是否完整)，不完整的结果不写入缓存
+        """
+        with get_metrics().stage("parse", len(text or "")):
+            if stream_parser is None or not stream_parser.aborted:
+                try:
+                    data = json.loads(ImageProcessor.clean_json_string(text))
+                    return ImageProcessor.parse_questions(data, question_numbers), True
+                except json.JSONDecodeError as e:
+                    detail(f"JSON解析错误，使用已解析出的答案: {str(e)}")
+            if stream_parser is None:
+                answers = StreamingAnswerParser.parse_text(text, question_numbers)
+                return ImageProcessor.group_by_question(answers), False
+            return ImageProcessor.group_by_question(stream_parser.answers), stream_parser.complete
+
+    @staticmethod
+    def parse_composite(
+        text: str,
+        tile_count: int,
+        question_numbers: List[int]
+    ) -> Dict[int, List[StudentAnswer]]:
+        """
+        解析合并识别的结果，返回编号（从1开始）到答案的映射
+
+        编号超出范围、重复出现或没有答案的块不在结果中，由调用方改为单独识别。
+        """
+        with get_metrics().stage("parse", len(text or "")):
+            try:
+                data = json.loads(ImageProcessor.clean_json_string(text))
+            except json.JSONDecodeError as e:
+                detail(f"合并识别结果JSON解析错误: {str(e)}")
+                return {}
+            tiles: Dict[int, List[StudentAnswer]] = {}
+            duplicated = set()
+            for tile in data.get("tiles", []) if isinstance(data, dict) else []:
+                try:
+                    number = int(tile.get("tile"))
+                except (TypeError, ValueError, AttributeError):
+                    continue
+                if not 1 <= number <= tile_count:
+                    continue
+                if number in tiles:
+                    duplicated.add(number)
+                    continue
+                answers_by_question = ImageProcessor.parse_questions(tile, question_numbers)
+                tiles[number] = [
+                    answer for question in question_numbers for answer in answers_by_question.get(question, [])
+                ]
+            # 同一编号出现多次时无法确定哪个正确，两者都不用
+            return {number: answers for number, answers in tiles.items() if answers and number not in duplicated}
+
+    @staticmethod
+    def make_stream_parser(
+        question_numbers: List[int],
+        expected_blanks: Optional[Iterable[BlankKey]] = None
+    ) -> Optional[StreamingAnswerParser]:
+        """流式识别时的增量解析器，未开启流式时返回None"""
+        if not MODEL_STREAMING:
+            return None
+        return StreamingAnswerParser(question_numbers, expected_blanks)
+
+    def process_image(
+        self,
+        image: Union[str, bytes],
+        question_number: int,
+        pos: Optional[List[Dict]] = None,
+        expected_blanks: Optional[Iterable[BlankKey]] = None
+    ) -> List[StudentAnswer]:
+        """
+        处理答题图片，返回识别结果
+
+        expected_blanks为标准答案中的(题号, 小题号, 空号)，流式识别时全部识别出即提前结束
+        """
+        # 读取、预处理图片并构建提示词
+        prepared = self.prepare_image(image, pos)
+        image_bytes = prepared.data
+        prompt = ImageProcessor.build_prompt(question_number)
+
+        # 先查缓存
+        cache_key = None
+        if self.cache is not None:
+            cache_key = RecognitionCache.make_key(image_bytes, str(question_number), self.model_name, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        # 编码图片
+        img_base64 = ImageProcessor.encode_image(image_bytes)
+
+        # 调用模型
+        stream_parser = ImageProcessor.make_stream_parser([question_number], expected_blanks)
+        result = ImageProcessor.request_model(
+            img_base64, prompt, prepared.mime_type, stream_parser, self.model_name
         )
-        
-        # 解析响应
-        result = response.choices[0].message.content
-        print("模型返回结果:", result)  # 调试输出
-        
+        detail("模型返回结果:", result)  # 调试输出
+
         try:
-            # 清理并解析JSON
-            cleaned_json = ImageProcessor.clean_json_string(result)
-            data = json.loads(cleaned_json)
-            student_answers = []
-            
-            # 转换为StudentAnswer对象列表
-            for part in data.get("parts", []):
-                part_number = part.get("part_number")
-                for answer in part.get("answers", []):
-                    student_answer = StudentAnswer(
-                        question_number=question_number,
-                        part_number=part_number,
-                        blank_number=answer.get("blank_number", 1),
-                        content=answer.get("content", ""),
-                        confidence=answer.get("confidence", 0.0),
-                        is_crossed_out=answer.get("is_crossed_out", False),
-                        is_blurry=answer.get("is_blurry", True)
-                    )
-                    student_answers.append(student_answer)
-            
+            # 解析并转换为StudentAnswer对象列表
+            answers_by_question, complete = ImageProcessor.parse_response(
+                result, [question_number], stream_parser
+            )
+            student_answers = answers_by_question.get(question_number, [])
+            if cache_key is not None and student_answers and complete:
+                self.cache.put(cache_key, student_answers)
             return student_answers
-            
-        except json.JSONDecodeError as e:
-            print(f"JSON解析错误: {str(e)}")
-            print("清理后的JSON字符串:", cleaned_json)  # 调试输出
+
+        except Exception as e:
+            detail(f"处理答案时发生错误: {str(e)}")
             return []
+
+    def process_image_multi(
+        self,
+        image: Union[str, bytes],
+        question_numbers: List[int],
+        pos: Optional[List[Dict]] = None,
+        expected_blanks: Optional[Iterable[BlankKey]] = None
+    ) -> Dict[int, List[StudentAnswer]]:
+        """
+        一次模型调用识别多道题
+
+        Returns:
+            Dict[int, List[StudentAnswer]]: 题号到识别结果的映射，未能识别的题目不在结果中
+        """
+        prepared = self.prepare_image(image, pos)
+        image_bytes = prepared.data
+        prompt = ImageProcessor.build_multi_prompt(question_numbers)
+
+        cache_key = None
+        if self.cache is not None:
+            question_key = ",".join(str(number) for number in question_numbers)
+            cache_key = RecognitionCache.make_key(image_bytes, question_key, self.model_name, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return ImageProcessor.group_by_question(cached)
+
+        img_base64 = ImageProcessor.encode_image(image_bytes)
+        stream_parser = ImageProcessor.make_stream_parser(question_numbers, expected_blanks)
+        result = ImageProcessor.request_model(
+            img_base64, prompt, prepared.mime_type, stream_parser, self.model_name
+        )
+        detail("模型返回结果:", result)  # 调试输出
+
+        try:
+            answers_by_question, complete = ImageProcessor.parse_response(
+                result, question_numbers, stream_parser
+            )
+
+            # 只缓存完整的结果，部分缺失时由逐题识别补齐
+            if cache_key is not None and complete and len(answers_by_question) == len(question_numbers):
+                self.cache.put(cache_key, [
+                    answer for number in question_numbers for answer in answers_by_question[number]
+                ])
+            return answers_by_question
+
+        except Exception as e:
+            detail(f"处理答案时发生错误: {str(e)}")
+            return {}
+
+    def recognize_composite(
+        self,
+        images: List[Union[str, bytes]],
+        question_numbers: List[int],
+        pos_list: Optional[List[Optional[List[Dict]]]] = None
+    ) -> List[Optional[List[StudentAnswer]]]:
+        """
+        多名学生的答题卡拼成带编号的图片后合并识别
+
+        按图片尺寸分批（见composite.plan_batches），每批一次模型调用，结果按编号拆回。
+        只分到一张的批次、无法解码的图片以及拆回失败的块返回None，由调用方单独识别。
+        """
+        pos_list = pos_list or [None] * len(images)
+        results: List[Optional[List[StudentAnswer]]] = [None] * len(images)
+        tiles: List[Image.Image] = []
+        indexes: List[int] = []
+        nbytes: List[int] = []
+        for index, (image, pos) in enumerate(zip(images, pos_list)):
+            prepared = self.prepare_image(image, pos)
+            try:
+                with Image.open(io.BytesIO(prepared.data)) as source:
+                    tiles.append(source.convert("RGB"))
+            except Exception as e:
+                detail(f"图片无法解码，改为单独识别: {str(e)}")
+                continue
+            indexes.append(index)
+            nbytes.append(len(prepared.data))
+
+        for batch in plan_batches([tile.size for tile in tiles], nbytes):
+            if len(batch) < 2:
+                continue
+            composite = build_composite([tiles[position] for position in batch])
+            composite_bytes = encode_composite(composite, self.preprocess_options.quality)
+            prompt = ImageProcessor.build_composite_prompt(len(batch), question_numbers)
+            img_base64 = ImageProcessor.encode_image(composite_bytes)
+            composite_stats.record_request(len(batch))
+            try:
+                with get_metrics().stage("composite", len(composite_bytes)):
+                    result = ImageProcessor.request_model(
+                        img_base64, prompt, "image/jpeg", None, self.model_name
+                    )
+            except Exception as e:
+                detail(f"合并识别失败，改为单独识别: {str(e)}")
+                continue
+            mapped = ImageProcessor.parse_composite(result, len(batch), question_numbers)
+            for number, position in enumerate(batch, 1):
+                results[indexes[position]] = mapped.get(number)
+        return results
+
+    def recognize_blanks(
+        self,
+        image: Union[str, bytes],
+        blanks: List[BlankKey],
+        pos: Optional[List[Dict]] = None
+    ) -> List[StudentAnswer]:
+        """只识别指定的空，返回识别出的答案（可能少于请求的空）"""
+        prepared = self.prepare_image(image, pos)
+        image_bytes = prepared.data
+        prompt = ImageProcessor.build_repair_prompt(blanks)
+        question_numbers = sorted({question for question, _, _ in blanks})
+
+        cache_key = None
+        if self.cache is not None:
+            blank_key = "repair:" + ",".join(f"{q}.{p}.{b}" for q, p, b in blanks)
+            cache_key = RecognitionCache.make_key(image_bytes, blank_key, self.model_name, prompt)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        img_base64 = ImageProcessor.encode_image(image_bytes)
+        stream_parser = ImageProcessor.make_stream_parser(question_numbers, blanks)
+        result = ImageProcessor.request_model(
+            img_base64, prompt, prepared.mime_type, stream_parser, self.model_name
+        )
+        detail("补识别返回结果:", result)  # 调试输出
+
+        try:
+            answers_by_question, _ = ImageProcessor.parse_response(result, question_numbers, stream_parser)
         except Exception as e:
-            print(f"处理答案时发生错误: {str(e)}")
-            return [] 
+            detail(f"处理补识别结果时发生错误: {str(e)}")
+            return []
+        # 模型多返回的空一律忽略，不覆盖已有答案
+        wanted = set(blanks)
+        answers = [
+            answer
+            for number in question_numbers
+            for answer in answers_by_question.get(number, [])
+            if (answer.question_number, answer.part_number, answer.blank_number) in wanted
+        ]
+        if cache_key is not None and len(answers) == len(wanted):
+            self.cache.put(cache_key, answers)
+        return answers
+
+    def repair_answers(
+        self,
+        image: Union[str, bytes],
+        answers: List[StudentAnswer],
+        expected_blanks: Iterable[BlankKey],
+        pos: Optional[List[Dict]] = None
+    ) -> List[StudentAnswer]:
+        """
+        补识别缺失的空
+
+        找出标准答案中有、识别结果中没有的空，裁剪到这些空所在小题的区域后只询问这些空，
+        识别出的答案追加到已有答案之后。缺失过多时不补识别，原样返回。
+        """
+        expected = sorted(set(expected_blanks))
+        present = {(answer.question_number, answer.part_number, answer.blank_number) for answer in answers}
+        missing = [key for key in expected if key not in present]
+        if not missing:
+            return answers
+        if len(missing) > ANSWER_REPAIR_MAX_BLANKS:
+            detail(f"缺失 {len(missing)} 个空，超过补识别上限 {ANSWER_REPAIR_MAX_BLANKS}，不补识别")
+            return answers
+
+        parts = sorted({(question, part) for question, part, _ in expected})
+        region = regions_for_parts(pos, parts, {(question, part) for question, part, _ in missing})
+        with get_metrics().stage("repair") as record:
+            repaired = self.recognize_blanks(image, missing, region)
+            if len(repaired) < len(missing):
+                record.outcome = "partial"
+        detail(f"补识别 {len(missing)} 个空，识别出 {len(repaired)} 个")
+        return answers + repaired
+
+    def escalate_answers(
+        self,
+        image: Union[str, bytes],
+        answers: List[StudentAnswer],
+        blanks: List[BlankKey],
+        pos: Optional[List[Dict]] = None,
+        expected_blanks: Optional[Iterable[BlankKey]] = None
+    ) -> Tuple[List[StudentAnswer], int]:
+        """
+        用本实例的模型重新识别指定的空（分级识别中快速模型不确定的空）
+
+        只上传这些空所在小题的区域，识别出的答案替换原答案，未识别出的保留原答案。
+
+        Returns:
+            (合并后的答案, 重新识别出的空数)
+        """
+        if not blanks:
+            return answers, 0
+        if expected_blanks:
+            parts = sorted({(question, part) for question, part, _ in expected_blanks})
+        else:
+            parts = sorted({(answer.question_number, answer.part_number) for answer in answers})
+        region = regions_for_parts(pos, parts, {(question, part) for question, part, _ in blanks})
+        with get_metrics().stage("escalate") as record:
+            escalated = self.recognize_blanks(image, blanks, region)
+            if len(escalated) < len(blanks):
+                record.outcome = "partial"
+        replacements = {
+            (answer.question_number, answer.part_number, answer.blank_number): answer for answer in escalated
+        }
+        merged = [
+            replacements.get((answer.question_number, answer.part_number, answer.blank_number), answer)
+            for answer in answers
+        ]
+        detail(f"主模型重新识别 {len(blanks)} 个空，识别出 {len(escalated)} 个")
+        return merged, len(escalated)
@@ -0,0 +1,77 @@
+import os
+import threading
+from typing import Optional
+
+from config import IMAGE_SPOOL_ENABLED, IMAGE_SPOOL_DIR, IMAGE_SPOOL_MAX_BYTES
+
+
+class ImageSpool:
+    """
+    有容量上限的图片留存目录，仅用于审计
+
+    写入后总大小超过上限时，按修改时间删除最早的图片。
+    """
+
+    def __init__(self, directory: str = IMAGE_SPOOL_DIR, max_bytes: int = IMAGE_SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, name))
+        )
+
+    def save(self, kaohao: str, data: bytes) -> str:
+        """保存图片，返回文件路径"""
+        image_path = os.path.join(self.directory, f"{kaohao}.png")
+        with self._lock:
+            if os.path.exists(image_path):
+                self._total_bytes -= os.path.getsize(image_path)
+            with open(image_path, 'wb') as f:
+                f.write(data)
+            self._total_bytes += len(data)
+            self._evict(keep=image_path)
+        return image_path
+
+    def _evict(self, keep: str):
+        """删除最早的图片直到不超过上限"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        paths = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+        ]
+        paths = sorted(
+            (path for path in paths if os.path.isfile(path) and path != keep),
+            key=os.path.getmtime
+        )
+        for path in paths:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+
+_default_spool: Optional[ImageSpool] = None
+_default_spool_lock = threading.Lock()
+
+
+def get_default_spool() -> Optional[ImageSpool]:
+    """获取进程内共享的留存目录，未启用时返回None"""
+    global _default_spool
+    if not IMAGE_SPOOL_ENABLED:
+        return None
+    with _default_spool_lock:
+        if _default_spool is None:
+            _default_spool = ImageSpool()
+    return _default_spool
@@ -0,0 +1,336 @@
+"""
+逐空的试题分析
+
+每份试卷评分后，把各空的对错、答案内容与置信度汇入在线统计，内存占用与试卷数无关：
+每个空只保存计数、固定分箱的置信度分布，以及用Space-Saving算法维护的至多top_k个最常见错误答案。
+某个空多数学生"答错"、且错误答案集中在同一个时，往往是标准答案有误，可随时查看快照，及早修正标准答案。
+
+用法（查看运行中定期写出的快照）：
+    python item_analysis.py
+    python item_analysis.py --snapshot data/item_analysis.json --all
+"""
+import argparse
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from config import (
+    ITEM_ANALYSIS_ENABLED,
+    ITEM_ANALYSIS_TOP_K,
+    ITEM_ANALYSIS_CONFIDENCE_BINS,
+    ITEM_ANALYSIS_MIN_ANSWERED,
+    ITEM_ANALYSIS_SUSPECT_CORRECT_RATE,
+    ITEM_ANALYSIS_SUSPECT_SHARE,
+    ITEM_ANALYSIS_SNAPSHOT_PATH,
+    ITEM_ANALYSIS_SNAPSHOT_EVERY,
+)
+from models import ScoringResult
+
+BlankPosition = Tuple[int, int, int]  # (题号, 小题号, 空号)
+
+
+class SpaceSaving:
+    """
+    Space-Saving频繁项统计，至多保存capacity个计数器
+
+    计数器已满时新出现的项替换计数最小的项，并继承其计数作为误差上限；
+    每项的真实次数在[count - error, count]之间，真实次数超过总数/capacity的项一定在其中。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total = 0
+        self._counters: Dict[str, List[int]] = {}  # 项到[计数, 误差]
+
+    def add(self, item: str):
+        self.total += 1
+        counter = self._counters.get(item)
+        if counter is not None:
+            counter[0] += 1
+        elif len(self._counters) < self.capacity:
+            self._counters[item] = [1, 0]
+        else:
+            evicted = min(self._counters, key=lambda key: self._counters[key][0])
+            count = self._counters.pop(evicted)[0]
+            self._counters[item] = [count + 1, count]
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """按计数从大到小返回(项, 计数, 误差)"""
+        ranked = sorted(
+            ((item, count, error) for item, (count, error) in self._counters.items()),
+            key=lambda entry: entry[1],
+            reverse=True,
+        )
+        return ranked if n is None else ranked[:n]
+
+
+class WrongAnswer(BaseModel):
+    content: str
+    count: int  # 出现次数的上限
+    error: int = 0  # 计数可能多算的次数，真实次数不少于count - error
+
+
+class ItemSnapshot(BaseModel):
+    """一个空当前的统计"""
+    question_number: int
+    part_number: int
+    blank_number: int
+    standard_answer: str
+    papers: int = 0
+    answered: int = 0
+    correct: int = 0
+    crossed_out: int = 0
+    confidence_correct: List[int] = []  # 答对的答案的置信度分布，[0, 1]等分
+    confidence_wrong: List[int] = []  # 答错的答案的置信度分布
+    top_wrong: List[WrongAnswer] = []
+    suspect: bool = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.question_number}.{self.part_number}.{self.blank_number}"
+
+    @property
+    def correct_rate(self) -> float:
+        return self.correct / self.answered if self.answered else 0.0
+
+    @property
+    def wrong(self) -> int:
+        """答错且未被划掉的答案数，即参与错误答案统计的数量"""
+        return sum(self.confidence_wrong)
+
+    @property
+    def top_wrong_share(self) -> float:
+        """最常见的错误答案至少占错误答案的比例"""
+        if not self.top_wrong or not self.wrong:
+            return 0.0
+        top = self.top_wrong[0]
+        return (top.count - top.error) / self.wrong
+
+    def describe(self) -> str:
+        text = f"第{self.key}空 正确率 {self.correct_rate:.0%}（作答 {self.answered} 份）"
+        if self.top_wrong:
+            text += f"，最常见的错误答案“{self.top_wrong[0].content}”占 {self.top_wrong_share:.0%}"
+        return text + f"，标准答案“{self.standard_answer}”"
+
+
+class _BlankStats:
+    """单个空的累计统计"""
+
+    __slots__ = ("standard_answer", "papers", "answered", "correct", "crossed_out",
+                 "confidence_correct", "confidence_wrong", "wrong_answers")
+
+    def __init__(self, standard_answer: str, top_k: int, bins: int):
+        self.standard_answer = standard_answer
+        self.papers = 0
+        self.answered = 0
+        self.correct = 0
+        self.crossed_out = 0
+        self.confidence_correct = [0] * bins
+        self.confidence_wrong = [0] * bins
+        self.wrong_answers = SpaceSaving(top_k)
+
+
+class ItemAnalyzer:
+    """
+    逐空试题分析的在线汇总，线程安全
+
+    record每份试卷的评分结果，snapshot随时返回当前统计；
+    作答数不少于min_answered、正确率低于suspect_correct_rate、且最常见的错误答案
+    至少占错误答案的suspect_share时判为可疑，提示检查标准答案。
+    """
+
+    def __init__(
+        self,
+        top_k: int = ITEM_ANALYSIS_TOP_K,
+        confidence_bins: int = ITEM_ANALYSIS_CONFIDENCE_BINS,
+        min_answered: int = ITEM_ANALYSIS_MIN_ANSWERED,
+        suspect_correct_rate: float = ITEM_ANALYSIS_SUSPECT_CORRECT_RATE,
+        suspect_share: float = ITEM_ANALYSIS_SUSPECT_SHARE,
+        snapshot_path: Optional[str] = ITEM_ANALYSIS_SNAPSHOT_PATH,
+        snapshot_every: int = ITEM_ANALYSIS_SNAPSHOT_EVERY
+    ):
+        self.top_k = top_k
+        self.confidence_bins = confidence_bins
+        self.min_answered = min_answered
+        self.suspect_correct_rate = suspect_correct_rate
+        self.suspect_share = suspect_share
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.papers = 0
+            self._blanks: Dict[BlankPosition, _BlankStats] = {}
+            self._flagged: Dict[BlankPosition, None] = {}  # 已提示过的可疑空，按发现顺序
+
+    def _bin(self, confidence: Optional[float]) -> int:
+        confidence = min(max(confidence or 0.0, 0.0), 1.0)
+        return min(int(confidence * self.confidence_bins), self.confidence_bins - 1)
+
+    def record(self, result: ScoringResult) -> List[ItemSnapshot]:
+        """汇入一份试卷的评分结果，返回本次新发现的可疑的空"""
+        flagged = []
+        with self._lock:
+            self.papers += 1
+            for part in result.parts:
+                for blank in part.blanks:
+                    position = (part.question_number, part.part_number, blank.blank_number)
+                    stats = self._blanks.get(position)
+                    if stats is None:
+                        stats = self._blanks[position] = _BlankStats(
+                            blank.standard_answer, self.top_k, self.confidence_bins
+                        )
+                    stats.papers += 1
+                    if blank.content is None:
+                        continue
+                    stats.answered += 1
+                    if blank.is_correct:
+                        stats.correct += 1
+                        stats.confidence_correct[self._bin(blank.confidence)] += 1
+                    elif blank.is_crossed_out:
+                        # 划掉的答案不代表学生的作答，不计入错误答案
+                        stats.crossed_out += 1
+                    else:
+                        stats.confidence_wrong[self._bin(blank.confidence)] += 1
+                        stats.wrong_answers.add(blank.content.strip())
+                    if position not in self._flagged and self._is_suspect(stats):
+                        self._flagged[position] = None
+                        flagged.append(self._snapshot(position, stats))
+            save = self.snapshot_path and self.snapshot_every and self.papers % self.snapshot_every == 0
+        if save:
+            self.save()
+        return flagged
+
+    def _is_suspect(self, stats: _BlankStats) -> bool:
+        if stats.answered < self.min_answered or stats.correct >= stats.answered * self.suspect_correct_rate:
+            return False
+        top = stats.wrong_answers.top(1)
+        if not top:
+            return False
+        _, count, error = top[0]
+        return count - error >= stats.wrong_answers.total * self.suspect_share
+
+    def _snapshot(self, position: BlankPosition, stats: _BlankStats) -> ItemSnapshot:
+        question_number, part_number, blank_number = position
+        return ItemSnapshot(
+            question_number=question_number,
+            part_number=part_number,
+            blank_number=blank_number,
+            standard_answer=stats.standard_answer,
+            papers=stats.papers,
+            answered=stats.answered,
+            correct=stats.correct,
+            crossed_out=stats.crossed_out,
+            confidence_correct=list(stats.confidence_correct),
+            confidence_wrong=list(stats.confidence_wrong),
+            top_wrong=[
+                WrongAnswer(content=content, count=count, error=error)
+                for content, count, error in stats.wrong_answers.top()
+            ],
+            suspect=self._is_suspect(stats),
+        )
+
+    def snapshot(self) -> List[ItemSnapshot]:
+        """当前各空的统计，按题号、小题号、空号排序"""
+        with self._lock:
+            return [self._snapshot(position, self._blanks[position]) for position in sorted(self._blanks)]
+
+    def suspects(self) -> List[ItemSnapshot]:
+        return [item for item in self.snapshot() if item.suspect]
+
+    def save(self, path: Optional[str] = None) -> Optional[str]:
+        """把快照写入JSON文件（先写临时文件再替换，读取方不会读到一半）"""
+        path = path or self.snapshot_path
+        if not path:
+            return None
+        items = self.snapshot()
+        with self._lock:
+            papers = self.papers
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"papers": papers, "items": [item.model_dump() for item in items]},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(temp_path, path)
+        return path
+
+    def describe(self) -> str:
+        with self._lock:
+            papers = self.papers
+            blanks = len(self._blanks)
+            flagged = len(self._flagged)
+        return f"汇总 {papers} 份试卷、{blanks} 个空，疑似标准答案有误 {flagged} 个"
+
+
+_item_analyzer: Optional[ItemAnalyzer] = None
+_item_analyzer_lock = threading.Lock()
+
+
+def get_item_analyzer() -> Optional[ItemAnalyzer]:
+    """获取进程内共享的试题分析，未开启时返回None"""
+    global _item_analyzer
+    if not ITEM_ANALYSIS_ENABLED:
+        return None
+    with _item_analyzer_lock:
+        if _item_analyzer is None:
+            _item_analyzer = ItemAnalyzer()
+    return _item_analyzer
+
+
+def load_snapshot(path: str) -> Tuple[int, List[ItemSnapshot]]:
+    """读取save写出的快照，返回(试卷数, 各空的统计)"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data["papers"], [ItemSnapshot(**item) for item in data["items"]]
+
+
+def main():
+    from rich.console import Console
+    from rich.table import Table
+
+    parser = argparse.ArgumentParser(description="查看逐空的试题分析")
+    parser.add_argument("--snapshot", default=ITEM_ANALYSIS_SNAPSHOT_PATH, help="阅卷过程中写出的快照")
+    parser.add_argument("--all", action="store_true", help="显示所有空，默认只显示可疑的空")
+    parser.add_argument("--top", type=int, default=3, help="每个空显示的错误答案个数")
+    args = parser.parse_args()
+
+    console = Console()
+    papers, items = load_snapshot(args.snapshot)
+    shown = items if args.all else [item for item in items if item.suspect]
+    table = Table(title=f"试题分析（{papers} 份试卷）")
+    table.add_column("空", style="cyan")
+    table.add_column("标准答案", style="green")
+    table.add_column("作答", justify="right")
+    table.add_column("正确率", justify="right")
+    table.add_column("最常见的错误答案", style="yellow")
+    table.add_column("可疑", style="red")
+    for item in shown:
+        table.add_row(
+            item.key,
+            item.standard_answer,
+            str(item.answered),
+            f"{item.correct_rate:.0%}",
+            "；".join(
+                f"{wrong.content}（{wrong.count}）" if not wrong.error
+                else f"{wrong.content}（{wrong.count - wrong.error}~{wrong.count}）"
+                for wrong in item.top_wrong[:args.top]
+            ),
+            "是" if item.suspect else "",
+        )
+    console.print(table)
+    if not args.all:
+        console.print(f"[cyan]共 {len(items)} 个空，可疑 {len(shown)} 个；--all显示所有空[/cyan]")
+
+
+if __name__ == "__main__":
+    main()
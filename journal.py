@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from config import JOURNAL_ENABLED, JOURNAL_FSYNC, JOURNAL_PATH
+from models import StudentAnswer
+
+# 试卷状态，按处理顺序排列
+FETCHED = "fetched"
+DOWNLOADED = "downloaded"
+RECOGNIZED = "recognized"
+SCORED = "scored"
+SUBMITTED = "submitted"
+REVIEW = "review"  # 已送人工复核，由review.py提交
+
+_STATE_ORDER = {state: index for index, state in enumerate((FETCHED, DOWNLOADED, RECOGNIZED, SCORED, SUBMITTED))}
+_STATE_ORDER[REVIEW] = _STATE_ORDER[SUBMITTED]
+
+
+class JournalEntry(BaseModel):
+    """一份试卷在日志中的最新状态"""
+    task_key: str
+    state: str
+    subject_id: Optional[str] = None
+    block_id: Optional[str] = None
+    kaohao: Optional[str] = None
+    image: Optional[str] = None  # 图片落盘时的路径
+    answers: Optional[List[StudentAnswer]] = None  # 识别结果，空列表表示空白答题卡
+    api_scores: Optional[List[Dict[str, str]]] = None
+    updated_at: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        """已提交或已送复核，不需要再处理"""
+        return self.state in (SUBMITTED, REVIEW)
+
+
+class GradingJournal:
+    """
+    阅卷过程的预写日志
+
+    每次状态变化（获取→下载→识别→评分→提交）追加一行JSON并落盘，识别结果随识别状态一起写入。
+    重启后重放日志：已提交的试卷不再提交，已识别的试卷不再调用模型。
+    进程在写入一行的中途崩溃时，残缺的最后一行在重放时忽略。
+    path为None时只在内存中记录。
+    """
+
+    def __init__(self, path: Optional[str] = JOURNAL_PATH, fsync: bool = JOURNAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._entries: Dict[str, JournalEntry] = {}
+        self._file = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            lines = self._replay()
+            # 重放出的记录远少于日志行数时压缩，只保留每份试卷的最新状态
+            if lines > 2 * len(self._entries) + 100:
+                self._compact()
+            self._file = open(path, "a", encoding="utf-8")
+            if self._file.tell() > 0 and not self._ends_with_newline():
+                # 上次崩溃留下的残缺行单独成行，不影响之后的记录
+                self._file.write("\n")
+                self._file.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _replay(self) -> int:
+        """读取日志重建每份试卷的状态，返回读取的行数"""
+        if not os.path.exists(self.path):
+            return 0
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._apply(record)
+        return lines
+
+    def _apply(self, record: Dict) -> JournalEntry:
+        task_key = record["task_key"]
+        entry = self._entries.get(task_key)
+        if entry is None:
+            entry = self._entries[task_key] = JournalEntry(task_key=task_key, state=record["state"])
+        # 状态只前进不后退，重复下发时的"获取"不会覆盖已完成的状态
+        if _STATE_ORDER.get(record["state"], 0) >= _STATE_ORDER.get(entry.state, 0):
+            entry.state = record["state"]
+        for field in ("subject_id", "block_id", "kaohao", "image", "answers", "api_scores"):
+            value = record.get(field)
+            if value is None:
+                continue
+            if field == "answers":
+                value = [StudentAnswer(**answer) for answer in value]
+            setattr(entry, field, value)
+        entry.updated_at = record.get("ts", entry.updated_at)
+        return entry
+
+    def _compact(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                record = entry.model_dump(exclude_none=True)
+                record["ts"] = record.pop("updated_at")
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def record(
+        self,
+        task_key: str,
+        state: str,
+        answers: Optional[List[StudentAnswer]] = None,
+        **fields
+    ) -> JournalEntry:
+        """追加一条状态变化，写入磁盘后才返回"""
+        record = {"ts": round(time.time(), 3), "task_key": task_key, "state": state}
+        record.update({name: value for name, value in fields.items() if value is not None})
+        if answers is not None:
+            record["answers"] = [answer.model_dump() for answer in answers]
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            return self._apply(record)
+
+    def get(self, task_key: str) -> Optional[JournalEntry]:
+        with self._lock:
+            return self._entries.get(task_key)
+
+    def is_submitted(self, task_key: str) -> bool:
+        entry = self.get(task_key)
+        return entry is not None and entry.state == SUBMITTED
+
+    def pending_submissions(self, subject_id: str, block_id: str) -> List[JournalEntry]:
+        """已评分、应自动提交但尚未提交的试卷（上次运行在提交前中断）"""
+        with self._lock:
+            return [
+                entry for entry in self._entries.values()
+                if entry.state == SCORED
+                and entry.api_scores is not None
+                and (entry.subject_id, entry.block_id) == (subject_id, block_id)
+            ]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for entry in self._entries.values():
+                counts[entry.state] = counts.get(entry.state, 0) + 1
+            return counts
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_journal: Optional[GradingJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> GradingJournal:
+    """获取进程内共享的阅卷日志，未开启时只在内存中记录"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = GradingJournal(JOURNAL_PATH if JOURNAL_ENABLED else None)
+    return _journal
@@ -1,15 +1,37 @@
 import json
 import os
-from typing import List, Dict
+import time
+from contextlib import nullcontext
+from typing import List, Dict, Optional, Set, Tuple, Union
 
 import requests
 from rich.console import Console
 from rich.table import Table
 
 from answer_checker import AnswerChecker
+from answer_rules import BlankKey
+from answer_store import api_scores_to_dict, get_answer_store
 from api_client import ScoringAPIClient
+from cascade import CascadePolicy, cascade_stats, get_cascade_policy
+from composite import composite_stats
+from config import (
+    MULTI_QUESTION_RECOGNITION,
+    ANSWER_REPAIR_ENABLED,
+    IMAGE_IN_MEMORY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    FETCH_COUNT,
+)
+from dashboard import Dashboard, dashboard_stats, get_paper_log, is_headless, report
+from fetch_pacer import FetchPacer
 from image_processor import ImageProcessor
-from models import AnswerSheet, StudentAnswer
+from image_spool import get_default_spool
+from item_analysis import get_item_analyzer
+from journal import FETCHED, DOWNLOADED, RECOGNIZED, SCORED, SUBMITTED, REVIEW, GradingJournal, get_journal
+from metrics import current_paper, get_metrics
+from models import AnswerSheet, ScoringResult, StudentAnswer
+from routing import RoutingPolicy, get_review_queue, routing_stats
+from sheet_classifier import BLANK, DUPLICATE, SheetMatch, get_sheet_classifier, sheet_stats
 
 console = Console()
 
@@ -19,52 +41,117 @@ def load_standard_answer(file_path: str) -> AnswerSheet:
         data = json.load(f)
     return AnswerSheet(**data)
 
-def save_image(url: str, kaohao: str) -> str:
+def download_image(url: str, api_client: Optional[ScoringAPIClient] = None) -> bytes:
+    """下载图片，返回图片内容；传入api_client时复用其连接池"""
+    if api_client is not None:
+        return api_client.download_image(url)
+    with get_metrics().stage("download") as record:
+        response = requests.get(url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        response.raise_for_status()
+        record.bytes = len(response.content)
+        return response.content
+
+def save_image(url: str, kaohao: str, api_client: Optional[ScoringAPIClient] = None) -> str:
     """下载并保存图片到data/images目录"""
-    # 创建images目录
-    images_dir = os.path.join("data", "images")
-    os.makedirs(images_dir, exist_ok=True)
-    
-    # 直接用考号作为文件名
-    image_name = f"{kaohao}.png"
-    image_path = os.path.join(images_dir, image_name)
-    
-    # 下载并保存图片
-    response = requests.get(url)
-    response.raise_for_status()
-    
-    with open(image_path, 'wb') as f:
-        f.write(response.content)
-    
-    return image_path
-
-def extract_part_score(comments: List[str], question_number: int, part_number: int) -> int:
-    """从评分意见中提取某一小题的得分"""
-    for comment in comments:
-        if f"第{question_number}题第{part_number}小题（得分：" in comment:
-            # 提取得分，格式如："得分：2/3分"
-            score_part = comment.split("得分：")[1].split("/")[0]
-            return int(score_part)
-    return 0
-
-def convert_to_api_scores(score: float, comments: List[str], question_number: int) -> List[Dict[str, str]]:
-    """将我们的评分结果转换为API所需的格式"""
-    return [
-        {
-            "key": f"{question_number}.{part_number}",
-            "score": str(extract_part_score(comments, question_number, part_number))
-        }
-        for part_number in range(1, 4)  # 假设有3个小问
-    ]
-
-def display_scoring_info(
-    student_answers: List[StudentAnswer],
-    standard_answer: AnswerSheet,
-    score: float,
-    comments: List[str],
-    api_scores: List[Dict[str, str]]
+    return store_image(download_image(url, api_client), kaohao, in_memory=False)
+
+def store_image(image_bytes: bytes, kaohao: str, in_memory: bool = IMAGE_IN_MEMORY) -> Union[str, bytes]:
+    """
+    按图片模式保存已下载的图片
+
+    内存模式下返回图片内容，只在启用审计留存时写入有容量上限的目录；
+    否则保存到data/images并返回路径。
+    """
+    if not in_memory:
+        # 创建images目录，直接用考号作为文件名
+        images_dir = os.path.join("data", "images")
+        os.makedirs(images_dir, exist_ok=True)
+        image_path = os.path.join(images_dir, f"{kaohao}.png")
+        with open(image_path, 'wb') as f:
+            f.write(image_bytes)
+        return image_path
+
+    spool = get_default_spool()
+    if spool is not None:
+        spool.save(kaohao, image_bytes)
+    return image_bytes
+
+def fetch_image(
+    url: str,
+    kaohao: str,
+    in_memory: bool = IMAGE_IN_MEMORY,
+    api_client: Optional[ScoringAPIClient] = None
+) -> Union[str, bytes]:
+    """获取试卷图片，返回图片路径或内存中的图片内容"""
+    return store_image(download_image(url, api_client), kaohao, in_memory)
+
+def convert_to_api_scores(result: ScoringResult, question_numbers: List[int]) -> List[Dict[str, str]]:
+    """将我们的评分结果转换为API所需的格式，每个小题一项"""
+    return result.to_api_scores(question_numbers)
+
+def store_answers(
+    task_key: str,
+    answers: List[StudentAnswer],
+    api_scores: List[Dict[str, str]],
+    subject_id: Optional[str] = None,
+    block_id: Optional[str] = None,
+    kaohao: Optional[str] = None,
+    pending_review: bool = False
 ):
-    """显示评分信息"""
+    """
+    把识别结果与提交的得分写入列式存储，供修改标准答案后重新评分；写入失败不影响阅卷
+
+    自动提交的试卷在提交成功后写入；送复核的试卷以pending_review写入，复核提交后再记录得分。
+    """
+    store = get_answer_store()
+    if store is None:
+        return
+    try:
+        store.record(
+            task_key, answers, api_scores_to_dict(api_scores), subject_id, block_id, kaohao, pending_review
+        )
+    except Exception as e:
+        report(f"保存识别结果失败: {str(e)}", "red", event="error")
+
+def log_scoring_info(result: ScoringResult, api_scores: List[Dict[str, str]]):
+    """把评分明细写入逐份日志：每个空为[编号, 学生答案, 标准答案, 是否正确]"""
+    get_paper_log().write(
+        "scored",
+        score=result.total_score,
+        blanks=[
+            [
+                f"{part.question_number}.{part.part_number}.{blank.blank_number}",
+                blank.content,
+                blank.standard_answer,
+                blank.is_correct
+            ]
+            for part in result.parts
+            for blank in part.blanks
+            if blank.content is not None
+        ],
+        comments=result.comments,
+        api_scores=api_scores
+    )
+
+def analyze_result(result: ScoringResult):
+    """汇入逐空试题分析，新发现疑似标准答案有误的空时提示"""
+    analyzer = get_item_analyzer()
+    if analyzer is None:
+        return
+    try:
+        flagged = analyzer.record(result)
+    except Exception as e:
+        report(f"试题分析失败: {str(e)}", "red", event="error")
+        return
+    for item in flagged:
+        report(f"{item.describe()}，请检查标准答案", "bold red", event="suspect", blank=item.key)
+
+def display_scoring_info(result: ScoringResult, api_scores: List[Dict[str, str]]):
+    """显示评分信息，无界面模式下只写入逐份日志"""
+    if is_headless():
+        log_scoring_info(result, api_scores)
+        return
+
     # 创建表格显示答案对比
     table = Table(title="答案对比")
     table.add_column("题号", style="cyan")
@@ -72,160 +159,473 @@ def display_scoring_info(
     table.add_column("标准答案", style="green")
     table.add_column("得分", style="magenta")
 
-    # 创建AnswerChecker实例用于获取标准答案
-    checker = AnswerChecker(standard_answer)
-
-    # 添加答案对比
-    for answer in student_answers:
-        question = next(
-            (q for q in standard_answer.questions if q.number == answer.question_number),
-            None
-        )
-        if question:
-            part = next(
-                (p for p in question.parts if p.number == answer.part_number),
-                None
+    # 添加答案对比，直接使用评分结果，不再重复判分
+    for part in result.parts:
+        for blank in part.blanks:
+            if blank.content is None:
+                continue
+            table.add_row(
+                f"{part.question_number}.{part.part_number}.{blank.blank_number}",
+                blank.content,
+                blank.standard_answer,
+                "✓" if blank.is_correct else "✗"
             )
-            if part:
-                # 使用AnswerChecker的方法获取标准答案
-                standard = checker.get_standard_answer_text(part, answer.blank_number)
-                is_correct = checker.check_answer_correctness(answer.content, part, answer.blank_number)
-                table.add_row(
-                    f"{answer.question_number}.{answer.part_number}.{answer.blank_number}",
-                    answer.content,
-                    standard,
-                    "✓" if is_correct else "✗"
-                )
 
     console.print(table)
     
     # 显示评分意见
     console.print("\n[bold cyan]评分意见:[/bold cyan]")
-    for comment in comments:
+    for comment in result.comments:
         console.print(f"- {comment}")
     
     # 显示准备提交的数据
     console.print("\n[bold cyan]准备提交的数据:[/bold cyan]")
     console.print(api_scores)
 
-def process_answer_sheet(image_path: str, question_numbers: List[int]) -> List[StudentAnswer]:
-    """处理答题卡图片"""
-    processor = ImageProcessor()
+def display_stage_metrics():
+    """显示各阶段耗时统计，并写出cProfile采样结果"""
+    metrics = get_metrics()
+    summary = metrics.summary()
+    if not summary:
+        return
+    table = Table(title="各阶段耗时")
+    table.add_column("阶段", style="cyan")
+    table.add_column("次数", justify="right")
+    table.add_column("平均(ms)", justify="right")
+    table.add_column("p50(ms)", justify="right")
+    table.add_column("p95(ms)", justify="right")
+    table.add_column("p99(ms)", justify="right")
+    table.add_column("字节数", justify="right")
+    table.add_column("失败", justify="right", style="red")
+    for stage, row in summary.items():
+        table.add_row(
+            stage,
+            str(row["count"]),
+            f"{row['avg_ms']:.1f}",
+            f"{row['p50_ms']:.1f}",
+            f"{row['p95_ms']:.1f}",
+            f"{row['p99_ms']:.1f}",
+            str(row["bytes"]),
+            str(row["errors"])
+        )
+    console.print(table)
+    if sheet_stats.checked:
+        console.print(f"[cyan]快速分类：{sheet_stats.describe()}[/cyan]")
+    if composite_stats.requests:
+        console.print(f"[cyan]合并识别：{composite_stats.describe()}[/cyan]")
+    if cascade_stats.papers:
+        console.print(f"[cyan]分级识别：{cascade_stats.describe()}[/cyan]")
+    analyzer = get_item_analyzer()
+    if analyzer is not None and analyzer.papers:
+        console.print(f"[cyan]试题分析：{analyzer.describe()}[/cyan]")
+        for item in analyzer.suspects():
+            console.print(f"[bold red]  {item.describe()}[/bold red]")
+        snapshot_path = analyzer.save()
+        if snapshot_path:
+            console.print(f"[cyan]试题分析已写入: {snapshot_path}[/cyan]")
+    profile_path = metrics.dump_profile()
+    if profile_path:
+        console.print(f"[cyan]热点采样已写入: {profile_path}[/cyan]")
+
+def recognize_answers(
+    processor: ImageProcessor,
+    image: Union[str, bytes],
+    question_numbers: List[int],
+    multi_question: bool = MULTI_QUESTION_RECOGNITION,
+    pos: Optional[List[Dict]] = None,
+    expected_blanks: Optional[Set[BlankKey]] = None,
+    repair: bool = ANSWER_REPAIR_ENABLED
+) -> List[StudentAnswer]:
+    """用指定的模型识别答题卡：多题一次识别，失败的题目逐题识别，最后补识别缺失的空"""
+    answers_by_question: Dict[int, List[StudentAnswer]] = {}
+
+    # 多道题时先一次性识别，只发送一次图片
+    if multi_question and len(question_numbers) > 1:
+        answers_by_question = processor.process_image_multi(image, question_numbers, pos, expected_blanks)
+
     all_answers = []
     for question_number in question_numbers:
-        answers = processor.process_image(image_path, question_number)
+        answers = answers_by_question.get(question_number)
+        if answers is None:
+            # 逐题识别作为回退
+            answers = processor.process_image(image, question_number, pos, expected_blanks)
         all_answers.extend(answers)
+
+    if repair and expected_blanks:
+        all_answers = processor.repair_answers(image, all_answers, expected_blanks, pos)
     return all_answers
 
+def classify_sheet(
+    image: Union[str, bytes],
+    question_numbers: List[int],
+    pos: Optional[List[Dict]] = None
+) -> Tuple[Optional[SheetMatch], Optional[List[StudentAnswer]]]:
+    """
+    调用模型前的快速分类
+
+    Returns:
+        (分类结果, 不需要调用模型时的识别结果)：空白卡为空列表，近似的答题卡为复用的结果
+    """
+    classifier = get_sheet_classifier()
+    if classifier is None:
+        return None, None
+    context = ",".join(str(number) for number in question_numbers)
+    with get_metrics().stage("classify"):
+        match = classifier.classify(image, context, pos)
+    if match.kind == BLANK:
+        report("空白答题卡，不调用模型，判为未作答", "cyan", event="classify", kind=BLANK)
+        return match, []
+    if match.kind == DUPLICATE:
+        report(
+            f"与已识别的答题卡相似度 {match.similarity:.1%}，复用识别结果", "cyan",
+            event="classify", kind=DUPLICATE, similarity=match.similarity
+        )
+        return match, match.answers
+    return match, None
+
+def remember_sheet(
+    match: Optional[SheetMatch],
+    question_numbers: List[int],
+    answers: List[StudentAnswer],
+    expected_blanks: Optional[Set[BlankKey]] = None
+):
+    """只记住完整的识别结果，供之后近似的答题卡复用"""
+    classifier = get_sheet_classifier()
+    if classifier is None or match is None or match.features is None:
+        return
+    recognized = {(answer.question_number, answer.part_number, answer.blank_number) for answer in answers}
+    if not expected_blanks or expected_blanks <= recognized:
+        context = ",".join(str(number) for number in question_numbers)
+        classifier.remember(match.features, context, answers)
+
+def escalate_sheet(
+    cascade: CascadePolicy,
+    image: Union[str, bytes],
+    answers: List[StudentAnswer],
+    pos: Optional[List[Dict]] = None,
+    expected_blanks: Optional[Set[BlankKey]] = None
+) -> List[StudentAnswer]:
+    """分级识别的第二级：快速模型不确定的空交给主模型"""
+    blanks = cascade.blanks_to_escalate(answers)
+    answers, resolved = ImageProcessor().escalate_answers(image, answers, blanks, pos, expected_blanks)
+    cascade_stats.record(len(answers), len(blanks), resolved)
+    return answers
+
+def recognize_sheet(
+    image: Union[str, bytes],
+    question_numbers: List[int],
+    multi_question: bool = MULTI_QUESTION_RECOGNITION,
+    pos: Optional[List[Dict]] = None,
+    expected_blanks: Optional[Set[BlankKey]] = None,
+    repair: bool = ANSWER_REPAIR_ENABLED
+) -> List[StudentAnswer]:
+    """调用模型识别一张答题卡，开启分级识别时先用快速模型"""
+    processor = ImageProcessor()
+    cascade = get_cascade_policy()
+    if cascade is None:
+        return recognize_answers(processor, image, question_numbers, multi_question, pos, expected_blanks, repair)
+
+    # 分级识别：快速模型识别整张答题卡，只把不确定的空交给主模型
+    with get_metrics().stage("cascade_fast"):
+        answers = recognize_answers(
+            ImageProcessor(model_name=cascade.fast_model),
+            image, question_numbers, multi_question, pos, expected_blanks, repair
+        )
+    if answers:
+        return escalate_sheet(cascade, image, answers, pos, expected_blanks)
+    report("快速模型没有识别出答案，改用主模型识别", "yellow")
+    answers = recognize_answers(processor, image, question_numbers, multi_question, pos, expected_blanks, repair)
+    cascade_stats.record(len(answers), fallback=True)
+    return answers
+
+def process_answer_sheet(
+    image: Union[str, bytes],
+    question_numbers: List[int],
+    multi_question: bool = MULTI_QUESTION_RECOGNITION,
+    pos: Optional[List[Dict]] = None,
+    expected_blanks: Optional[Set[BlankKey]] = None,
+    repair: bool = ANSWER_REPAIR_ENABLED
+) -> Optional[List[StudentAnswer]]:
+    """
+    处理答题卡图片
+
+    expected_blanks为标准答案中的空：流式识别时全部识别出即提前结束；
+    识别结果仍缺少其中的空时，只针对缺失的空补识别一次。
+    开启分级识别时先用快速模型识别，置信度低或字迹模糊的空再交给主模型。
+
+    Returns:
+        识别结果；空白答题卡返回空列表（评分为未作答），识别失败返回None
+    """
+    # 先做快速分类：空白卡不调用模型，近似的答题卡复用识别结果
+    match, answers = classify_sheet(image, question_numbers, pos)
+    if answers is not None:
+        return answers
+
+    all_answers = recognize_sheet(image, question_numbers, multi_question, pos, expected_blanks, repair)
+    if not all_answers:
+        return None
+    remember_sheet(match, question_numbers, all_answers, expected_blanks)
+    return all_answers
+
+def process_answer_sheets(
+    images: List[Union[str, bytes]],
+    question_numbers: List[int],
+    pos_list: Optional[List[Optional[List[Dict]]]] = None,
+    expected_blanks: Optional[Set[BlankKey]] = None,
+    multi_question: bool = MULTI_QUESTION_RECOGNITION,
+    repair: bool = ANSWER_REPAIR_ENABLED
+) -> List[Optional[List[StudentAnswer]]]:
+    """
+    合并识别多名学生的答题卡，结果与images一一对应
+
+    快速分类后剩下的答题卡拼图识别；拆回失败或结果不完整（缺少expected_blanks中的空）的
+    改用process_answer_sheet的方式单独识别。开启分级识别时拼图交给快速模型。
+    """
+    pos_list = pos_list or [None] * len(images)
+    results: List[Optional[List[StudentAnswer]]] = [None] * len(images)
+    matches: Dict[int, Optional[SheetMatch]] = {}
+    for index, (image, pos) in enumerate(zip(images, pos_list)):
+        match, answers = classify_sheet(image, question_numbers, pos)
+        if answers is not None:
+            results[index] = answers
+        else:
+            matches[index] = match
+
+    pending = list(matches)
+    cascade = get_cascade_policy()
+    processor = ImageProcessor(model_name=cascade.fast_model if cascade is not None else None)
+    if len(pending) > 1:
+        batch_results = processor.recognize_composite(
+            [images[index] for index in pending], question_numbers, [pos_list[index] for index in pending]
+        )
+    else:
+        batch_results = [None] * len(pending)
+
+    for index, answers in zip(pending, batch_results):
+        recognized = {
+            (answer.question_number, answer.part_number, answer.blank_number) for answer in answers or []
+        }
+        mapped = bool(answers) and (not expected_blanks or expected_blanks <= recognized)
+        if len(pending) > 1:
+            composite_stats.record_result(mapped)
+        if mapped and cascade is not None:
+            answers = escalate_sheet(cascade, images[index], answers, pos_list[index], expected_blanks)
+        elif not mapped:
+            answers = recognize_sheet(
+                images[index], question_numbers, multi_question, pos_list[index], expected_blanks, repair
+            )
+        if answers:
+            remember_sheet(matches[index], question_numbers, answers, expected_blanks)
+            results[index] = answers
+    return results
+
+def submit_once(
+    api_client: ScoringAPIClient,
+    journal: GradingJournal,
+    subject_id: str,
+    block_id: str,
+    task_key: str,
+    api_scores: List[Dict[str, str]]
+) -> Optional[Dict]:
+    """提交分数并记入日志与识别结果存储；日志中已提交的试卷不再提交，返回None"""
+    if journal.is_submitted(task_key):
+        return None
+    result = api_client.submit_score(
+        subject_id=subject_id,
+        block_id=block_id,
+        task_key=task_key,
+        scores=api_scores
+    )
+    entry = journal.record(task_key, SUBMITTED)
+    if entry.answers is not None:
+        store_answers(task_key, entry.answers, api_scores, subject_id, block_id, entry.kaohao)
+    return result
+
+def resume_submissions(api_client: ScoringAPIClient, journal: GradingJournal, subject_id: str, block_id: str):
+    """提交上次运行中已评分、但在提交前中断的试卷"""
+    pending = journal.pending_submissions(subject_id, block_id)
+    if not pending:
+        return
+    console.print(f"[cyan]日志中有 {len(pending)} 份已评分未提交的试卷，先行提交[/cyan]")
+    for entry in pending:
+        try:
+            submit_once(api_client, journal, subject_id, block_id, entry.task_key, entry.api_scores)
+            report(f"试卷 {entry.kaohao} 已提交", "green", event="submitted", kaohao=entry.kaohao)
+        except Exception as e:
+            report(f"提交试卷 {entry.kaohao} 时发生错误: {str(e)}", "red", event="error", kaohao=entry.kaohao)
+
 def main(
     api_client: ScoringAPIClient,
     subject_id: str,
     block_id: str,
     standard_answer_path: str,
-    question_numbers: List[int]
+    question_numbers: List[int],
+    routing_policy: Optional[RoutingPolicy] = None,
+    journal: Optional[GradingJournal] = None
 ):
-    """主程序入口"""
+    """主程序入口，按阅卷日志续跑：已提交的跳过，已识别的不再调用模型"""
     try:
         # 加载标准答案
         console.print("[bold cyan]正在加载标准答案...[/bold cyan]")
         standard_answer = load_standard_answer(standard_answer_path)
+        checker = AnswerChecker(standard_answer)
+        expected_blanks = checker.rules.expected_blanks(question_numbers)
+        routing_policy = routing_policy or RoutingPolicy()
+        review_queue = get_review_queue()
+        journal = journal or get_journal()
+        resume_submissions(api_client, journal, subject_id, block_id)
+        # 已处理过的试卷（送复核或失败的试卷在提交前会被平台重复下发）
+        handled: Set[str] = set()
+        pacer = FetchPacer(FETCH_COUNT)
         
-        while True:
-            # 获取待阅试卷
-            tasks = api_client.get_tasks(subject_id, block_id)
-            if not tasks:
-                console.print("[yellow]没有更多待阅试卷[/yellow]")
-                break
-                
-            for task in tasks:
-                try:
-                    console.print(f"\n[bold cyan]处理试卷 {task.kaohao}...[/bold cyan]")
-                    
-                    # 保存试卷图片
-                    image_path = save_image(task.block_img, task.kaohao)
-                    console.print(f"[green]图片已保存: {image_path}[/green]")
-                    
-                    # 处理答题卡图片
-                    student_answers = process_answer_sheet(image_path, question_numbers)
-                    
-                    if not student_answers:
-                        console.print("[red]警告：未能识别到任何答案[/red]")
-                        continue
-                    
-                    # 检查答案
-                    console.print("\n[bold cyan]正在评分...[/bold cyan]")
-                    checker = AnswerChecker(standard_answer)
-                    score, comments = checker.check_answer(student_answers)
-                    
-                    # 准备API评分数据
-                    api_scores = convert_to_api_scores(score, comments, question_numbers[0])
-                    
-                    # 显示评分信息
-                    display_scoring_info(
-                        student_answers,
-                        standard_answer,
-                        score,
-                        comments,
-                        api_scores
+        with Dashboard() if is_headless() else nullcontext():
+            while True:
+                # 获取待阅试卷
+                returned = api_client.get_tasks(subject_id, block_id, pacer.count)
+                if not returned:
+                    console.print("[yellow]没有更多待阅试卷[/yellow]")
+                    break
+                tasks = [task for task in returned if task.task_key not in handled]
+                wait = pacer.update(len(returned), len(tasks))
+                if wait is None:
+                    console.print(
+                        f"[yellow]连续 {pacer.idle_polls} 次只取到处理过的试卷（送复核或处理失败），停止获取[/yellow]"
                     )
-                    
-                    # 等待用户确认或自动提交
-                    import sys
-                    import select
-                    import time
-                    
-                    console.print("\n[yellow]3秒后自动提交，按N进行手动评分...[/yellow]")
-                    
-                    # 实现3秒倒计时，同时监听输入
-                    start_time = time.time()
-                    while time.time() - start_time < 3:
-                        remaining = 3 - int(time.time() - start_time)
-                        print(f"\r倒计时: {remaining}秒...", end="", flush=True)
-                        
-                        # 检查是否有输入
-                        if sys.stdin in select.select([sys.stdin], [], [], 0)[0]:
-                            user_input = sys.stdin.readline().strip().upper()
-                            if user_input == 'N':
-                                print("\n")  # 清除倒计时行
-                                # 手动输入分数
-                                try:
-                                    console.print("[cyan]请依次输入三个小题的分数（用空格分隔，如：3 3 1）：[/cyan]")
-                                    scores = input().strip().split()
-                                    if len(scores) != 3:
-                                        raise ValueError("必须输入3个分数")
-                                    scores = [int(s) for s in scores]
-                                    # 更新api_scores
-                                    for i, score in enumerate(scores, 1):
-                                        api_scores[i-1]["score"] = str(score)
-                                except ValueError as e:
-                                    console.print(f"[red]输入错误：{str(e)}[/red]")
-                                    continue
-                            break
-                        time.sleep(0.1)
-                    
-                    print("\n")  # 清除倒计时行
-                    
-                    # 提交分数
+                    break
+                if not tasks:
+                    time.sleep(wait)
+                    continue
+
+                for task in tasks:
+                    handled.add(task.task_key)
+                    # 之后各阶段的耗时记录都关联到这份试卷
+                    current_paper.set(task.task_key)
+                    entry = journal.get(task.task_key)
+                    if entry is not None and entry.done:
+                        action = "提交" if entry.state == SUBMITTED else "送复核"
+                        report(f"试卷 {task.kaohao} 已在之前的运行中{action}，跳过", "yellow", event="skipped")
+                        dashboard_stats.record_skipped()
+                        continue
+                    stage = "download"
                     try:
-                        result = api_client.submit_score(
-                            subject_id=subject_id,
-                            block_id=block_id,
-                            task_key=task.task_key,
-                            scores=api_scores
-                        )
-                        console.print(f"\n[green]分数提交成功，已阅数量: {result.get('available', 0)}[/green]")
+                        report(f"\n处理试卷 {task.kaohao}...", "bold cyan", event="started", kaohao=task.kaohao)
+
+                        if entry is not None and entry.answers is not None:
+                            # 上次运行已识别，不再下载和调用模型
+                            report("使用阅卷日志中的识别结果", "cyan")
+                            student_answers = entry.answers
+                        else:
+                            if entry is None:
+                                journal.record(
+                                    task.task_key, FETCHED,
+                                    subject_id=subject_id, block_id=block_id, kaohao=task.kaohao
+                                )
+
+                            # 获取试卷图片，上次运行已落盘的直接使用
+                            if entry is not None and entry.image and os.path.exists(entry.image):
+                                image = entry.image
+                            else:
+                                image = fetch_image(task.block_img, task.kaohao, api_client=api_client)
+                                journal.record(
+                                    task.task_key, DOWNLOADED, image=image if isinstance(image, str) else None
+                                )
+                            if isinstance(image, str):
+                                report(f"图片已保存: {image}", "green")
+                            else:
+                                report(f"图片已下载: {len(image)} 字节", "green")
+
+                            # 处理答题卡图片
+                            stage = "recognize"
+                            student_answers = process_answer_sheet(
+                                image, question_numbers, pos=task.pos, expected_blanks=expected_blanks
+                            )
+
+                            if student_answers is None:
+                                report("警告：未能识别到任何答案", "red", event="failed")
+                                dashboard_stats.record_failed(stage)
+                                continue
+                            journal.record(task.task_key, RECOGNIZED, answers=student_answers)
+
+                        # 检查答案
+                        stage = "score"
+                        report("\n正在评分...", "bold cyan")
+                        with get_metrics().stage("score"):
+                            scoring_result = checker.check_answer(student_answers)
+
+                        # 准备API评分数据
+                        api_scores = convert_to_api_scores(scoring_result, question_numbers)
+                        analyze_result(scoring_result)
+
+                        # 显示评分信息
+                        display_scoring_info(scoring_result, api_scores)
+
+                        # 按置信度分流：可信的立即提交，存疑的送人工复核（由review.py处理），不等待
+                        decision = routing_policy.decide(student_answers, scoring_result)
+                        routing_stats.record(decision)
+                        if decision.needs_review:
+                            review_queue.put(
+                                task.task_key, task.kaohao, subject_id, block_id,
+                                scoring_result, api_scores, decision
+                            )
+                            journal.record(task.task_key, REVIEW, api_scores=api_scores)
+                            store_answers(
+                                task.task_key, student_answers, api_scores, subject_id, block_id, task.kaohao,
+                                pending_review=True
+                            )
+                            report(f"已送人工复核：{decision.describe()}", "yellow", event="review")
+                            dashboard_stats.record_reviewed(scoring_result.total_score)
+                            continue
+
+                        # 提交分数
+                        journal.record(task.task_key, SCORED, api_scores=api_scores)
+                        try:
+                            result = submit_once(api_client, journal, subject_id, block_id, task.task_key, api_scores)
+                            if result is not None:
+                                report(
+                                    f"\n分数提交成功，已阅数量: {result.get('available', 0)}", "green",
+                                    event="submitted"
+                                )
+                            dashboard_stats.record_submitted(scoring_result.total_score)
+                        except Exception as e:
+                            report(f"提交分数时发生错误: {str(e)}", "red", event="failed")
+                            dashboard_stats.record_failed("submit")
+
                     except Exception as e:
-                        console.print(f"[red]提交分数时发生错误: {str(e)}[/red]")
-                    
-                except Exception as e:
-                    console.print(f"[red]处理试卷时发生错误: {str(e)}[/red]")
-                    continue
+                        report(f"处理试卷时发生错误: {str(e)}", "red", event="failed")
+                        dashboard_stats.record_failed(stage)
+                        continue
+
+        console.print(f"\n[bold cyan]分流结果：{routing_stats.describe()}[/bold cyan]")
+        display_stage_metrics()
                     
     except Exception as e:
         console.print(f"[red]发生错误: {str(e)}[/red]")
         import traceback
         console.print(traceback.format_exc())
 
+def main_concurrent(
+    api_client: ScoringAPIClient,
+    subject_id: str,
+    block_id: str,
+    standard_answer_path: str,
+    question_numbers: List[int]
+):
+    """流水线模式入口：下载、识别、提交并发进行，存疑的试卷送人工复核"""
+    import asyncio
+    from pipeline import GradingPipeline
+
+    console.print("[bold cyan]正在加载标准答案...[/bold cyan]")
+    standard_answer = load_standard_answer(standard_answer_path)
+
+    pipeline = GradingPipeline(
+        api_client,
+        subject_id,
+        block_id,
+        standard_answer,
+        question_numbers
+    )
+    return asyncio.run(pipeline.run())
+
 if __name__ == "__main__":
     # API配置
     base_url = "https://yue.haofenshu.com"
@@ -241,5 +641,10 @@ if __name__ == "__main__":
     block_id = "阅卷参数block_id"
     standard_answer_path = "./data/standard_answer.json"
     question_numbers = [28]
+    use_pipeline = False  # 为True时使用并发流水线模式
     
-    main(api_client, subject_id, block_id, standard_answer_path, question_numbers) 
+    if use_pipeline:
+        main_concurrent(api_client, subject_id, block_id, standard_answer_path, question_numbers)
+    else:
+        main(api_client, subject_id, block_id, standard_answer_path, question_numbers) 
+
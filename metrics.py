@@ -0,0 +1,295 @@
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional, Tuple
+
+from config import (
+    METRICS_ENABLED,
+    METRICS_JSONL_PATH,
+    METRICS_JSONL_MAX_BYTES,
+    METRICS_PROMETHEUS_PORT,
+    METRICS_PROFILE_PATH,
+    METRICS_PROFILE_STAGES,
+)
+
+# 耗时直方图的分桶上界（秒）
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 当前处理的试卷（task_key），由main与流水线设置，写入每条耗时记录
+current_paper: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_paper", default=None)
+
+
+@contextmanager
+def paper(task_key: str):
+    """在上下文中标记当前试卷"""
+    token = current_paper.set(task_key)
+    try:
+        yield
+    finally:
+        current_paper.reset(token)
+
+
+class StageRecord:
+    """单次阶段调用的记录，调用方可在上下文中补充字节数与结果"""
+    __slots__ = ("stage", "bytes", "outcome")
+
+    def __init__(self, stage: str, nbytes: int = 0):
+        self.stage = stage
+        self.bytes = nbytes
+        self.outcome = "ok"
+
+
+class StageSummary:
+    """单个阶段的累计统计"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+        self.bucket_counts = [0] * len(DURATION_BUCKETS)
+        self.outcomes: Dict[str, int] = {}
+
+    def add(self, duration: float, nbytes: int, outcome: str):
+        self.count += 1
+        self.total_seconds += duration
+        self.total_bytes += nbytes
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """按直方图线性插值估算分位数（秒）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(DURATION_BUCKETS, self.bucket_counts):
+            if count and seen + count >= target:
+                return lower + (bound - lower) * (target - seen) / count
+            seen += count
+            lower = bound
+        return DURATION_BUCKETS[-1]
+
+
+class MetricsRecorder:
+    """
+    各阶段耗时、字节数与结果的记录器
+
+    每次调用计入内存中的直方图，可导出为Prometheus文本格式；
+    配置了jsonl_path时逐条追加写入并按大小轮转；
+    配置了profile_path时，对profile_stages中的阶段开启cProfile采样：进程内只有一个profiler，
+    同一时间只对一个阶段开启（Python 3.12起同一进程只能有一个活动的profiler），其他并发的阶段不采样。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = METRICS_ENABLED,
+        jsonl_path: Optional[str] = METRICS_JSONL_PATH,
+        jsonl_max_bytes: int = METRICS_JSONL_MAX_BYTES,
+        profile_path: Optional[str] = METRICS_PROFILE_PATH,
+        profile_stages: Tuple[str, ...] = METRICS_PROFILE_STAGES
+    ):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.jsonl_max_bytes = jsonl_max_bytes
+        self.profile_path = profile_path
+        self.profile_stages = set(profile_stages) if profile_path else set()
+        self._stages: Dict[str, StageSummary] = {}
+        self._lock = threading.Lock()
+        self._jsonl_file = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._profiling = False
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @contextmanager
+    def stage(self, name: str, nbytes: int = 0) -> Iterator[StageRecord]:
+        """计时一个阶段，异常时结果记为error"""
+        record = StageRecord(name, nbytes)
+        if not self.enabled:
+            yield record
+            return
+        profiler = self._start_profile(name)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            if record.outcome == "ok":
+                record.outcome = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            if profiler is not None:
+                self._stop_profile(profiler)
+            self.observe(name, duration, record.bytes, record.outcome)
+
+    def observe(self, stage: str, duration: float, nbytes: int = 0, outcome: str = "ok"):
+        """记录一次阶段调用"""
+        if not self.enabled:
+            return
+        with self._lock:
+            summary = self._stages.get(stage)
+            if summary is None:
+                summary = self._stages[stage] = StageSummary()
+            summary.add(duration, nbytes, outcome)
+            if self.jsonl_path:
+                self._write_jsonl({
+                    "ts": round(time.time(), 3),
+                    "paper": current_paper.get(),
+                    "stage": stage,
+                    "duration_ms": round(duration * 1000, 3),
+                    "bytes": nbytes,
+                    "outcome": outcome,
+                })
+
+    def _write_jsonl(self, event: Dict):
+        """追加一条记录，超过大小上限时轮转（调用方持有锁）"""
+        if self._jsonl_file is None:
+            directory = os.path.dirname(self.jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._jsonl_file = open(self.jsonl_path, "a", encoding="utf-8", buffering=1)
+        self._jsonl_file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        if self._jsonl_file.tell() >= self.jsonl_max_bytes:
+            self._jsonl_file.close()
+            os.replace(self.jsonl_path, self.jsonl_path + ".1")
+            self._jsonl_file = None
+
+    def _start_profile(self, stage: str) -> Optional[cProfile.Profile]:
+        """开启采样；已有阶段（包括嵌套的阶段）在采样，或其他性能分析工具在运行时跳过"""
+        if stage not in self.profile_stages:
+            return None
+        with self._lock:
+            if self._profiling:
+                return None
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Another profiling tool is already active
+                return None
+            self._profiling = True
+            return self._profiler
+
+    def _stop_profile(self, profiler: cProfile.Profile):
+        with self._lock:
+            profiler.disable()
+            self._profiling = False
+
+    def dump_profile(self, path: Optional[str] = None) -> Optional[str]:
+        """把采样结果写入文件，可用pstats或snakeviz查看"""
+        path = path or self.profile_path
+        with self._lock:
+            profiler = self._profiler
+            if not path or profiler is None or self._profiling:
+                return None
+            stats = pstats.Stats(profiler)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stats.dump_stats(path)
+        return path
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各阶段的次数、平均与分位耗时（毫秒）、字节数和错误数"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": summary.count,
+                    "avg_ms": summary.total_seconds / summary.count * 1000 if summary.count else 0.0,
+                    "p50_ms": summary.quantile(0.50) * 1000,
+                    "p95_ms": summary.quantile(0.95) * 1000,
+                    "p99_ms": summary.quantile(0.99) * 1000,
+                    "bytes": summary.total_bytes,
+                    # 流式识别提前断开(aborted)属于正常结束
+                    "errors": summary.count - summary.outcomes.get("ok", 0) - summary.outcomes.get("aborted", 0),
+                }
+                for stage, summary in self._stages.items()
+            }
+
+    def prometheus_text(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines = [
+            "# HELP grading_stage_duration_seconds 各阶段耗时",
+            "# TYPE grading_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for stage, summary in stages:
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, summary.bucket_counts):
+                    cumulative += count
+                    lines.append(f'grading_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'grading_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {summary.count}')
+                lines.append(f'grading_stage_duration_seconds_sum{{stage="{stage}"}} {summary.total_seconds:.6f}')
+                lines.append(f'grading_stage_duration_seconds_count{{stage="{stage}"}} {summary.count}')
+            lines.append("# HELP grading_stage_bytes_total 各阶段处理的字节数")
+            lines.append("# TYPE grading_stage_bytes_total counter")
+            for stage, summary in stages:
+                lines.append(f'grading_stage_bytes_total{{stage="{stage}"}} {summary.total_bytes}')
+            lines.append("# HELP grading_stage_outcomes_total 各阶段按结果分类的次数")
+            lines.append("# TYPE grading_stage_outcomes_total counter")
+            for stage, summary in stages:
+                for outcome, count in sorted(summary.outcomes.items()):
+                    lines.append(f'grading_stage_outcomes_total{{stage="{stage}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """在后台线程提供/metrics接口"""
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = recorder.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def close(self):
+        """写出采样结果，关闭文件与接口"""
+        self.dump_profile()
+        with self._lock:
+            if self._jsonl_file is not None:
+                self._jsonl_file.close()
+                self._jsonl_file = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_metrics: Optional[MetricsRecorder] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRecorder:
+    """获取进程内共享的记录器，配置了端口时同时启动/metrics接口"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRecorder()
+            if METRICS_ENABLED and METRICS_PROMETHEUS_PORT:
+                _metrics.serve(METRICS_PROMETHEUS_PORT)
+    return _metrics
@@ -0,0 +1,219 @@
+"""
+识别后端注册表
+
+后端提供兼容ZhipuAI SDK chat.completions.create（含stream=True）的客户端，
+以及限流/临时错误的分类，供ImageProcessor与限速器使用。
+客户端在第一次调用模型时才创建，SDK也在那时才导入，只评分的路径不受影响。
+
+自定义后端：
+    register_backend("my-vlm", lambda: MyBackend("my-model"))
+并把config.MODEL_BACKEND（或环境变量MODEL_BACKEND）设为"my-vlm"。
+"""
+import json
+import re
+import threading
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+from config import (
+    MODEL_BACKEND,
+    MODEL_NAME,
+    MODEL_SDK_MAX_RETRIES,
+    ZHIPUAI_API_KEY,
+    ZHIPUAI_BASE_URL,
+)
+
+ErrorTypes = Tuple[Type[BaseException], ...]
+
+
+class ModelBackend:
+    """识别后端基类，子类实现create_client并按需声明错误分类"""
+
+    name = ""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """首次使用时创建的客户端"""
+        with self._lock:
+            if self._client is None:
+                self._client = self.create_client()
+        return self._client
+
+    def create_client(self):
+        raise NotImplementedError
+
+    @property
+    def throttle_errors(self) -> ErrorTypes:
+        """限流类错误：降低并发并冷却后重试"""
+        return ()
+
+    @property
+    def transient_errors(self) -> ErrorTypes:
+        """临时错误（含流式读取中途断开）：直接重试"""
+        return ()
+
+    def retry_after(self, error: BaseException) -> Optional[float]:
+        """读取限流响应中的Retry-After头"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        value = headers.get("retry-after") if headers is not None else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+
+class GLM4VBackend(ModelBackend):
+    """智谱AI GLM-4V系列模型"""
+
+    name = "glm-4v"
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        api_key: Optional[str] = ZHIPUAI_API_KEY,
+        base_url: Optional[str] = ZHIPUAI_BASE_URL
+    ):
+        super().__init__(model_name)
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def create_client(self):
+        from zhipuai import ZhipuAI
+
+        # 模型调用的重试由rate_limiter统一控制，SDK内部不再重试
+        return ZhipuAI(api_key=self.api_key, base_url=self.base_url, max_retries=MODEL_SDK_MAX_RETRIES)
+
+    @property
+    def throttle_errors(self) -> ErrorTypes:
+        import zhipuai
+
+        return (zhipuai.APIReachLimitError, zhipuai.APIServerFlowExceedError)
+
+    @property
+    def transient_errors(self) -> ErrorTypes:
+        import httpx
+        import zhipuai
+
+        # APIResponseError为流中返回的错误，TransportError为流式读取中途断开
+        return (
+            zhipuai.APIConnectionError,
+            zhipuai.APIInternalError,
+            zhipuai.APIResponseError,
+            httpx.TransportError,
+        )
+
+
+# ---------- 本地桩 ----------
+
+_QUESTION_PATTERN = re.compile(r"第(\d+)题")
+
+
+def empty_response(prompt: str) -> str:
+    """桩后端的默认回答：提示词中的每道题都没有识别出答案"""
+    numbers = []
+    for match in _QUESTION_PATTERN.findall(prompt):
+        if int(match) not in numbers:
+            numbers.append(int(match))
+    payload = {"questions": [{"question_number": number, "parts": []} for number in numbers]}
+    return "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```"
+
+
+class _StubStream:
+    """模拟SDK的流式响应：可迭代出分段，response.close()结束读取"""
+
+    def __init__(self, chunks: List[SimpleNamespace]):
+        self._chunks = chunks
+        self.response = SimpleNamespace(close=lambda: None)
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        return iter(self._chunks)
+
+
+class _StubCompletions:
+    def __init__(self, responder: Callable[[str], str], chunk_size: int):
+        self.responder = responder
+        self.chunk_size = chunk_size
+
+    def create(self, model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        prompt = "\n".join(
+            item.get("text", "")
+            for message in messages
+            for item in (message["content"] if isinstance(message["content"], list) else [])
+            if item.get("type") == "text"
+        )
+        content = self.responder(prompt)
+        usage = SimpleNamespace(total_tokens=len(content))
+        if not stream:
+            message = SimpleNamespace(role="assistant", content=content)
+            return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message)], usage=usage)
+
+        pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        chunks = [
+            SimpleNamespace(
+                choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece))],
+                usage=usage if index == len(pieces) - 1 else None
+            )
+            for index, piece in enumerate(pieces)
+        ]
+        return _StubStream(chunks)
+
+
+class StubBackend(ModelBackend):
+    """
+    本地桩，不访问网络
+
+    responder根据提示词返回模型的原始文本，默认每道题都返回空结果，
+    用于联调与离线测试流程。
+    """
+
+    name = "stub"
+
+    def __init__(self, responder: Callable[[str], str] = empty_response, chunk_size: int = 16):
+        super().__init__("stub")
+        self.responder = responder
+        self.chunk_size = chunk_size
+
+    def create_client(self):
+        completions = _StubCompletions(self.responder, self.chunk_size)
+        return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+# ---------- 注册表 ----------
+
+_backend_factories: Dict[str, Callable[[], ModelBackend]] = {
+    GLM4VBackend.name: GLM4VBackend,
+    StubBackend.name: StubBackend,
+}
+_backends: Dict[str, ModelBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], ModelBackend]):
+    """注册（或替换）识别后端，已创建的同名后端会被丢弃"""
+    with _backends_lock:
+        _backend_factories[name] = factory
+        _backends.pop(name, None)
+
+
+def available_backends() -> List[str]:
+    with _backends_lock:
+        return sorted(_backend_factories)
+
+
+def get_backend(name: Optional[str] = None) -> ModelBackend:
+    """获取进程内共享的识别后端，默认使用config.MODEL_BACKEND"""
+    name = name or MODEL_BACKEND
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            factory = _backend_factories.get(name)
+            if factory is None:
+                raise ValueError(f"未知的识别后端: {name}，可用: {', '.join(sorted(_backend_factories))}")
+            backend = _backends[name] = factory()
+    return backend
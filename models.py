@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 class QuestionPart(BaseModel):
@@ -24,3 +24,79 @@ class StudentAnswer(BaseModel):
     confidence: float  # 模型对识别结果的置信度
     is_crossed_out: bool  # 是否被划掉
     is_blurry: bool  # 是否模糊不清 
+    is_reused: bool = False  # 复用近似答题卡的识别结果，而非识别自本图
+
+class BlankResult(BaseModel):
+    blank_number: int
+    content: Optional[str] = None  # 学生答案，None表示未作答
+    standard_answer: str
+    is_correct: bool = False  # 答案正确且未被划掉
+    is_crossed_out: bool = False
+    confidence: Optional[float] = None
+    score: int = 0
+
+class PartResult(BaseModel):
+    question_number: int
+    part_number: int
+    status: str  # scored: 已评分, unanswered: 未作答, incomplete: 答案不完整
+    score: int = 0
+    possible_score: int = 0  # 未作答的小题不计入满分
+    blanks_count: int = 1
+    blanks: List[BlankResult] = []
+
+    @property
+    def key(self) -> str:
+        return f"{self.question_number}.{self.part_number}"
+
+    def render_comment(self) -> str:
+        """生成该小题的评分意见"""
+        prefix = f"第{self.question_number}题第{self.part_number}小题"
+        if self.status == "unanswered":
+            return f"{prefix}未作答"
+        if self.status == "incomplete":
+            return f"{prefix}答案不完整"
+
+        lines = []
+        for blank in self.blanks:
+            if blank.content is None:
+                lines.append(f"第{blank.blank_number}空未作答")
+            elif blank.is_crossed_out:
+                lines.append(
+                    f"第{blank.blank_number}空：答案「{blank.content}」被划掉，"
+                    f"标准答案为「{blank.standard_answer}」"
+                )
+            elif blank.is_correct:
+                lines.append(f"第{blank.blank_number}空：答案「{blank.content}」正确 (1分)")
+            else:
+                lines.append(
+                    f"第{blank.blank_number}空：答案「{blank.content}」错误，"
+                    f"标准答案为「{blank.standard_answer}」 (0分)"
+                )
+        score_text = f"得分：{self.score}/{self.blanks_count}分"
+        return f"{prefix}（{score_text}）：\n" + "\n".join(f"  {line}" for line in lines)
+
+class ScoringResult(BaseModel):
+    total_score: int = 0
+    total_possible_score: int = 0
+    parts: List[PartResult] = []
+
+    @property
+    def comments(self) -> List[str]:
+        """评分意见，仅在需要展示时生成"""
+        comments = [f"=== 评分结果 ===\n总分: {self.total_score}/{self.total_possible_score}"]
+        comments.extend(part.render_comment() for part in self.parts)
+        return comments
+
+    def part(self, question_number: int, part_number: int) -> Optional[PartResult]:
+        for part in self.parts:
+            if part.question_number == question_number and part.part_number == part_number:
+                return part
+        return None
+
+    def to_api_scores(self, question_numbers: Optional[List[int]] = None) -> List[Dict[str, str]]:
+        """转换为阅卷平台提交所需的格式，每个小题一项"""
+        return [
+            {"key": part.key, "score": str(part.score)}
+            for part in self.parts
+            if question_numbers is None or part.question_number in question_numbers
+        ]
@@ -0,0 +1,475 @@
+import asyncio
+import contextvars
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Union
+
+from pydantic import BaseModel
+from rich.console import Console
+
+from answer_checker import AnswerChecker
+from api_client import ScoringAPIClient, ScoringTask
+from config import (
+    COMPOSITE_BATCH_ENABLED,
+    COMPOSITE_BATCH_WAIT,
+    COMPOSITE_MAX_TILES,
+    PIPELINE_FETCH_COUNT,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_DOWNLOAD_CONCURRENCY,
+    PIPELINE_RECOGNITION_CONCURRENCY,
+    PIPELINE_SUBMIT_CONCURRENCY,
+)
+from main import (
+    fetch_image,
+    process_answer_sheet,
+    process_answer_sheets,
+    convert_to_api_scores,
+    store_answers,
+    analyze_result,
+    log_scoring_info,
+    display_stage_metrics,
+)
+from dashboard import Dashboard, dashboard_stats, is_headless, report
+from fetch_pacer import FetchPacer
+from journal import FETCHED, DOWNLOADED, RECOGNIZED, SCORED, SUBMITTED, REVIEW, GradingJournal, get_journal
+from metrics import current_paper, get_metrics
+from models import AnswerSheet, StudentAnswer
+from image_preprocessor import preprocess_stats
+from rate_limiter import get_model_limiter
+from recognition_cache import get_default_cache
+from routing import RoutingPolicy, get_review_queue, routing_stats
+
+console = Console()
+
+# 队列结束标记
+_STOP = object()
+
+
+class PaperJob(BaseModel):
+    """流水线中流转的单份试卷"""
+    task: ScoringTask
+    image: Optional[Union[str, bytes]] = None  # 图片路径或内存中的图片内容
+    student_answers: Optional[List[StudentAnswer]] = None  # 空列表表示空白答题卡
+    score: float = 0
+    api_scores: List[Dict[str, str]] = []
+
+
+class PipelineStats(BaseModel):
+    """流水线运行统计"""
+    fetched: int = 0
+    recognized: int = 0
+    submitted: int = 0
+    reviewed: int = 0  # 送人工复核的试卷
+    failed: int = 0
+    skipped: int = 0  # 之前的运行中已完成的试卷
+    started_at: float = 0
+    finished_at: float = 0
+
+    @property
+    def papers_per_minute(self) -> float:
+        elapsed = self.finished_at - self.started_at
+        return (self.submitted + self.reviewed) * 60 / elapsed if elapsed > 0 else 0.0
+
+
+class GradingPipeline:
+    """
+    异步阅卷流水线
+
+    获取、下载、识别评分、提交四个阶段之间用有界队列连接，
+    每个阶段有独立的并发上限，使网络等待与模型调用相互重叠。
+    各阶段的状态变化写入阅卷日志，重启后已完成的试卷跳过，已识别的试卷直接评分提交。
+    开启合并识别时，识别协程从队列中凑齐至多batch_size份试卷，拼图后一次调用模型。
+    """
+
+    def __init__(
+        self,
+        api_client: ScoringAPIClient,
+        subject_id: str,
+        block_id: str,
+        standard_answer: AnswerSheet,
+        question_numbers: List[int],
+        fetch_count: int = PIPELINE_FETCH_COUNT,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        download_concurrency: int = PIPELINE_DOWNLOAD_CONCURRENCY,
+        recognition_concurrency: int = PIPELINE_RECOGNITION_CONCURRENCY,
+        submit_concurrency: int = PIPELINE_SUBMIT_CONCURRENCY,
+        routing_policy: Optional[RoutingPolicy] = None,
+        journal: Optional[GradingJournal] = None,
+        batch_size: int = COMPOSITE_MAX_TILES if COMPOSITE_BATCH_ENABLED else 1,
+        batch_wait: float = COMPOSITE_BATCH_WAIT,
+    ):
+        self.api_client = api_client
+        self.subject_id = subject_id
+        self.block_id = block_id
+        self.standard_answer = standard_answer
+        self.question_numbers = question_numbers
+        self.fetch_count = fetch_count
+        self.queue_size = queue_size
+        self.download_concurrency = download_concurrency
+        self.recognition_concurrency = recognition_concurrency
+        self.submit_concurrency = submit_concurrency
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.checker = AnswerChecker(standard_answer)
+        self.expected_blanks = self.checker.rules.expected_blanks(question_numbers)
+        self.routing_policy = routing_policy or RoutingPolicy()
+        self.review_queue = get_review_queue()
+        self.journal = journal or get_journal()
+        self.stats = PipelineStats()
+        self._seen: Set[str] = set()
+        self._in_flight: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """在线程池中执行阻塞调用，带上当前协程的上下文（如正在处理的试卷）"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, lambda: context.run(func, *args, **kwargs))
+
+    async def _call_client(self, method_name: str, *args, **kwargs):
+        """在线程池中调用平台客户端"""
+        return await self._run_blocking(getattr(self.api_client, method_name), *args, **kwargs)
+
+    async def _fetch_stage(self, out_queue: asyncio.Queue):
+        """获取待阅试卷，队列满时自然形成背压"""
+        pacer = FetchPacer(self.fetch_count)
+        while True:
+            try:
+                tasks = await self._call_client(
+                    "get_tasks", self.subject_id, self.block_id, pacer.count
+                )
+            except Exception as e:
+                console.print(f"[red]获取试卷时发生错误: {str(e)}[/red]")
+                dashboard_stats.record_error("fetch")
+                break
+
+            if not tasks:
+                console.print("[yellow]没有更多待阅试卷[/yellow]")
+                break
+
+            # 平台在提交前可能重复下发同一份试卷，按task_key去重
+            new_tasks = [task for task in tasks if task.task_key not in self._seen]
+            wait = pacer.update(len(tasks), len(new_tasks), busy=bool(self._in_flight))
+            if wait is None:
+                console.print(
+                    f"[yellow]连续 {pacer.idle_polls} 次只取到处理过的试卷（送复核或处理失败），停止获取[/yellow]"
+                )
+                break
+            if not new_tasks:
+                await asyncio.sleep(wait)
+                continue
+
+            for task in new_tasks:
+                self._seen.add(task.task_key)
+                self.stats.fetched += 1
+                entry = self.journal.get(task.task_key)
+                if entry is not None and entry.done:
+                    self.stats.skipped += 1
+                    dashboard_stats.record_skipped()
+                    report(f"试卷 {task.kaohao} 已在之前的运行中处理，跳过", "yellow", event="skipped")
+                    continue
+                if entry is None:
+                    await self._run_blocking(
+                        self.journal.record,
+                        task.task_key,
+                        FETCHED,
+                        subject_id=self.subject_id,
+                        block_id=self.block_id,
+                        kaohao=task.kaohao,
+                    )
+                self._in_flight.add(task.task_key)
+                # 上次运行已识别的试卷带着识别结果进入流水线，不再下载和调用模型
+                await out_queue.put(PaperJob(task=task, student_answers=entry.answers if entry else None))
+
+    async def _download_worker(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """下载试卷图片"""
+        while True:
+            job = await in_queue.get()
+            if job is _STOP:
+                break
+            current_paper.set(job.task.task_key)
+            if job.student_answers is not None:
+                await out_queue.put(job)
+                continue
+            try:
+                job.image = await self._run_blocking(
+                    fetch_image, job.task.block_img, job.task.kaohao, api_client=self.api_client
+                )
+                await self._run_blocking(
+                    self.journal.record,
+                    job.task.task_key,
+                    DOWNLOADED,
+                    image=job.image if isinstance(job.image, str) else None,
+                )
+                await out_queue.put(job)
+            except Exception as e:
+                self._fail(job, f"下载图片时发生错误: {str(e)}", "download")
+
+    async def _collect_batch(self, in_queue: asyncio.Queue, batch: List[PaperJob]) -> bool:
+        """在batch_wait内从队列中继续取试卷凑批，取到结束标记时返回True"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                job = await asyncio.wait_for(in_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if job is _STOP:
+                return True
+            batch.append(job)
+        return False
+
+    async def _recognize_jobs(self, batch: List[PaperJob]) -> List[PaperJob]:
+        """识别一批试卷中尚无识别结果的试卷，返回可以评分的试卷"""
+        pending = [job for job in batch if job.student_answers is None]
+        if not pending:
+            return batch
+        try:
+            if len(pending) == 1:
+                job = pending[0]
+                results = [await self._run_blocking(
+                    process_answer_sheet,
+                    job.image,
+                    self.question_numbers,
+                    pos=job.task.pos,
+                    expected_blanks=self.expected_blanks,
+                )]
+            else:
+                results = await self._run_blocking(
+                    process_answer_sheets,
+                    [job.image for job in pending],
+                    self.question_numbers,
+                    [job.task.pos for job in pending],
+                    self.expected_blanks,
+                )
+        except Exception as e:
+            for job in pending:
+                self._fail(job, f"识别答案时发生错误: {str(e)}", "recognize")
+            return [job for job in batch if job.student_answers is not None]
+
+        for job, answers in zip(pending, results):
+            if answers is None:
+                self._fail(job, "未能识别到任何答案", "recognize")
+                continue
+            job.student_answers = answers
+            await self._run_blocking(self.journal.record, job.task.task_key, RECOGNIZED, answers=answers)
+        return [job for job in batch if job.student_answers is not None]
+
+    async def _recognition_worker(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """识别答案并评分"""
+        while True:
+            job = await in_queue.get()
+            if job is _STOP:
+                break
+            current_paper.set(job.task.task_key)
+            batch = [job]
+            stopping = False
+            if self.batch_size > 1 and job.student_answers is None:
+                stopping = await self._collect_batch(in_queue, batch)
+            for job in await self._recognize_jobs(batch):
+                current_paper.set(job.task.task_key)
+                await self._score_job(job, out_queue)
+            if stopping:
+                break
+
+    async def _score_job(self, job: PaperJob, out_queue: asyncio.Queue):
+        """评分并分流：可信的交给提交阶段，存疑的写入复核队列"""
+        try:
+            with get_metrics().stage("score"):
+                scoring_result = self.checker.check_answer(job.student_answers)
+            job.score = scoring_result.total_score
+            job.api_scores = convert_to_api_scores(scoring_result, self.question_numbers)
+            self.stats.recognized += 1
+            await self._run_blocking(analyze_result, scoring_result)
+            if is_headless():
+                await self._run_blocking(log_scoring_info, scoring_result, job.api_scores)
+
+            # 存疑的试卷写入复核队列后即结束，不占用提交阶段
+            decision = self.routing_policy.decide(job.student_answers, scoring_result)
+            routing_stats.record(decision)
+            if decision.needs_review:
+                await self._run_blocking(
+                    self.review_queue.put,
+                    job.task.task_key,
+                    job.task.kaohao,
+                    self.subject_id,
+                    self.block_id,
+                    scoring_result,
+                    job.api_scores,
+                    decision,
+                )
+                await self._run_blocking(
+                    self.journal.record, job.task.task_key, REVIEW, api_scores=job.api_scores
+                )
+                await self._run_blocking(
+                    store_answers,
+                    job.task.task_key,
+                    job.student_answers,
+                    job.api_scores,
+                    self.subject_id,
+                    self.block_id,
+                    job.task.kaohao,
+                    True,
+                )
+                self.stats.reviewed += 1
+                dashboard_stats.record_reviewed(job.score)
+                self._in_flight.discard(job.task.task_key)
+                report(
+                    f"试卷 {job.task.kaohao} 已送人工复核：{decision.describe()}", "yellow",
+                    event="review", kaohao=job.task.kaohao
+                )
+                return
+            await self._run_blocking(self.journal.record, job.task.task_key, SCORED, api_scores=job.api_scores)
+            await out_queue.put(job)
+        except Exception as e:
+            self._fail(job, f"评分时发生错误: {str(e)}", "score")
+
+    async def _submit_worker(self, in_queue: asyncio.Queue):
+        """提交评分结果"""
+        while True:
+            job = await in_queue.get()
+            if job is _STOP:
+                break
+            current_paper.set(job.task.task_key)
+            try:
+                await self._submit_once(job.task.task_key, job.api_scores)
+                self.stats.submitted += 1
+                dashboard_stats.record_submitted(job.score)
+                self._in_flight.discard(job.task.task_key)
+                report(
+                    f"试卷 {job.task.kaohao} 已提交，得分: {job.score}，api_scores: {job.api_scores}", "green",
+                    event="submitted", kaohao=job.task.kaohao
+                )
+            except Exception as e:
+                self._fail(job, f"提交分数时发生错误: {str(e)}", "submit")
+
+    async def _submit_once(self, task_key: str, api_scores: List[Dict[str, str]]) -> bool:
+        """提交分数并记入日志与识别结果存储；日志中已提交的试卷不再提交，返回False"""
+        if self.journal.is_submitted(task_key):
+            return False
+        await self._call_client(
+            "submit_score",
+            subject_id=self.subject_id,
+            block_id=self.block_id,
+            task_key=task_key,
+            scores=api_scores,
+        )
+        entry = await self._run_blocking(self.journal.record, task_key, SUBMITTED)
+        if entry.answers is not None:
+            await self._run_blocking(
+                store_answers, task_key, entry.answers, api_scores, self.subject_id, self.block_id, entry.kaohao
+            )
+        return True
+
+    async def _resume_submissions(self):
+        """提交上次运行中已评分、但在提交前中断的试卷"""
+        pending = self.journal.pending_submissions(self.subject_id, self.block_id)
+        if pending:
+            console.print(f"[cyan]日志中有 {len(pending)} 份已评分未提交的试卷，先行提交[/cyan]")
+        for entry in pending:
+            try:
+                if await self._submit_once(entry.task_key, entry.api_scores):
+                    self.stats.submitted += 1
+                    self._seen.add(entry.task_key)
+            except Exception as e:
+                report(f"提交试卷 {entry.kaohao} 时发生错误: {str(e)}", "red", event="error", kaohao=entry.kaohao)
+
+    def _fail(self, job: PaperJob, message: str, stage: str):
+        """记录单份试卷在stage阶段的失败，不影响其他试卷"""
+        self.stats.failed += 1
+        dashboard_stats.record_failed(stage)
+        self._in_flight.discard(job.task.task_key)
+        report(f"试卷 {job.task.kaohao}: {message}", "red", event="failed", kaohao=job.task.kaohao, stage=stage)
+
+    @staticmethod
+    async def _run_workers(workers: List, next_queue: Optional[asyncio.Queue], next_count: int):
+        """等待一组工作协程结束，然后通知下一阶段停止"""
+        await asyncio.gather(*workers)
+        if next_queue is not None:
+            for _ in range(next_count):
+                await next_queue.put(_STOP)
+
+    async def run(self) -> PipelineStats:
+        """运行流水线直到没有更多待阅试卷"""
+        download_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        recognition_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        submit_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        max_workers = (
+            self.download_concurrency + self.recognition_concurrency + self.submit_concurrency + 1
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = PipelineStats(started_at=time.time())
+
+        try:
+            await self._resume_submissions()
+            fetchers = [self._fetch_stage(download_queue)]
+            downloaders = [
+                self._download_worker(download_queue, recognition_queue)
+                for _ in range(self.download_concurrency)
+            ]
+            recognizers = [
+                self._recognition_worker(recognition_queue, submit_queue)
+                for _ in range(self.recognition_concurrency)
+            ]
+            submitters = [
+                self._submit_worker(submit_queue)
+                for _ in range(self.submit_concurrency)
+            ]
+
+            dashboard = Dashboard(
+                title="流水线进度",
+                queue_depths=lambda: {
+                    "待下载": download_queue.qsize(),
+                    "待识别": recognition_queue.qsize(),
+                    "待提交": submit_queue.qsize(),
+                    "处理中": len(self._in_flight),
+                },
+            ) if is_headless() else nullcontext()
+            with dashboard:
+                await asyncio.gather(
+                    self._run_workers(fetchers, download_queue, self.download_concurrency),
+                    self._run_workers(downloaders, recognition_queue, self.recognition_concurrency),
+                    self._run_workers(recognizers, submit_queue, self.submit_concurrency),
+                    self._run_workers(submitters, None, 0),
+                )
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self.stats.finished_at = time.time()
+
+        console.print(
+            f"\n[bold cyan]流水线结束：获取 {self.stats.fetched} 份，提交 {self.stats.submitted} 份，"
+            f"送复核 {self.stats.reviewed} 份，失败 {self.stats.failed} 份，"
+            f"之前已完成 {self.stats.skipped} 份，"
+            f"速度 {self.stats.papers_per_minute:.1f} 份/分钟[/bold cyan]"
+        )
+        console.print(f"[cyan]分流结果：{routing_stats.describe()}[/cyan]")
+        image_stats = preprocess_stats.summary()
+        if image_stats["images"]:
+            console.print(
+                f"[cyan]图片预处理：{image_stats['images']} 张，"
+                f"{image_stats['bytes_before']} -> {image_stats['bytes_after']} 字节"
+                f"（{image_stats['ratio']:.1%}）[/cyan]"
+            )
+        model_stats = get_model_limiter().stats()
+        console.print(
+            f"[cyan]模型调用：{model_stats['total_requests']} 次，"
+            f"限流 {model_stats['total_throttled']} 次，"
+            f"token {model_stats['total_tokens']}，"
+            f"估算费用 {model_stats['total_cost']:.2f} 元，"
+            f"当前并发上限 {model_stats['concurrency_limit']}[/cyan]"
+        )
+        cache = get_default_cache()
+        if cache is not None:
+            cache_stats = cache.stats()
+            console.print(
+                f"[cyan]识别缓存：命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次，"
+                f"命中率 {cache_stats['hit_rate']:.1%}[/cyan]"
+            )
+        display_stage_metrics()
+        return self.stats
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from config import (
+    MODEL_RATE_LIMIT_RPM,
+    MODEL_INITIAL_CONCURRENCY,
+    MODEL_MIN_CONCURRENCY,
+    MODEL_MAX_CONCURRENCY,
+    MODEL_THROTTLE_COOLDOWN,
+    MODEL_THROTTLE_COOLDOWN_MAX,
+    MODEL_COST_PER_1K_TOKENS,
+)
+
+# 用量统计的滑动窗口（秒）
+_USAGE_WINDOW = 60
+
+
+class AdaptiveRateLimiter:
+    """
+    模型调用的令牌桶限速与AIMD并发控制
+
+    令牌桶限制每分钟请求数（设置了上限时）；并发上限在调用成功时线性增加，
+    被限流时减半并暂停一段指数增长的冷却时间。只有用满了并发上限的调用成功后才增加上限，
+    负载不足时上限保持不变，不会在空闲期漂到最大值、再在下一波请求时集中触发限流。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = MODEL_RATE_LIMIT_RPM,
+        initial_concurrency: int = MODEL_INITIAL_CONCURRENCY,
+        min_concurrency: int = MODEL_MIN_CONCURRENCY,
+        max_concurrency: int = MODEL_MAX_CONCURRENCY,
+        cooldown: float = MODEL_THROTTLE_COOLDOWN,
+        cooldown_max: float = MODEL_THROTTLE_COOLDOWN_MAX,
+        cost_per_1k_tokens: float = MODEL_COST_PER_1K_TOKENS,
+        decrease_factor: float = 0.5
+    ):
+        self.rate = requests_per_minute / 60 if requests_per_minute else None
+        # 桶容量为一秒的请求量，至少为1
+        self.capacity = max(self.rate or 1, 1)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.cooldown = cooldown
+        self.cooldown_max = cooldown_max
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.decrease_factor = decrease_factor
+
+        self._cond = threading.Condition()
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+
+        # 统计
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.total_throttled = 0
+        self.total_errors = 0
+        self._usage: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(int(self._limit), self.min_concurrency)
+
+    def _refill(self, now: float):
+        if self.rate is None:
+            return
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self) -> bool:
+        """等待直到冷却结束、并发未满且令牌桶有令牌；返回本次调用是否用满了并发上限"""
+        with self._cond:
+            waited = False
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                timeout: Optional[float] = None
+                if now < self._paused_until:
+                    timeout = self._paused_until - now
+                elif self._in_flight >= self.concurrency_limit:
+                    timeout = None  # 等待其他调用释放
+                    waited = True
+                elif self.rate is not None and self._tokens < 1:
+                    timeout = (1 - self._tokens) / self.rate
+                else:
+                    if self.rate is not None:
+                        self._tokens -= 1
+                    self._in_flight += 1
+                    return waited or self._in_flight >= self.concurrency_limit
+                self._cond.wait(timeout=timeout)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """占用一个调用名额，产出本次调用是否用满了并发上限"""
+        saturated = self.acquire()
+        try:
+            yield saturated
+        finally:
+            self.release()
+
+    def record_success(self, tokens: int = 0, saturated: bool = True):
+        """调用成功：saturated（等待过名额或用满了并发上限）时加性增加并发上限"""
+        now = time.monotonic()
+        with self._cond:
+            self._consecutive_throttles = 0
+            if saturated:
+                self._limit = min(self.max_concurrency, self._limit + 1 / max(self._limit, 1))
+            self.total_requests += 1
+            self.total_tokens += tokens
+            self._usage.append((now, tokens))
+            self._trim_usage(now)
+            self._cond.notify_all()
+
+    def record_throttle(self, retry_after: Optional[float] = None):
+        """被限流：并发上限乘性减少，并暂停一段时间"""
+        now = time.monotonic()
+        with self._cond:
+            self.total_throttled += 1
+            if now < self._paused_until:
+                # 冷却期内的限流来自冷却前发出的请求，不重复降速
+                return
+            self._consecutive_throttles += 1
+            self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+            if retry_after is None:
+                retry_after = min(
+                    self.cooldown_max,
+                    self.cooldown * (2 ** (self._consecutive_throttles - 1))
+                )
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+    def record_error(self):
+        """其他失败只计数，不调整并发"""
+        with self._cond:
+            self.total_errors += 1
+
+    def _trim_usage(self, now: float):
+        while self._usage and now - self._usage[0][0] > _USAGE_WINDOW:
+            self._usage.popleft()
+
+    def stats(self) -> Dict[str, float]:
+        """近一分钟的请求数、token数与费用，以及累计数据"""
+        now = time.monotonic()
+        with self._cond:
+            self._trim_usage(now)
+            requests_per_minute = len(self._usage)
+            tokens_per_minute = sum(tokens for _, tokens in self._usage)
+            return {
+                "concurrency_limit": self.concurrency_limit,
+                "in_flight": self._in_flight,
+                "requests_per_minute": requests_per_minute,
+                "tokens_per_minute": tokens_per_minute,
+                "cost_per_minute": tokens_per_minute / 1000 * self.cost_per_1k_tokens,
+                "total_requests": self.total_requests,
+                "total_tokens": self.total_tokens,
+                "total_cost": self.total_tokens / 1000 * self.cost_per_1k_tokens,
+                "total_throttled": self.total_throttled,
+                "total_errors": self.total_errors,
+            }
+
+
+_model_limiter: Optional[AdaptiveRateLimiter] = None
+_model_limiter_lock = threading.Lock()
+
+
+def get_model_limiter() -> AdaptiveRateLimiter:
+    """获取所有模型调用共享的限速器"""
+    global _model_limiter
+    with _model_limiter_lock:
+        if _model_limiter is None:
+            _model_limiter = AdaptiveRateLimiter()
+    return _model_limiter
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    RECOGNITION_CACHE_ENABLED,
+    RECOGNITION_CACHE_PATH,
+    RECOGNITION_CACHE_MAX_ENTRIES,
+    RECOGNITION_CACHE_MAX_BYTES,
+)
+from models import StudentAnswer
+
+
+class RecognitionCache:
+    """
+    基于SQLite的识别结果缓存
+
+    键由图片内容哈希、题号、模型名和提示词哈希组成，
+    更换模型或修改提示词后旧条目自然失效。按最近访问时间淘汰。
+    """
+
+    def __init__(
+        self,
+        path: str = RECOGNITION_CACHE_PATH,
+        max_entries: int = RECOGNITION_CACHE_MAX_ENTRIES,
+        max_bytes: int = RECOGNITION_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recognition (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_recognition_last_access ON recognition(last_access)"
+        )
+        # 条目数与总大小在打开时统计一次，之后随写入与淘汰增减，写入时不再全表统计
+        self._count, self._total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recognition"
+        ).fetchone()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, question_key: str, model_name: str, prompt: str) -> str:
+        """生成缓存键"""
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{image_hash}|{question_key}|{model_name}|{prompt_hash}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[List[StudentAnswer]]:
+        """读取缓存，命中时刷新访问时间"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM recognition WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE recognition SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self.hits += 1
+        return [StudentAnswer(**item) for item in json.loads(row[0])]
+
+    def put(self, key: str, answers: List[StudentAnswer]):
+        """写入缓存并按容量淘汰"""
+        payload = json.dumps([answer.model_dump() for answer in answers], ensure_ascii=False)
+        now = time.time()
+        size = len(payload.encode("utf-8"))
+        with self._lock:
+            # 覆盖已有条目时先扣除旧条目的大小
+            row = self._conn.execute(
+                "SELECT size FROM recognition WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO recognition (key, payload, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            if row is None:
+                self._count += 1
+            else:
+                self._total_bytes -= row[0]
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        """淘汰最久未访问的条目，直到满足数量与大小上限"""
+        while self._count > self.max_entries or self._total_bytes > self.max_bytes:
+            # 每次淘汰超出部分，至少一条
+            batch = max(self._count - self.max_entries, 1)
+            rows = self._conn.execute(
+                "SELECT key, size FROM recognition ORDER BY last_access LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                self._count = self._total_bytes = 0
+                break
+            self._conn.executemany(
+                "DELETE FROM recognition WHERE key = ?", [(row[0],) for row in rows]
+            )
+            self._count -= len(rows)
+            self._total_bytes -= sum(row[1] for row in rows)
+            self.evictions += len(rows)
+
+    def stats(self) -> Dict[str, float]:
+        """命中率与容量统计"""
+        with self._lock:
+            count, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM recognition"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": total_bytes,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM recognition")
+            self._count = self._total_bytes = 0
+
+    def close(self):
+        self._conn.close()
+
+
+_default_cache: Optional[RecognitionCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[RecognitionCache]:
+    """获取进程内共享的缓存实例，未启用缓存时返回None"""
+    global _default_cache
+    if not RECOGNITION_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RecognitionCache()
+    return _default_cache
@@ -0,0 +1,86 @@
+"""
+修改标准答案后重新评分
+
+对列式存储中的全部识别结果按新的标准答案重新评分，不再调用模型；
+只输出得分有变化的试卷，--submit时重新提交这些试卷的分数。尚未复核的试卷不参与。
+
+用法：
+    python regrade.py --standard-answer data/standard_answer.json --output changed.jsonl
+    python regrade.py --subject-id xxx --block-id xxx --submit --cookie yx_sid=xxx
+"""
+import argparse
+import json
+import time
+
+from rich.console import Console
+
+from answer_store import AnswerStore
+from api_client import ScoringAPIClient
+from config import ANSWER_STORE_DIR
+from coordinator import parse_cookies
+from models import AnswerSheet
+
+console = Console()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="修改标准答案后重新评分")
+    parser.add_argument("--standard-answer", default="./data/standard_answer.json", help="修改后的标准答案文件")
+    parser.add_argument("--store", default=ANSWER_STORE_DIR, help="识别结果存储目录")
+    parser.add_argument("--subject-id", help="只重新评分该科目的试卷")
+    parser.add_argument("--block-id", help="只重新评分该阅卷块的试卷")
+    parser.add_argument("--output", help="把得分有变化的试卷写入JSONL")
+    parser.add_argument("--submit", action="store_true", help="重新提交得分有变化的试卷")
+    parser.add_argument("--base-url", default="https://yue.haofenshu.com")
+    parser.add_argument("--cookie", action="append", help="平台cookie，形如yx_sid=xxx，可重复")
+    args = parser.parse_args()
+
+    with open(args.standard_answer, "r", encoding="utf-8") as f:
+        standard_answer = AnswerSheet(**json.load(f))
+    store = AnswerStore(args.store)
+
+    started_at = time.time()
+    changes, graded = store.regrade(standard_answer, args.subject_id, args.block_id)
+    elapsed = time.time() - started_at
+    console.print(
+        f"[bold cyan]重新评分 {graded} 份，得分有变化 {len(changes)} 份，用时 {elapsed:.2f} 秒[/bold cyan]"
+    )
+    pending = sum(1 for paper in store.papers(args.subject_id, args.block_id) if paper.pending_review)
+    if pending:
+        console.print(f"[yellow]{pending} 份试卷尚未复核，未参与重新评分[/yellow]")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for change in changes:
+                record = change.model_dump()
+                record["api_scores"] = change.api_scores
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        console.print(f"[green]得分有变化的试卷已写入: {args.output}[/green]")
+    else:
+        for change in changes:
+            console.print(f"{change.task_key}\t{change.kaohao or ''}\t{change.old_scores} -> {change.new_scores}")
+
+    if not args.submit or not changes:
+        store.close()
+        return
+    submitted = 0
+    with ScoringAPIClient(args.base_url, parse_cookies(args.cookie)) as api_client:
+        for change in changes:
+            try:
+                api_client.submit_score(
+                    subject_id=change.subject_id,
+                    block_id=change.block_id,
+                    task_key=change.task_key,
+                    scores=change.api_scores
+                )
+            except Exception as e:
+                console.print(f"[red]重新提交试卷 {change.kaohao or change.task_key} 时发生错误: {str(e)}[/red]")
+                continue
+            store.update_scores(change.task_key, change.new_scores)
+            submitted += 1
+    store.close()
+    console.print(f"[bold cyan]已重新提交 {submitted}/{len(changes)} 份[/bold cyan]")
+
+
+if __name__ == "__main__":
+    main()
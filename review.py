@@ -0,0 +1,149 @@
+"""
+人工复核
+
+逐份处理复核队列中的存疑试卷：显示识别结果与送复核原因，确认或修改分数后提交。
+可与阅卷程序同时运行，--follow时持续等待新入队的试卷。
+
+用法：
+    python review.py --cookie yx_sid=xxx
+    python review.py --cookie yx_sid=xxx --follow
+"""
+import argparse
+import time
+from typing import Dict, List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from answer_store import api_scores_to_dict, get_answer_store
+from api_client import ScoringAPIClient
+from config import REVIEW_QUEUE_PATH
+from coordinator import parse_cookies
+from models import ScoringResult
+from routing import ReviewQueue
+
+console = Console()
+
+
+def display_review_item(item: Dict):
+    """显示一份待复核试卷的识别结果"""
+    result = ScoringResult(**item["result"])
+    table = Table(title=f"试卷 {item['kaohao']}（{item['subject_id']}/{item['block_id']}）")
+    table.add_column("题号", style="cyan")
+    table.add_column("学生答案", style="yellow")
+    table.add_column("标准答案", style="green")
+    table.add_column("置信度", justify="right")
+    table.add_column("判定", style="magenta")
+    for part in result.parts:
+        for blank in part.blanks:
+            if blank.content is None:
+                verdict = "未作答"
+            elif blank.is_crossed_out:
+                verdict = "划掉"
+            else:
+                verdict = "✓" if blank.is_correct else "✗"
+            table.add_row(
+                f"{part.question_number}.{part.part_number}.{blank.blank_number}",
+                blank.content or "",
+                blank.standard_answer,
+                f"{blank.confidence:.2f}" if blank.confidence is not None else "",
+                verdict
+            )
+    console.print(table)
+    console.print(f"[yellow]送复核原因：{'；'.join(item['details'])}[/yellow]")
+    console.print(
+        "[cyan]建议分数：" + "，".join(f"{s['key']}={s['score']}" for s in item["api_scores"]) + "[/cyan]"
+    )
+
+
+def ask_scores(api_scores: List[Dict[str, str]]) -> Optional[List[Dict[str, str]]]:
+    """
+    读取复核分数
+
+    回车采用建议分数，输入空格分隔的分数修改，输入s跳过（返回None），输入q退出。
+    """
+    while True:
+        console.print(f"[cyan]回车提交建议分数；或依次输入{len(api_scores)}个小题的分数；s跳过；q退出：[/cyan]")
+        text = input().strip()
+        if not text:
+            return api_scores
+        if text.lower() == "s":
+            return None
+        if text.lower() == "q":
+            raise KeyboardInterrupt
+        scores = text.split()
+        if len(scores) != len(api_scores):
+            console.print(f"[red]必须输入{len(api_scores)}个分数[/red]")
+            continue
+        try:
+            return [
+                {"key": item["key"], "score": str(int(score))}
+                for item, score in zip(api_scores, scores)
+            ]
+        except ValueError:
+            console.print("[red]分数必须是整数[/red]")
+
+
+def update_stored_scores(task_key: str, scores: List[Dict[str, str]]):
+    """在识别结果存储中记录复核提交的分数，之后重新评分时以此为准；写入失败不影响复核"""
+    store = get_answer_store()
+    if store is None:
+        return
+    try:
+        store.update_scores(task_key, api_scores_to_dict(scores))
+    except Exception as e:
+        console.print(f"[red]保存复核分数失败: {str(e)}[/red]")
+
+
+def review(api_client: ScoringAPIClient, queue: ReviewQueue, follow: bool = False, poll_interval: float = 2.0):
+    skipped = set()
+    reviewed = 0
+    while True:
+        items = [item for item in queue.pending() if item["task_key"] not in skipped]
+        if not items:
+            if not follow:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        for item in items:
+            display_review_item(item)
+            scores = ask_scores(item["api_scores"])
+            if scores is None:
+                skipped.add(item["task_key"])
+                continue
+            try:
+                api_client.submit_score(
+                    subject_id=item["subject_id"],
+                    block_id=item["block_id"],
+                    task_key=item["task_key"],
+                    scores=scores
+                )
+            except Exception as e:
+                console.print(f"[red]提交分数时发生错误: {str(e)}[/red]")
+                skipped.add(item["task_key"])
+                continue
+            queue.mark_done(item["task_key"])
+            update_stored_scores(item["task_key"], scores)
+            reviewed += 1
+            console.print(f"[green]试卷 {item['kaohao']} 已提交[/green]\n")
+    console.print(f"[bold cyan]复核完成 {reviewed} 份，跳过 {len(skipped)} 份[/bold cyan]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="人工复核存疑试卷")
+    parser.add_argument("--queue", default=REVIEW_QUEUE_PATH, help="复核队列文件")
+    parser.add_argument("--base-url", default="https://yue.haofenshu.com")
+    parser.add_argument("--cookie", action="append", help="平台cookie，形如yx_sid=xxx，可重复")
+    parser.add_argument("--follow", action="store_true", help="处理完后继续等待新入队的试卷")
+    args = parser.parse_args()
+
+    with ScoringAPIClient(args.base_url, parse_cookies(args.cookie)) as api_client:
+        try:
+            review(api_client, ReviewQueue(args.queue), args.follow)
+        except KeyboardInterrupt:
+            console.print("\n[yellow]已退出，未复核的试卷保留在队列中[/yellow]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from pydantic import BaseModel
+
+from config import (
+    ROUTING_CONFIDENCE_THRESHOLD,
+    ROUTING_REVIEW_BLURRY,
+    ROUTING_REVIEW_CROSSED_OUT,
+    ROUTING_REVIEW_INCOMPLETE,
+    ROUTING_REVIEW_BLANK_SHEET,
+    REVIEW_QUEUE_PATH,
+)
+from models import ScoringResult, StudentAnswer
+
+AUTO = "auto"
+REVIEW = "review"
+
+# 送复核原因
+LOW_CONFIDENCE = "low_confidence"
+BLURRY = "blurry"
+CROSSED_OUT = "crossed_out"
+INCOMPLETE = "incomplete"
+REUSED = "reused"
+BLANK_SHEET = "blank_sheet"
+SUBMIT_UNCERTAIN = "submit_uncertain"
+
+REASON_NAMES = {
+    LOW_CONFIDENCE: "置信度低",
+    BLURRY: "字迹模糊",
+    CROSSED_OUT: "有划掉的答案",
+    INCOMPLETE: "答案不完整",
+    REUSED: "复用近似答题卡",
+    BLANK_SHEET: "空白答题卡",
+    SUBMIT_UNCERTAIN: "提交结果未知",
+}
+
+
+class RoutingDecision(BaseModel):
+    route: str  # auto: 自动提交, review: 人工复核
+    reasons: List[str] = []  # 送复核的原因代码
+    details: List[str] = []  # 具体是哪些空
+    min_confidence: Optional[float] = None
+
+    @property
+    def needs_review(self) -> bool:
+        return self.route == REVIEW
+
+    def describe(self) -> str:
+        return "；".join(self.details) if self.details else "可信"
+
+
+class RoutingPolicy:
+    """根据识别置信度与答案状态决定自动提交还是送人工复核"""
+
+    def __init__(
+        self,
+        confidence_threshold: float = ROUTING_CONFIDENCE_THRESHOLD,
+        review_blurry: bool = ROUTING_REVIEW_BLURRY,
+        review_crossed_out: bool = ROUTING_REVIEW_CROSSED_OUT,
+        review_incomplete: bool = ROUTING_REVIEW_INCOMPLETE,
+        review_blank_sheet: bool = ROUTING_REVIEW_BLANK_SHEET
+    ):
+        self.confidence_threshold = confidence_threshold
+        self.review_blurry = review_blurry
+        self.review_crossed_out = review_crossed_out
+        self.review_incomplete = review_incomplete
+        self.review_blank_sheet = review_blank_sheet
+
+    def decide(self, student_answers: List[StudentAnswer], result: ScoringResult) -> RoutingDecision:
+        reasons: List[str] = []
+        details: List[str] = []
+        min_confidence = None
+
+        def add(reason: str, detail: str):
+            if reason not in reasons:
+                reasons.append(reason)
+            details.append(detail)
+
+        for answer in student_answers:
+            position = f"{answer.question_number}.{answer.part_number}.{answer.blank_number}"
+            if min_confidence is None or answer.confidence < min_confidence:
+                min_confidence = answer.confidence
+            if answer.confidence < self.confidence_threshold:
+                add(LOW_CONFIDENCE, f"{position}置信度{answer.confidence:.2f}")
+            if self.review_blurry and answer.is_blurry:
+                add(BLURRY, f"{position}字迹模糊")
+            if self.review_crossed_out and answer.is_crossed_out:
+                add(CROSSED_OUT, f"{position}答案被划掉")
+
+        # 复用的识别结果来自另一张答题卡，不论置信度一律复核
+        if any(answer.is_reused for answer in student_answers):
+            add(REUSED, "复用近似答题卡的识别结果")
+
+        # 没有识别结果说明快速分类判为空白、没有调用模型，笔迹很淡时会被误判，0分需人工确认
+        if self.review_blank_sheet and not student_answers:
+            add(BLANK_SHEET, "快速分类判为空白答题卡，未调用模型")
+
+        if self.review_incomplete:
+            for part in result.parts:
+                if part.status == "incomplete":
+                    add(INCOMPLETE, f"{part.key}只识别出部分答案")
+
+        return RoutingDecision(
+            route=REVIEW if reasons else AUTO,
+            reasons=reasons,
+            details=details,
+            min_confidence=min_confidence,
+        )
+
+
+class RoutingStats:
+    """累计的分流统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.auto = 0
+        self.review = 0
+        self.reasons: Dict[str, int] = {}
+
+    def record(self, decision: RoutingDecision):
+        with self._lock:
+            if decision.needs_review:
+                self.review += 1
+                for reason in decision.reasons:
+                    self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            else:
+                self.auto += 1
+
+    def reset(self):
+        with self._lock:
+            self.auto = 0
+            self.review = 0
+            self.reasons = {}
+
+    def summary(self) -> Dict:
+        with self._lock:
+            total = self.auto + self.review
+            return {
+                "auto": self.auto,
+                "review": self.review,
+                "auto_rate": self.auto / total if total else 0.0,
+                "reasons": dict(self.reasons),
+            }
+
+    def describe(self) -> str:
+        summary = self.summary()
+        reasons = "，".join(
+            f"{REASON_NAMES.get(reason, reason)} {count}"
+            for reason, count in sorted(summary["reasons"].items(), key=lambda item: -item[1])
+        )
+        text = (
+            f"自动提交 {summary['auto']} 份，送复核 {summary['review']} 份"
+            f"（自动率 {summary['auto_rate']:.1%}）"
+        )
+        return f"{text}，复核原因：{reasons}" if reasons else text
+
+
+routing_stats = RoutingStats()
+
+
+class ReviewQueue:
+    """
+    人工复核队列
+
+    待复核的试卷追加写入JSONL，写入后立即返回，不阻塞阅卷；
+    复核完成的task_key记录在同名的.done文件中，由review.py逐份处理。
+    """
+
+    def __init__(self, path: str = REVIEW_QUEUE_PATH):
+        self.path = path
+        self.done_path = path + ".done"
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def put(
+        self,
+        task_key: str,
+        kaohao: str,
+        subject_id: str,
+        block_id: str,
+        result: ScoringResult,
+        api_scores: List[Dict[str, str]],
+        decision: RoutingDecision
+    ):
+        item = {
+            "task_key": task_key,
+            "kaohao": kaohao,
+            "subject_id": subject_id,
+            "block_id": block_id,
+            "score": result.total_score,
+            "api_scores": api_scores,
+            "reasons": decision.reasons,
+            "details": decision.details,
+            "result": result.model_dump(),
+            "queued_at": time.time(),
+        }
+        line = json.dumps(item, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def done_keys(self) -> Set[str]:
+        if not os.path.exists(self.done_path):
+            return set()
+        with open(self.done_path, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def pending(self) -> List[Dict]:
+        """尚未复核的试卷，同一task_key只保留最后一次入队的记录"""
+        if not os.path.exists(self.path):
+            return []
+        done = self.done_keys()
+        items: Dict[str, Dict] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                if item["task_key"] not in done:
+                    items[item["task_key"]] = item
+        return list(items.values())
+
+    def mark_done(self, task_key: str):
+        with self._lock:
+            with open(self.done_path, "a", encoding="utf-8") as f:
+                f.write(task_key + "\n")
+
+
+_review_queue: Optional[ReviewQueue] = None
+_review_queue_lock = threading.Lock()
+
+
+def get_review_queue() -> ReviewQueue:
+    """获取进程内共享的复核队列"""
+    global _review_queue
+    with _review_queue_lock:
+        if _review_queue is None:
+            _review_queue = ReviewQueue()
+    return _review_queue
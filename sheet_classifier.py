@@ -0,0 +1,362 @@
+import io
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+from pydantic import BaseModel
+
+from config import (
+    SHEET_CLASSIFIER_ENABLED,
+    SHEET_BLANK_INK_RATIO,
+    SHEET_TEMPLATE_SAMPLES,
+    SHEET_TEMPLATE_INK_SHARE,
+    SHEET_DUPLICATE_ENABLED,
+    SHEET_DUPLICATE_SIMILARITY,
+    SHEET_DUPLICATE_MAX_DIFF,
+    SHEET_HASH_SIZE,
+    SHEET_INDEX_MAX_ENTRIES,
+)
+from dashboard import detail
+from image_preprocessor import answer_region
+from models import StudentAnswer
+
+BLANK = "blank"
+DUPLICATE = "duplicate"
+
+# 灰度低于该值的像素视为墨迹
+_INK_THRESHOLD = 200
+# 计算特征前把图片缩小到该尺寸以内
+_FEATURE_MAX_SIDE = 512
+# 近似答题卡逐像素核对用的笔迹位图的最长边
+_BITMAP_MAX_SIDE = 256
+# 保留多少个墨迹比例样本用于调参
+_INK_SAMPLES = 10000
+
+
+class SheetFeatures(BaseModel):
+    """答题卡笔迹（去除印刷内容后）的廉价特征"""
+    ink_ratio: float  # 笔迹像素占比
+    dhash: int  # 笔迹区域的差值哈希，用于查找候选
+    bitmap: bytes = b""  # 缩小后的笔迹位图，用于逐像素核对
+    bitmap_ink: int = 0  # 位图中的笔迹像素数
+
+
+class SheetMatch(BaseModel):
+    """快速分类结果，kind为None时需要调用模型识别"""
+    kind: Optional[str] = None  # blank: 空白, duplicate: 与已识别的答题卡近似
+    features: Optional[SheetFeatures] = None
+    answers: List[StudentAnswer] = []  # 近似答题卡的识别结果
+    similarity: float = 0.0
+
+
+def ink_mask(
+    image_bytes: bytes,
+    pos: Optional[List[Dict]] = None,
+    size: Optional[Tuple[int, int]] = None
+) -> Image.Image:
+    """按pos裁剪到答题区域后的墨迹掩码（墨迹为255），缩小到_FEATURE_MAX_SIDE以内，指定size时缩放到该尺寸"""
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        image = ImageOps.grayscale(source)
+    region = answer_region(pos, image.size)
+    if region is not None:
+        image = image.crop(region)
+    if size is not None:
+        if image.size != size:
+            image = image.resize(size, Image.BILINEAR)
+    elif max(image.size) > _FEATURE_MAX_SIDE:
+        image.thumbnail((_FEATURE_MAX_SIDE, _FEATURE_MAX_SIDE), Image.BILINEAR)
+    return image.point(lambda value: 255 if value < _INK_THRESHOLD else 0)
+
+
+class SheetTemplate:
+    """
+    同一组题目的答题卡上的印刷内容（题号、横线、方框等）
+
+    前samples张答题卡中至少ink_share比例都有墨迹的像素视为印刷内容，向外扩一个像素以容忍扫描偏移。
+    学好之前无法区分笔迹与印刷内容，不做分类。
+    """
+
+    def __init__(self, size: Tuple[int, int], samples: int = SHEET_TEMPLATE_SAMPLES, ink_share: float = SHEET_TEMPLATE_INK_SHARE):
+        self.size = size
+        # 计数图为8位，最多统计255张
+        self.samples = max(1, min(samples, 255))
+        self.ink_share = ink_share
+        self.count = 0
+        self.mask: Optional[Image.Image] = None
+        self._counts: Optional[Image.Image] = Image.new("L", size, 0)
+
+    @property
+    def ready(self) -> bool:
+        return self.mask is not None
+
+    def add(self, mask: Image.Image):
+        if self.ready:
+            return
+        self._counts = ImageChops.add(self._counts, mask.point(lambda value: 1 if value else 0))
+        self.count += 1
+        if self.count >= self.samples:
+            threshold = max(1, math.ceil(self.samples * self.ink_share))
+            self.mask = self._counts.point(lambda value: 255 if value >= threshold else 0).filter(ImageFilter.MaxFilter(3))
+            self._counts = None
+
+    def handwriting(self, mask: Image.Image) -> Image.Image:
+        """去除印刷内容，只留笔迹"""
+        return ImageChops.subtract(mask, self.mask)
+
+
+def sheet_features(handwriting: Image.Image, hash_size: int = SHEET_HASH_SIZE) -> SheetFeatures:
+    """
+    计算笔迹比例、差值哈希与笔迹位图
+
+    哈希只取笔迹所在的外接矩形，使笔迹铺满哈希网格；哈希只用于查找候选，
+    是否近似由缩小后的笔迹位图逐像素核对决定。
+    """
+    ink_ratio = handwriting.histogram()[255] / (handwriting.width * handwriting.height)
+
+    box = handwriting.getbbox()
+    hashed = handwriting.crop(box) if box is not None else handwriting
+    small = hashed.resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    dhash = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            dhash = (dhash << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+
+    bitmap = handwriting
+    if max(bitmap.size) > _BITMAP_MAX_SIDE:
+        scale = _BITMAP_MAX_SIDE / max(bitmap.size)
+        bitmap = bitmap.resize(
+            (max(1, round(bitmap.width * scale)), max(1, round(bitmap.height * scale))), Image.BOX
+        )
+    bitmap = bitmap.point(lambda value: 255 if value >= 64 else 0)
+    return SheetFeatures(
+        ink_ratio=ink_ratio,
+        dhash=dhash,
+        bitmap=bitmap.convert("1").tobytes(),
+        bitmap_ink=bitmap.histogram()[255],
+    )
+
+
+def bitmap_difference(first: bytes, second: bytes) -> int:
+    """两张同尺寸笔迹位图中不同的像素数"""
+    return bin(int.from_bytes(first, "big") ^ int.from_bytes(second, "big")).count("1")
+
+
+class SheetStats:
+    """累计的快速分类统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked = 0
+            self.learning = 0  # 学习印刷内容期间未分类的答题卡
+            self.blank = 0
+            self.duplicate = 0
+            self.ink_ratios: List[float] = []
+
+    def record(self, match: SheetMatch, learning: bool = False):
+        with self._lock:
+            self.checked += 1
+            if learning:
+                self.learning += 1
+            if match.kind == BLANK:
+                self.blank += 1
+            elif match.kind == DUPLICATE:
+                self.duplicate += 1
+            if match.features is not None and len(self.ink_ratios) < _INK_SAMPLES:
+                self.ink_ratios.append(match.features.ink_ratio)
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            ratios = sorted(self.ink_ratios)
+            hits = self.blank + self.duplicate
+
+            def quantile(q: float) -> float:
+                return ratios[int((len(ratios) - 1) * q)] if ratios else 0.0
+
+            return {
+                "checked": self.checked,
+                "learning": self.learning,
+                "blank": self.blank,
+                "duplicate": self.duplicate,
+                "hit_rate": hits / self.checked if self.checked else 0.0,
+                "ink_ratio_p05": quantile(0.05),
+                "ink_ratio_p50": quantile(0.50),
+            }
+
+    def describe(self) -> str:
+        summary = self.summary()
+        return (
+            f"检查 {summary['checked']} 份（其中学习印刷内容 {summary['learning']} 份），"
+            f"空白 {summary['blank']} 份，近似复用 {summary['duplicate']} 份"
+            f"（命中率 {summary['hit_rate']:.1%}），笔迹比例 p5 {summary['ink_ratio_p05']:.4f} / "
+            f"p50 {summary['ink_ratio_p50']:.4f}"
+        )
+
+
+sheet_stats = SheetStats()
+
+
+class SheetClassifier:
+    """
+    调用模型前的快速分类
+
+    每组题目先用前template_samples张答题卡学习印刷内容，之后只看去除印刷内容后的笔迹：
+    笔迹比例低于blank_ink_ratio的答题卡判为空白；笔迹的差值哈希与已识别的答题卡相似度不低于
+    duplicate_similarity、且缩小后的笔迹位图不同的像素不超过笔迹像素的duplicate_max_diff时复用其识别结果。
+    近似查找用分段索引：汉明距离不超过d时，把哈希分成d+1段必有一段完全相同，
+    只需比较至少一段相同的候选。
+    """
+
+    def __init__(
+        self,
+        blank_ink_ratio: float = SHEET_BLANK_INK_RATIO,
+        reuse_duplicates: bool = SHEET_DUPLICATE_ENABLED,
+        duplicate_similarity: float = SHEET_DUPLICATE_SIMILARITY,
+        duplicate_max_diff: float = SHEET_DUPLICATE_MAX_DIFF,
+        hash_size: int = SHEET_HASH_SIZE,
+        max_entries: int = SHEET_INDEX_MAX_ENTRIES,
+        template_samples: int = SHEET_TEMPLATE_SAMPLES,
+        template_ink_share: float = SHEET_TEMPLATE_INK_SHARE
+    ):
+        self.blank_ink_ratio = blank_ink_ratio
+        self.reuse_duplicates = reuse_duplicates
+        self.duplicate_similarity = duplicate_similarity
+        self.duplicate_max_diff = duplicate_max_diff
+        self.hash_size = hash_size
+        self.max_entries = max_entries
+        self.template_samples = template_samples
+        self.template_ink_share = template_ink_share
+        self.bits = hash_size * hash_size
+        self.max_distance = int((1 - duplicate_similarity) * self.bits)
+        bands = min(self.max_distance + 1, self.bits)
+        width = self.bits // bands
+        # (起始位, 位数)，最后一段包含余数
+        self._bands: List[Tuple[int, int]] = [
+            (index * width, width if index < bands - 1 else self.bits - index * width)
+            for index in range(bands)
+        ]
+        self._lock = threading.Lock()
+        self._templates: Dict[str, SheetTemplate] = {}
+        self._entries: "OrderedDict[int, Tuple[str, SheetFeatures, List[StudentAnswer]]]" = OrderedDict()
+        self._index: Dict[Tuple[str, int, int], Set[int]] = {}
+        self._next_id = 0
+
+    def _band_keys(self, context: str, dhash: int) -> List[Tuple[str, int, int]]:
+        return [
+            (context, index, (dhash >> start) & ((1 << width) - 1))
+            for index, (start, width) in enumerate(self._bands)
+        ]
+
+    def classify(
+        self,
+        image: Union[str, bytes],
+        context: str,
+        pos: Optional[List[Dict]] = None
+    ) -> SheetMatch:
+        """
+        分类一张答题卡
+
+        context区分不同的题目组合，每个context单独学习印刷内容，只在同一context内复用识别结果。
+        图片无法解码或印刷内容尚未学好时不分类。
+        """
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                image = f.read()
+        try:
+            with self._lock:
+                template = self._templates.get(context)
+            mask = ink_mask(image, pos, template.size if template is not None else None)
+            with self._lock:
+                template = self._templates.setdefault(
+                    context, SheetTemplate(mask.size, self.template_samples, self.template_ink_share)
+                )
+            if mask.size != template.size:
+                mask = mask.resize(template.size)
+            with self._lock:
+                if not template.ready:
+                    template.add(mask)
+                    learning = True
+                else:
+                    learning = False
+            if learning:
+                match = SheetMatch()
+                sheet_stats.record(match, learning=True)
+                return match
+            features = sheet_features(template.handwriting(mask), self.hash_size)
+        except Exception as e:
+            detail(f"答题卡快速分类失败: {str(e)}")
+            match = SheetMatch()
+            sheet_stats.record(match)
+            return match
+
+        match = SheetMatch(features=features)
+        if features.ink_ratio < self.blank_ink_ratio:
+            match.kind = BLANK
+        elif self.reuse_duplicates:
+            best = self._nearest(context, features)
+            if best is not None:
+                distance, answers = best
+                match.kind = DUPLICATE
+                # 复用的结果标记出来，由分流送人工复核
+                match.answers = [answer.model_copy(update={"is_reused": True}) for answer in answers]
+                match.similarity = 1 - distance / self.bits
+        sheet_stats.record(match)
+        return match
+
+    def _nearest(self, context: str, features: SheetFeatures) -> Optional[Tuple[int, List[StudentAnswer]]]:
+        with self._lock:
+            candidates: Set[int] = set()
+            for key in self._band_keys(context, features.dhash):
+                candidates.update(self._index.get(key, ()))
+            best = None
+            for entry_id in candidates:
+                _, other, answers = self._entries[entry_id]
+                distance = bin(features.dhash ^ other.dhash).count("1")
+                if distance > self.max_distance or (best is not None and distance >= best[0]):
+                    continue
+                # 哈希只反映笔迹的大致分布，改动一个答案时仍可能很接近，逐像素核对笔迹
+                allowed = self.duplicate_max_diff * max(features.bitmap_ink, other.bitmap_ink)
+                if bitmap_difference(features.bitmap, other.bitmap) <= allowed:
+                    best = (distance, answers)
+            return best
+
+    def remember(self, features: SheetFeatures, context: str, answers: List[StudentAnswer]):
+        """记录一张已识别答题卡的结果，超过容量时淘汰最早的记录"""
+        if not self.reuse_duplicates or not answers:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (context, features, list(answers))
+            for key in self._band_keys(context, features.dhash):
+                self._index.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                old_id, (old_context, old_features, _) = self._entries.popitem(last=False)
+                for key in self._band_keys(old_context, old_features.dhash):
+                    ids = self._index.get(key)
+                    if ids is not None:
+                        ids.discard(old_id)
+                        if not ids:
+                            del self._index[key]
+
+
+_sheet_classifier: Optional[SheetClassifier] = None
+_sheet_classifier_lock = threading.Lock()
+
+
+def get_sheet_classifier() -> Optional[SheetClassifier]:
+    """获取进程内共享的快速分类器，未开启时返回None"""
+    global _sheet_classifier
+    if not SHEET_CLASSIFIER_ENABLED:
+        return None
+    with _sheet_classifier_lock:
+        if _sheet_classifier is None:
+            _sheet_classifier = SheetClassifier()
+    return _sheet_classifier
@@ -0,0 +1,144 @@
+import json
+import re
+from typing import Iterable, List, Optional, Set, Tuple
+
+from answer_rules import BlankKey
+from models import StudentAnswer
+
+_PART_NUMBER = re.compile(r'"part_number"\s*:\s*"?(\d+)')
+_QUESTION_NUMBER = re.compile(r'"question_number"\s*:\s*"?(\d+)')
+_ANSWERS_KEY = re.compile(r'"answers"\s*:\s*$')
+_PARTS_KEY = re.compile(r'"parts"\s*:\s*$')
+
+
+class StreamingAnswerParser:
+    """
+    增量解析模型返回的识别结果
+
+    逐段喂入模型输出的文本，每当一个空的答案对象（answers数组中的{...}）闭合，
+    就根据外层对象中已出现的part_number、question_number转换为StudentAnswer。
+    不要求整段文本是合法JSON：输出被截断或格式损坏时，已闭合的答案仍然可用。
+
+    只识别一道题时题号以传入的为准；识别多道题时读取外层的question_number，
+    不在question_numbers中的题目忽略。expected_blanks中的空全部识别出后complete为True，
+    调用方可以据此提前结束读取。
+    """
+
+    def __init__(self, question_numbers: List[int], expected_blanks: Optional[Iterable[BlankKey]] = None):
+        self.question_numbers = list(question_numbers)
+        self.expected_blanks: Set[BlankKey] = {
+            key for key in expected_blanks or () if key[0] in self.question_numbers
+        }
+        self.reset()
+
+    def reset(self):
+        """丢弃已解析的内容，用于重试"""
+        self.text = ""
+        self.aborted = False  # 读取方是否已提前断开
+        self.answers: List[StudentAnswer] = []
+        self._seen: Set[BlankKey] = set()
+        self._stack: List[Tuple[str, int]] = []  # (括号, 在text中的位置)
+        self._position = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def complete(self) -> bool:
+        """期望的空是否都已识别出"""
+        return bool(self.expected_blanks) and self.expected_blanks <= self._seen
+
+    def feed(self, chunk: str) -> List[StudentAnswer]:
+        """喂入一段文本，返回本段新解析出的答案"""
+        self.text += chunk
+        new_answers = []
+        text = self.text
+        for index in range(self._position, len(text)):
+            char = text[index]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # 第一个{之前的内容（如```json）不当作JSON处理
+                self._in_string = bool(self._stack)
+            elif char in "{[":
+                self._stack.append((char, index))
+            elif char in "}]" and self._stack:
+                bracket, start = self._stack.pop()
+                if char == "}" and bracket == "{":
+                    answer = self._close_object(start, index)
+                    if answer is not None:
+                        new_answers.append(answer)
+        self._position = len(text)
+        return new_answers
+
+    def _close_object(self, start: int, end: int) -> Optional[StudentAnswer]:
+        """一个对象闭合时，若它是answers数组中的元素则转换为StudentAnswer"""
+        # 栈顶应为: ... 题目{ parts[ 小题{ answers[
+        if len(self._stack) < 2:
+            return None
+        answers_bracket, answers_start = self._stack[-1]
+        part_bracket, part_start = self._stack[-2]
+        if answers_bracket != "[" or part_bracket != "{":
+            return None
+        if not _ANSWERS_KEY.search(self.text[part_start:answers_start]):
+            return None
+
+        part_match = _PART_NUMBER.search(self.text[part_start:answers_start])
+        if part_match is None:
+            # part_number写在answers之后时无法增量解析，留给读取完成后的整体解析
+            return None
+        question_number = self._question_number()
+        if question_number is None:
+            return None
+
+        try:
+            data = json.loads(self.text[start:end + 1])
+            answer = StudentAnswer(
+                question_number=question_number,
+                part_number=int(part_match.group(1)),
+                blank_number=data.get("blank_number", 1),
+                content=data.get("content", ""),
+                confidence=data.get("confidence", 0.0),
+                is_crossed_out=data.get("is_crossed_out", False),
+                is_blurry=data.get("is_blurry", True)
+            )
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+        key = (answer.question_number, answer.part_number, answer.blank_number)
+        if key in self._seen:
+            return None
+        self._seen.add(key)
+        self.answers.append(answer)
+        return answer
+
+    def _question_number(self) -> Optional[int]:
+        """当前小题所属的题号"""
+        if len(self.question_numbers) == 1:
+            return self.question_numbers[0]
+        # 栈: ... 题目{ parts[ 小题{ answers[
+        if len(self._stack) < 4:
+            return None
+        question_bracket, question_start = self._stack[-4]
+        parts_bracket, parts_start = self._stack[-3]
+        if question_bracket != "{" or parts_bracket != "[":
+            return None
+        prefix = self.text[question_start:parts_start]
+        if not _PARTS_KEY.search(prefix):
+            return None
+        match = _QUESTION_NUMBER.search(prefix)
+        if match is None:
+            return None
+        number = int(match.group(1))
+        return number if number in self.question_numbers else None
+
+    @classmethod
+    def parse_text(cls, text: str, question_numbers: List[int]) -> List[StudentAnswer]:
+        """从完整（可能已损坏）的文本中尽量解析出答案"""
+        parser = cls(question_numbers)
+        parser.feed(text or "")
+        return parser.answers
@@ -0,0 +1,293 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from api_client import ScoringTask
+from config import (
+    COORDINATOR_QUEUE_PATH,
+    COORDINATOR_LEASE_SECONDS,
+    COORDINATOR_MAX_ATTEMPTS,
+)
+
+# 任务状态：待领取 -> 已领取 -> 已评分 -> 已提交；存疑的试卷为送复核；超过最大次数后为失败
+PENDING = "pending"
+LEASED = "leased"
+SCORED = "scored"
+SUBMITTED = "submitted"
+REVIEW = "review"
+FAILED = "failed"
+
+
+class BlockConfig(BaseModel):
+    """一个阅卷块（subject_id/block_id）及其标准答案与题号"""
+    subject_id: str
+    block_id: str
+    standard_answer: str  # 标准答案文件路径
+    question_numbers: List[int]
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.subject_id, self.block_id
+
+
+def load_blocks(path: str) -> List[BlockConfig]:
+    """读取阅卷块配置，文件内容为BlockConfig的JSON数组"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [BlockConfig(**item) for item in json.load(f)]
+
+
+class QueuedTask(BaseModel):
+    """队列中的一份试卷"""
+    task_key: str
+    subject_id: str
+    block_id: str
+    task: ScoringTask
+    attempts: int = 0
+
+
+class WorkQueue:
+    """
+    基于SQLite的工作队列
+
+    以task_key为主键去重，平台重复下发的试卷不会重复入队；
+    领取时写入租约，持有者崩溃或超时后任务自动回到可领取状态。
+    所有状态变更都在IMMEDIATE事务中完成，同一主机上的多个进程可以共用一个队列文件。
+    """
+
+    def __init__(
+        self,
+        path: str = COORDINATOR_QUEUE_PATH,
+        lease_seconds: float = COORDINATOR_LEASE_SECONDS,
+        max_attempts: int = COORDINATOR_MAX_ATTEMPTS
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_key TEXT PRIMARY KEY,
+                subject_id TEXT NOT NULL,
+                block_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, lease_expires)"
+        )
+
+    def _transaction(self):
+        """写事务：立即加写锁，避免多个进程同时领取同一任务"""
+        return _ImmediateTransaction(self._conn, self._lock)
+
+    def enqueue(self, subject_id: str, block_id: str, tasks: List[ScoringTask]) -> int:
+        """加入新任务，已存在的task_key忽略，返回新加入的数量"""
+        now = time.time()
+        added = 0
+        with self._transaction():
+            for task in tasks:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO tasks "
+                    "(task_key, subject_id, block_id, payload, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        task.task_key,
+                        subject_id,
+                        block_id,
+                        task.model_dump_json(by_alias=True),
+                        PENDING,
+                        now,
+                        now,
+                    ),
+                )
+                added += cursor.rowcount
+        return added
+
+    def lease(self, owner: str, count: int = 1) -> List[QueuedTask]:
+        """领取待处理或租约已过期的任务"""
+        now = time.time()
+        with self._transaction():
+            # 用完次数且租约已过期的任务不再分配
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, error = COALESCE(error, '租约过期'), updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            rows = self._conn.execute(
+                "SELECT task_key, subject_id, block_id, payload, attempts FROM tasks "
+                "WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND attempts < ? "
+                "ORDER BY created_at LIMIT ?",
+                (PENDING, LEASED, now, self.max_attempts, count),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE tasks SET status = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE task_key = ?",
+                [(LEASED, owner, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+        return [
+            QueuedTask(
+                task_key=task_key,
+                subject_id=subject_id,
+                block_id=block_id,
+                task=ScoringTask.model_validate_json(payload),
+                attempts=attempts + 1,
+            )
+            for task_key, subject_id, block_id, payload, attempts in rows
+        ]
+
+    def complete(self, task_key: str, result: Dict, status: str = SCORED) -> bool:
+        """
+        保存评分结果，status为SCORED时等待提交，为REVIEW时等待人工复核
+
+        同一份试卷只接受第一个结果；租约过期后被重新领取时，
+        先完成的一方生效，后到的结果返回False并被忽略。
+        """
+        now = time.time()
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, lease_owner = NULL, lease_expires = 0, "
+                "error = NULL, updated_at = ? WHERE task_key = ? AND status IN (?, ?)",
+                (status, json.dumps(result, ensure_ascii=False), now, task_key, PENDING, LEASED),
+            )
+        return cursor.rowcount > 0
+
+    def fail(self, task_key: str, owner: str, error: str) -> bool:
+        """报告处理失败：未超过最大次数时回到待领取状态，否则标记为失败"""
+        now = time.time()
+        with self._transaction():
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                "lease_owner = NULL, lease_expires = 0, error = ?, updated_at = ? "
+                "WHERE task_key = ? AND status = ? AND lease_owner = ?",
+                (self.max_attempts, PENDING, FAILED, error, now, task_key, LEASED, owner),
+            )
+        return cursor.rowcount > 0
+
+    def take_scored(self, owner: str, count: int = 1) -> List[Tuple[QueuedTask, Dict]]:
+        """领取待提交的评分结果，提交期间同样持有租约"""
+        now = time.time()
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT task_key, subject_id, block_id, payload, attempts, result FROM tasks "
+                "WHERE status = ? AND lease_expires < ? ORDER BY updated_at LIMIT ?",
+                (SCORED, now, count),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE tasks SET lease_owner = ?, lease_expires = ?, updated_at = ? WHERE task_key = ?",
+                [(owner, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+        return [
+            (
+                QueuedTask(
+                    task_key=task_key,
+                    subject_id=subject_id,
+                    block_id=block_id,
+                    task=ScoringTask.model_validate_json(payload),
+                    attempts=attempts,
+                ),
+                json.loads(result),
+            )
+            for task_key, subject_id, block_id, payload, attempts, result in rows
+        ]
+
+    def mark_submitted(self, task_key: str):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, updated_at = ? WHERE task_key = ?",
+                (SUBMITTED, time.time(), task_key),
+            )
+
+    def mark_review(self, task_key: str, error: str):
+        """提交结果未知（平台可能已记录）：不再自动提交，转为人工复核"""
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = 0, error = ?, updated_at = ? "
+                "WHERE task_key = ? AND status = ?",
+                (REVIEW, error, time.time(), task_key, SCORED),
+            )
+
+    def retry_submit(self, task_key: str, error: str, delay: float):
+        """提交失败：保留评分结果，delay秒后再次提交"""
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE tasks SET lease_owner = NULL, lease_expires = ?, error = ?, updated_at = ? "
+                "WHERE task_key = ? AND status = ?",
+                (time.time() + delay, error, time.time(), task_key, SCORED),
+            )
+
+    def get(self, task_key: str) -> Optional[QueuedTask]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_key, subject_id, block_id, payload, attempts FROM tasks WHERE task_key = ?",
+                (task_key,),
+            ).fetchone()
+        if row is None:
+            return None
+        task_key, subject_id, block_id, payload, attempts = row
+        return QueuedTask(
+            task_key=task_key,
+            subject_id=subject_id,
+            block_id=block_id,
+            task=ScoringTask.model_validate_json(payload),
+            attempts=attempts,
+        )
+
+    def counts(self, subject_id: Optional[str] = None, block_id: Optional[str] = None) -> Dict[str, int]:
+        """按状态统计任务数，可限定阅卷块"""
+        query = "SELECT status, COUNT(*) FROM tasks"
+        params: Tuple = ()
+        if subject_id is not None:
+            query += " WHERE subject_id = ? AND block_id = ?"
+            params = (subject_id, block_id)
+        with self._lock:
+            rows = self._conn.execute(query + " GROUP BY status", params).fetchall()
+        counts = {status: 0 for status in (PENDING, LEASED, SCORED, SUBMITTED, REVIEW, FAILED)}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        self._conn.close()
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT，异常时回滚"""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, exc_type, *exc_info):
+        try:
+            self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
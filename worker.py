@@ -0,0 +1,188 @@
+"""
+分布式阅卷的阅卷进程
+
+从协调进程领取试卷，下载、识别、评分后把结果交回协调进程，由协调进程统一提交。
+可在多台主机上各启动若干个进程，吞吐随进程数水平扩展。
+
+用法：
+    python worker.py --coordinator http://127.0.0.1:8765 --blocks data/blocks.json --threads 4
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from rich.console import Console
+
+from answer_checker import AnswerChecker
+from config import WORKER_THREADS, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from main import (
+    load_standard_answer,
+    fetch_image,
+    process_answer_sheet,
+    convert_to_api_scores,
+    display_stage_metrics,
+)
+from metrics import current_paper, get_metrics
+from routing import REVIEW, RoutingPolicy
+from work_queue import BlockConfig, QueuedTask, load_blocks
+
+console = Console()
+
+
+class GradingWorker:
+    """阅卷进程：多个线程各自领取一份试卷处理，处理完再领下一份"""
+
+    def __init__(
+        self,
+        coordinator_url: str,
+        blocks: List[BlockConfig],
+        threads: int = WORKER_THREADS,
+        worker_id: Optional[str] = None
+    ):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.threads = threads
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # 每个阅卷块的评分器与题号，启动时编译一次
+        self.blocks: Dict[Tuple[str, str], Tuple[AnswerChecker, List[int]]] = {
+            block.key: (AnswerChecker(load_standard_answer(block.standard_answer)), block.question_numbers)
+            for block in blocks
+        }
+        self.routing_policy = RoutingPolicy()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=threads, pool_maxsize=threads)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        response = self.session.post(
+            f"{self.coordinator_url}{path}",
+            json={"worker_id": self.worker_id, **payload},
+            timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def grade(self, queued: QueuedTask) -> Dict:
+        """处理一份试卷，返回交给协调进程的评分结果"""
+        block = self.blocks.get((queued.subject_id, queued.block_id))
+        if block is None:
+            raise ValueError(f"未配置阅卷块 {queued.subject_id}/{queued.block_id}")
+        checker, question_numbers = block
+        task = queued.task
+
+        image = fetch_image(task.block_img, task.kaohao)
+        student_answers = process_answer_sheet(
+            image,
+            question_numbers,
+            pos=task.pos,
+            expected_blanks=checker.rules.expected_blanks(question_numbers)
+        )
+        if student_answers is None:
+            raise ValueError("未能识别到任何答案")
+        with get_metrics().stage("score"):
+            scoring_result = checker.check_answer(student_answers)
+        decision = self.routing_policy.decide(student_answers, scoring_result)
+        api_scores = convert_to_api_scores(scoring_result, question_numbers)
+        # 识别结果随评分结果交给协调进程，提交成功或送复核后由协调进程写入识别结果存储
+        return {
+            "score": scoring_result.total_score,
+            "api_scores": api_scores,
+            "route": decision.route,
+            "decision": decision.model_dump(),
+            "result": scoring_result.model_dump(),
+            "answers": [answer.model_dump() for answer in student_answers],
+        }
+
+    def _run_thread(self):
+        while not self._stop.is_set():
+            try:
+                response = self._post("/lease", {"count": 1})
+            except Exception as e:
+                console.print(f"[red]连接协调进程失败: {str(e)}[/red]")
+                self._stop.wait(2)
+                continue
+            if response.get("finished"):
+                break
+            tasks = [QueuedTask(**task) for task in response.get("tasks", [])]
+            if not tasks:
+                self._stop.wait(1)
+                continue
+
+            for queued in tasks:
+                current_paper.set(queued.task_key)
+                try:
+                    result = self.grade(queued)
+                except Exception as e:
+                    console.print(f"[red]试卷 {queued.task.kaohao}: {str(e)}[/red]")
+                    with self._stats_lock:
+                        self.failed += 1
+                    try:
+                        self._post("/fail", {"task_key": queued.task_key, "error": str(e)})
+                    except Exception:
+                        pass  # 租约到期后协调进程会重新分配
+                    continue
+
+                try:
+                    accepted = self._post(
+                        "/complete", {"task_key": queued.task_key, "result": result}
+                    )["accepted"]
+                except Exception as e:
+                    console.print(f"[red]交回试卷 {queued.task.kaohao} 的结果失败: {str(e)}[/red]")
+                    continue
+                with self._stats_lock:
+                    if accepted:
+                        self.processed += 1
+                    else:
+                        self.rejected += 1
+                route = "送人工复核" if result["route"] == REVIEW else "自动提交"
+                console.print(
+                    f"[green]试卷 {queued.task.kaohao} 评分完成，得分: {result['score']}，{route}"
+                    f"{'' if accepted else '（已由其他进程完成，结果忽略）'}[/green]"
+                )
+
+    def run(self):
+        """运行到协调进程通知全部完成"""
+        started_at = time.time()
+        threads = [threading.Thread(target=self._run_thread, daemon=True) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self._stop.set()
+            console.print("[yellow]已中断，已领取未完成的试卷将在租约到期后重新分配[/yellow]")
+        elapsed = time.time() - started_at
+        console.print(
+            f"\n[bold cyan]阅卷进程 {self.worker_id} 结束：完成 {self.processed} 份，"
+            f"失败 {self.failed} 份，重复 {self.rejected} 份，"
+            f"速度 {self.processed * 60 / elapsed if elapsed > 0 else 0:.1f} 份/分钟[/bold cyan]"
+        )
+        display_stage_metrics()
+        self.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式阅卷的阅卷进程")
+    parser.add_argument("--coordinator", required=True, help="协调进程地址，如http://127.0.0.1:8765")
+    parser.add_argument("--blocks", required=True, help="阅卷块配置文件，与协调进程相同")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    parser.add_argument("--worker-id", help="阅卷进程标识，默认为主机名-进程号")
+    args = parser.parse_args()
+
+    GradingWorker(args.coordinator, load_blocks(args.blocks), args.threads, args.worker_id).run()
+
+
+if __name__ == "__main__":
+    main()